@@ -1,18 +1,22 @@
 # app.py
 import streamlit as st
 import pandas as pd
-import re, json
 import plotly.graph_objects as go
 
-from core.intent import detect_intent
-from core.userInfo import extract_user_profile
+from core.intent_router import TurnRoute, route_query
+from core.profile_memory import cached_allocation_for, profile_hash, update_profile
 from core.portfolio import allocate_portfolio
 from core.sentiment_adjust import adjust_portfolio
-from core.response import generate_final_response
-from core.decide_and_execute import decide_and_execute
+from core.response import stream_final_response
+from core.sentiment_adjust import AdjustmentResult
+from core.llm import stream_text
 from core.stocks import recommend_stocks
 from core.company_stock import fetch_company_stock, predict_future_stock
 from core.response_llm import generate_financial_advice
+from core.prompt_budget import compact_history
+from core.intent import IntentSchema
+from core.userInfo import UserProfile
+from core.pipeline import Stage, run_pipeline
 
 
 # --------------------------
@@ -20,37 +24,111 @@ from core.response_llm import generate_financial_advice
 # --------------------------
 def init_session_state():
     if "chats" not in st.session_state:
-        st.session_state.chats = {}  # {chat_id: {"history": [], "portfolio_results": None, "summary": ""}}
+        st.session_state.chats = {}  # {chat_id: {"history": [], "profile": None, "portfolio_results": None, "summary": ""}}
     if "current_chat" not in st.session_state:
         st.session_state.current_chat = "Chat 1"
-        st.session_state.chats["Chat 1"] = {"history": [], "portfolio_results": None, "summary": ""}
+        st.session_state.chats["Chat 1"] = {"history": [], "profile": None, "portfolio_results": None, "summary": ""}
 
 
 def new_chat():
     chat_id = f"Chat {len(st.session_state.chats) + 1}"
-    st.session_state.chats[chat_id] = {"history": [], "portfolio_results": None, "summary": ""}
+    st.session_state.chats[chat_id] = {"history": [], "profile": None, "portfolio_results": None, "summary": ""}
     st.session_state.current_chat = chat_id
 
 
-def run_portfolio_allocation(intent_obj, profile, chat_id):
-    """ Portfolio allocation workflow (runs once per chat, then cached) """
-    if st.session_state.chats[chat_id]["portfolio_results"]:
-        return st.session_state.chats[chat_id]["portfolio_results"]
-
+def compute_portfolio_allocation(profile):
+    """
+    Portfolio allocation workflow (pure; safe to run on a worker thread).
+    The advisor write-up ("final_text") is streamed later by the UI, only when shown.
+    """
     base_alloc = allocate_portfolio(profile)
     result = adjust_portfolio(profile, base_alloc)
     adjusted_dict = result.adjusted_allocation
-    final_text = generate_final_response(profile, base_alloc, result)
 
-    results = {
+    return {
         "profile": profile.model_dump(),
+        "profile_hash": profile_hash(profile),
         "base_allocation": base_alloc,
         "adjusted_allocation": adjusted_dict,
-        "final_text": final_text,
+        "final_text": None,
         "adjust_result": result.model_dump(),
     }
-    st.session_state.chats[chat_id]["portfolio_results"] = results
-    return results
+
+
+def stream_allocation_text(results):
+    """ Token stream of the advisor write-up for a compute_portfolio_allocation result """
+    return stream_final_response(
+        UserProfile(**results["profile"]),
+        results["base_allocation"],
+        AdjustmentResult(**results["adjust_result"]),
+    )
+
+
+ADVICE_SECTIONS = {
+    "decision_validation": ("✅ Decision Validation", False),
+    "trustworthiness": ("🔒 Trustworthiness", False),
+    "investment_plan": ("📈 Investment Plan", True),
+    "risk_analysis": ("⚠️ Risk Analysis", False),
+    "expected_returns": ("💰 Expected Returns", False),
+    "step_by_step": ("📝 Step-by-Step Plan", True),
+    "sources": ("📚 Sources & References", False),
+}
+
+
+def render_advice_field(name, value):
+    """ Render one advice field as soon as the streamed JSON completes it """
+    if name == "summary":
+        st.markdown(value)
+    elif name in ADVICE_SECTIONS:
+        label, expanded = ADVICE_SECTIONS[name]
+        with st.expander(label, expanded=expanded):
+            if isinstance(value, list):
+                for item in value:
+                    st.markdown(f"- {item}")
+            else:
+                st.markdown(value)
+
+
+# --------------------------
+# Turn Pipeline (concurrent stages)
+# --------------------------
+STAGE_TIMEOUTS = {"route": 45, "profile": 30, "allocation": 90, "company_stock": 45, "recommended": 60, "monte_carlo": 30}
+TURN_TIMEOUT = 180
+ALLOCATION_INTENTS = ("Portfolio_Allocation", "Investment_Prediction")
+
+
+def build_turn_pipeline(user_query, chat_profile, cached_allocation):
+    """
+    Chat turn as a DAG: routing (intent + company, one local classifier with an
+    LLM fallback) and profile run together, then allocation and the stock fetch,
+    then Monte Carlo. Streamlit session state is only touched by the caller, never by stages.
+    The profile stage merges this message's facts into the chat's profile; the
+    allocation is reused unless that merged profile changed.
+    """
+    return [
+        Stage("route", lambda: route_query(user_query), timeout=STAGE_TIMEOUTS["route"],
+              default=TurnRoute(intent=IntentSchema(intent="Knowledge", confidence=0.3, rationale="Intent detection timed out"),
+                                source="llm")),
+        Stage("intent", lambda route: route.intent, deps=["route"]),
+        Stage("profile", lambda: update_profile(chat_profile, user_query)[0], timeout=STAGE_TIMEOUTS["profile"],
+              default=chat_profile or UserProfile()),
+        Stage("allocation", lambda intent, profile: cached_allocation_for(profile, cached_allocation)
+              or compute_portfolio_allocation(profile),
+              deps=["intent", "profile"], timeout=STAGE_TIMEOUTS["allocation"],
+              when=lambda intent, profile: intent.intent in ALLOCATION_INTENTS),
+        Stage("company", lambda route: route.company(), deps=["route"],
+              when=lambda route: route.intent.intent == "Investment_Prediction",
+              default={"intent": "profile", "company_name": None}),
+        Stage("company_stock", lambda company: fetch_company_stock(company["company_name"]),
+              deps=["company"], timeout=STAGE_TIMEOUTS["company_stock"], default=None,
+              when=lambda company: bool(company) and company["intent"] != "profile" and bool(company.get("company_name"))),
+        Stage("recommended", lambda company, allocation: recommend_stocks(allocation["adjusted_allocation"]),
+              deps=["company", "allocation"], timeout=STAGE_TIMEOUTS["recommended"], default=None,
+              when=lambda company, allocation: bool(company) and company["intent"] == "profile"),
+        Stage("monte_carlo", lambda company_stock: predict_future_stock(company_stock, days=252, simulations=500),
+              deps=["company_stock"], timeout=STAGE_TIMEOUTS["monte_carlo"], default=None,
+              when=lambda company_stock: company_stock is not None),
+    ]
 
 
 def render_chat_ui():
@@ -202,121 +280,85 @@ if user_query := st.chat_input("Type your query..."):
 
     with st.chat_message("assistant"):
         with st.spinner("🔍 Thinking..."):
-            intent_obj = detect_intent(user_query)
-            profile = extract_user_profile(user_query)
-
-            if intent_obj.intent == "Portfolio_Allocation":
-                results = run_portfolio_allocation(intent_obj, profile, chat_id)
-                bot_reply = {"text": results["final_text"], **results}
-
-            elif intent_obj.intent == "Investment_Prediction":
-                results = run_portfolio_allocation(intent_obj, profile, chat_id)
-                adjusted_dict = results["adjusted_allocation"]
-
-                company = decide_and_execute(user_query)
-                if company["intent"] == "profile":
-                    stock_info = recommend_stocks(adjusted_dict)
-                    monte_carlo = None
-                else:
-                    if company.get("company_name"):  # ✅ ensure not None
-                        stock_info = fetch_company_stock(company["company_name"])
-                        monte_carlo = predict_future_stock(stock_info, days=252, simulations=500)
-                    else:
-                        stock_info = None
-                        monte_carlo = None
-
-                if stock_info:
-                    stock_data = stock_info.model_dump()
-
-                    bot_reply = {
-                        "text": f"Here’s my investment outlook for {stock_data.get('company_name','the company')}."
-                    }
-                history = st.session_state.chats[chat_id]["history"]
-                history_text = "\n".join([f"{m['role']}: {m['content']}" for m in history[-3:]])
-                final_advice = generate_financial_advice(
-                    user_query=f"{history_text}\nUser now asks: {user_query}",
-                    user_profile=profile,
-                    stock_data=stock_data if stock_info else None,
-                    monte_carlo=monte_carlo if stock_info else None,
-                    portfolio=adjusted_dict,
-                )
-                raw_response = final_advice.step_by_step[0] if final_advice.step_by_step else final_advice.summary
-
-                # 1. Extract JSON inside triple backticks
-                match = re.search(r"```json\n(.*?)```", raw_response, re.DOTALL)
-                if match:
-                    json_str = match.group(1).strip()
-                    try:
-                        parsed = json.loads(json_str)
-                    except json.JSONDecodeError:
-                        parsed = {}
-                else:
-                    parsed = {}
-
-                # 2. If JSON parsed, use structured fields; else fallback to summary
-                if parsed:
-                    bot_reply = {
-                        "text": parsed.get("summary", final_advice.summary),
-                        "decision_validation": parsed.get("decision_validation", final_advice.decision_validation),
-                        "trustworthiness": parsed.get("trustworthiness", final_advice.trustworthiness),
-                        "investment_plan": parsed.get("investment_plan", final_advice.investment_plan),
-                        "risk_analysis": parsed.get("risk_analysis", final_advice.risk_analysis),
-                        "expected_returns": parsed.get("expected_returns", final_advice.expected_returns),
-                        "step_by_step": parsed.get("step_by_step", final_advice.step_by_step),
-                        "sources": parsed.get("sources", final_advice.sources),
-                        
-                        "stock_data": stock_data if stock_info else None,
-                        "monte_carlo": monte_carlo if stock_info else None,
-                    }
-                else:
-                    bot_reply = {
-                        "text": final_advice.summary,
-                        "decision_validation": final_advice.decision_validation,
-                        "trustworthiness": final_advice.trustworthiness,
-                        "investment_plan": final_advice.investment_plan,
-                        "risk_analysis": final_advice.risk_analysis,
-                        "expected_returns": final_advice.expected_returns,
-                        "step_by_step": final_advice.step_by_step,
-                        "sources": final_advice.sources,
-                        "stock_data": stock_data if stock_info else None,
-                        "monte_carlo": monte_carlo if stock_info else None,
-                    }
-
-
-            elif intent_obj.intent == "General_Chat":
-                from core.llm import get_llm
-                llm = get_llm()
-                history = st.session_state.chats[chat_id]["history"]
-
-                messages = [{"role": "system", "content": "You are FinChat, a friendly and trustworthy financial mentor. Respond naturally in the same mood as the user."}]
-                messages += history[-5:]  # last 5 turns
-                messages.append({"role": "user", "content": user_query})
-                bot_resp = llm.invoke(messages)
-                bot_reply = bot_resp.content
-
-            elif intent_obj.intent == "Knowledge":
-                from vectorstores.faiss import rag_query
-                history = st.session_state.chats[chat_id]["history"]
-                history_text = "\n".join([f"{m['role']}: {m['content']}" for m in history[-3:]])
-                query_with_context = f"""
-                Conversation so far:
-                {history_text}
-
-                Now the user asks: {user_query}
-                """
-                result = rag_query(query_with_context)
-                bot_reply = result['answer']
+            chat_state = st.session_state.chats[chat_id]
+            chat_profile = UserProfile(**chat_state["profile"]) if chat_state.get("profile") else None
+            cached_allocation = chat_state["portfolio_results"]
+            turn = run_pipeline(build_turn_pipeline(user_query, chat_profile, cached_allocation), timeout=TURN_TIMEOUT)
+            for stage_name, err in turn.errors.items():
+                print(f"⚠️ Stage '{stage_name}' failed: {err}")
+
+            intent_obj = turn.get("intent")
+            profile = turn.get("profile")
+            chat_state["profile"] = profile.model_dump()
+            if turn.get("allocation") and turn.get("allocation") is not cached_allocation:
+                chat_state["portfolio_results"] = turn.get("allocation")
+
+        # Responses below are streamed into the page as they are generated
+        if intent_obj.intent in ALLOCATION_INTENTS and not turn.get("allocation"):
+            bot_reply = "⚠️ Could not compute a portfolio allocation right now. Please try again."
+            st.markdown(bot_reply)
+
+        elif intent_obj.intent == "Portfolio_Allocation":
+            results = turn.get("allocation")
+            if results.get("final_text"):
+                st.markdown(results["final_text"])
+            else:
+                results["final_text"] = st.write_stream(stream_allocation_text(results))
+            bot_reply = {"text": results["final_text"], **results}
 
+        elif intent_obj.intent == "Investment_Prediction":
+            results = turn.get("allocation")
+            adjusted_dict = results["adjusted_allocation"]
 
+            company = turn.get("company")
+            if company["intent"] == "profile":
+                stock_info = turn.get("recommended")
+                monte_carlo = None
             else:
-                bot_reply = f"⚠️ Intent '{intent_obj.intent}' not yet implemented."
+                stock_info = turn.get("company_stock")
+                monte_carlo = turn.get("monte_carlo")
+
+            stock_data = stock_info.model_dump() if stock_info else None
+            history = st.session_state.chats[chat_id]["history"]
+            final_advice = generate_financial_advice(
+                user_query=user_query,
+                user_profile=profile,
+                stock_data=stock_data,
+                monte_carlo=monte_carlo,
+                portfolio=adjusted_dict,
+                on_field=render_advice_field,
+                history=history[:-1],  # the current query is already passed as user_query
+            )
+            bot_reply = {
+                "text": final_advice.summary,
+                "decision_validation": final_advice.decision_validation,
+                "trustworthiness": final_advice.trustworthiness,
+                "investment_plan": final_advice.investment_plan,
+                "risk_analysis": final_advice.risk_analysis,
+                "expected_returns": final_advice.expected_returns,
+                "step_by_step": final_advice.step_by_step,
+                "sources": final_advice.sources,
+                "stock_data": stock_data,
+                "monte_carlo": monte_carlo if stock_info else None,
+            }
+
+        elif intent_obj.intent == "General_Chat":
+            history = st.session_state.chats[chat_id]["history"]
+
+            messages = [{"role": "system", "content": "You are FinChat, a friendly and trustworthy financial mentor. Respond naturally in the same mood as the user."}]
+            messages += history[-5:]  # last 5 turns
+            messages.append({"role": "user", "content": user_query})
+            bot_reply = st.write_stream(stream_text(messages, site="chat"))
+
+        elif intent_obj.intent == "Knowledge":
+            from vectorstores.faiss import rag_query_stream
+            history = st.session_state.chats[chat_id]["history"]
+            history_text = compact_history(history)
+            bot_reply = st.write_stream(rag_query_stream(user_query, history=history_text))
 
-            # Show live response
-            if isinstance(bot_reply, dict):
-                if "text" in bot_reply:
-                    st.markdown(bot_reply["text"])
-            else:
-                st.markdown(bot_reply)
+        else:
+            bot_reply = f"⚠️ Intent '{intent_obj.intent}' not yet implemented."
+            st.markdown(bot_reply)
 
     # Save assistant reply in history
     st.session_state.chats[chat_id]["history"].append({"role": "assistant", "content": bot_reply})
@@ -1,7 +1,9 @@
 from pydantic import BaseModel
 from typing import Optional, List
-from yahooquery import Ticker, search
-import yfinance as yf
+from yahooquery import Ticker
+from db.pricecache import get_close_history
+from core.ticker_resolver import resolve_ticker
+from core.singleflight import get_group
 import re
 import pandas as pd
 import numpy as np
@@ -41,15 +43,8 @@ def clean_input(user_input: str) -> str:
 
 
 def get_ticker_yahooquery(company_name: str) -> Optional[str]:
-    cleaned_name = clean_input(company_name)
-    results = search(cleaned_name)
-    quotes = results.get('quotes', [])
-    if not quotes:
-        return None
-    for q in quotes:
-        if q.get('quoteType') == 'EQUITY':
-            return q['symbol']
-    return quotes[0]['symbol']  # fallback
+    """Local symbol index / resolution cache first, yahooquery search only on a miss."""
+    return resolve_ticker(company_name)
 
 
 def fetch_company_stock(company_input: str) -> Optional[CompanyStockInfo]:
@@ -58,14 +53,19 @@ def fetch_company_stock(company_input: str) -> Optional[CompanyStockInfo]:
         print(f"Ticker not found for '{company_input}'")
         return None
 
+    # Concurrent sessions asking about the same ticker share one upstream fetch
+    info = get_group("stock").do(ticker_symbol.upper(), _fetch_stock_snapshot, ticker_symbol)
+    return info.model_copy(deep=True) if info else None
+
+
+def _fetch_stock_snapshot(ticker_symbol: str) -> Optional[CompanyStockInfo]:
     # Yahooquery for current data
     t = Ticker(ticker_symbol)
     try:
         price_data = t.price.get(ticker_symbol, {})
 
-        # YFinance for historical prices
-        yf_ticker = yf.Ticker(ticker_symbol)
-        hist = yf_ticker.history(period="1y")["Close"] if not yf_ticker.history(period="1y").empty else pd.Series()
+        # Historical prices from the local price cache (incremental yfinance refresh)
+        hist = get_close_history(ticker_symbol)
         historical_prices = hist.tolist() if len(hist) > 0 else None
 
         return CompanyStockInfo(
@@ -89,24 +89,69 @@ def fetch_company_stock(company_input: str) -> Optional[CompanyStockInfo]:
 # -------------------------
 # Monte Carlo Simulation
 # -------------------------
-def monte_carlo_simulation(S0, mu, sigma, days=252, simulations=1000):
+# Upper bound on the size of one block of random shocks when only terminal
+# prices are needed; larger runs are simulated chunk by chunk.
+MAX_CHUNK_BYTES = 64 * 1024 * 1024
+
+
+def _gbm_log_increments(rng: np.random.Generator, mu, sigma, steps: int, simulations: int, dtype=np.float64) -> np.ndarray:
+    """Draw a (steps, simulations) block of daily GBM log-returns in one call."""
+    dt = 1  # 1 day
+    log_inc = rng.standard_normal((steps, simulations), dtype=dtype)
+    log_inc *= sigma * np.sqrt(dt)
+    log_inc += (mu - 0.5 * sigma**2) * dt
+    return log_inc
+
+
+def monte_carlo_simulation(S0, mu, sigma, days=252, simulations=1000, seed=None, dtype=np.float64):
     """
     Simulate future stock prices using Geometric Brownian Motion.
+    Returns the full (days, simulations) price matrix; row 0 is S0.
     """
-    dt = 1  # 1 day
-    price_matrix = np.zeros((days, simulations))
-    
-    for sim in range(simulations):
-        prices = [S0]
-        for t in range(1, days):
-            St = prices[-1] * np.exp((mu - 0.5 * sigma**2) * dt + sigma * np.random.normal())
-            prices.append(St)
-        price_matrix[:, sim] = prices
-    
+    rng = np.random.default_rng(seed)
+    price_matrix = np.empty((days, simulations), dtype=dtype)
+    price_matrix[0] = S0
+
+    if days > 1:
+        log_paths = _gbm_log_increments(rng, mu, sigma, days - 1, simulations, dtype)
+        np.cumsum(log_paths, axis=0, out=log_paths)
+        np.exp(log_paths, out=log_paths)
+        log_paths *= S0
+        price_matrix[1:] = log_paths
+
     return price_matrix
 
 
-def predict_future_stock(stock_info: CompanyStockInfo, days: int = 252, simulations: int = 1000) -> Optional[StockPrediction]:
+def simulate_terminal_prices(S0, mu, sigma, days=252, simulations=1000, seed=None,
+                             dtype=np.float64, chunk_size: Optional[int] = None) -> np.ndarray:
+    """
+    Simulate only the final-day prices of the GBM paths in monte_carlo_simulation.
+    Paths are never materialized: each chunk of simulations draws its shocks,
+    sums the log-returns and keeps one terminal price per path, so memory stays
+    bounded by MAX_CHUNK_BYTES (or chunk_size) even for million-path runs.
+    """
+    rng = np.random.default_rng(seed)
+    steps = days - 1
+    terminal = np.empty(simulations, dtype=dtype)
+    if steps <= 0:
+        terminal.fill(S0)
+        return terminal
+
+    if chunk_size is None:
+        chunk_size = max(1, MAX_CHUNK_BYTES // (steps * np.dtype(dtype).itemsize))
+
+    for start in range(0, simulations, chunk_size):
+        n = min(chunk_size, simulations - start)
+        log_inc = _gbm_log_increments(rng, mu, sigma, steps, n, dtype)
+        np.exp(log_inc.sum(axis=0), out=terminal[start:start + n])
+
+    terminal *= S0
+    return terminal
+
+
+def predict_future_stock(stock_info: CompanyStockInfo, days: int = 252, simulations: int = 1000,
+                         seed: Optional[int] = None, dtype=np.float64,
+                         chunk_size: Optional[int] = None) -> Optional[StockPrediction]:
     if not stock_info.historical_prices or len(stock_info.historical_prices) < 2:
         return None
 
@@ -116,17 +161,17 @@ def predict_future_stock(stock_info: CompanyStockInfo, days: int = 252, simulati
     sigma = daily_returns.std()
     S0 = hist_series.iloc[-1]
 
-    simulated_prices = monte_carlo_simulation(S0, mu, sigma, days, simulations)
-    expected_price = simulated_prices[-1, :].mean()
-    lower_bound = np.percentile(simulated_prices[-1, :], 5)
-    upper_bound = np.percentile(simulated_prices[-1, :], 95)
+    terminal_prices = simulate_terminal_prices(S0, mu, sigma, days, simulations,
+                                               seed=seed, dtype=dtype, chunk_size=chunk_size)
+    expected_price = float(terminal_prices.mean(dtype=np.float64))
+    lower_bound, upper_bound = np.percentile(terminal_prices, [5, 95])
 
     return StockPrediction(
         ticker=stock_info.ticker,
         current_price=S0,
         expected_price=round(expected_price, 2),
-        lower_bound_5pct=round(lower_bound, 2),
-        upper_bound_95pct=round(upper_bound, 2)
+        lower_bound_5pct=round(float(lower_bound), 2),
+        upper_bound_95pct=round(float(upper_bound), 2)
     )
 
 
@@ -3,7 +3,7 @@ import json
 from core.llm import get_llm
 
 def decide_and_execute(user_query: str):
-    llm = get_llm()
+    llm = get_llm(site="company")
     classification_prompt = f"""
 You are a highly intelligent financial assistant.  
 Classify the user's intent and extract the company name if relevant.  
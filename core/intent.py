@@ -34,8 +34,7 @@ class IntentSchema(BaseModel):
 # -----------------------------
 # LLM Config (Gemini or Groq)
 # -----------------------------
-# Option A: Gemini via LangChain
-llm = get_llm()
+# Option A: shared client from core.llm (fetched per call so tests can inject a fake)
 parser = PydanticOutputParser(pydantic_object=IntentSchema)
 
 
@@ -90,7 +89,7 @@ def detect_intent(user_query: str) -> IntentSchema:
     ]
 
     try:
-        raw_response = llm.invoke(messages)
+        raw_response = get_llm(site="intent").invoke(messages)
         raw_text = raw_response.content.strip()
         # cleaned = extract_json(raw_text)
 
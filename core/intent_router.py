@@ -0,0 +1,411 @@
+# intent_router.py
+# Local first-stage classifier for a chat turn. Answers the intent AND the
+# profile-vs-company decision (previously detect_intent + decide_and_execute,
+# two LLM calls) in one step:
+#   1. keyword/regex rules for unambiguous messages ("hello", "what is SIP")
+#   2. a small linear model over hashed word/char n-grams (trained on core/data/intent_train.jsonl)
+#   3. the LLM classifiers, only when the local confidence is below FAST_INTENT_THRESHOLD
+#
+#   python -m core.intent_router            # accuracy / fallback rate on core/data/intent_eval.jsonl
+#   python -m core.intent_router --llm      # same, with the LLM fallback enabled
+
+import argparse
+import json
+import os
+import re
+import threading
+import time
+import zlib
+from pathlib import Path
+from typing import Dict, List, Literal, Optional, Tuple
+
+import numpy as np
+from pydantic import BaseModel
+
+from core.intent import IntentSchema, detect_intent
+from core.decide_and_execute import decide_and_execute
+from core.ticker_resolver import get_symbol_index, normalize_name
+
+DATA_DIR = Path(__file__).resolve().parent / "data"
+TRAIN_FILE = DATA_DIR / "intent_train.jsonl"
+EVAL_FILE = DATA_DIR / "intent_eval.jsonl"
+
+# Local answers at or above this confidence skip the LLM
+FAST_INTENT_THRESHOLD = float(os.getenv("FAST_INTENT_THRESHOLD", "0.75"))
+INTENTS = ("Portfolio_Allocation", "Investment_Prediction", "Knowledge", "General_Chat")
+
+
+# -----------------------------
+# Result schema
+# -----------------------------
+class TurnRoute(BaseModel):
+    intent: IntentSchema
+    target: Literal["profile", "company"] = "profile"
+    company_name: Optional[str] = None
+    source: Literal["rules", "model", "llm"]
+
+    def company(self) -> Dict[str, Optional[str]]:
+        """Same shape decide_and_execute returns."""
+        return {"intent": self.target, "company_name": self.company_name}
+
+
+# -----------------------------
+# Company mentions
+# -----------------------------
+# Listing aliases that are also everyday words; only picked up after a buy/invest cue
+AMBIGUOUS_ALIASES = {"target", "meta", "snap", "visa", "chase", "sol", "eth", "ether", "coke", "ford", "citi", "gm", "titan"}
+# Listed symbols that are also words or initials ("an MA", "BA degree"); symbols of two
+# characters or fewer count as ambiguous too. Taken as a company only when written "$GE".
+AMBIGUOUS_SYMBOLS = {"CAT", "ALL", "LOW", "NOW", "IT", "ON", "KEY", "ARE", "FUN", "BIG", "PLAY", "REAL"}
+# Confidence of a local route to a company that is not in the symbol listing
+# ("buy apartments"); below FAST_INTENT_THRESHOLD so the LLM decides
+UNVERIFIED_COMPANY_CONFIDENCE = 0.5
+# Cap for routes decided without a company while the text has a generic prediction cue
+GENERIC_CUE_CONFIDENCE = 0.5
+GENERIC_WORDS = {
+    "a", "an", "the", "my", "our", "your", "this", "that", "these", "those", "it", "its", "some", "any", "more",
+    "stock", "stocks", "share", "shares", "gold", "silver", "bond", "bonds", "crypto", "cryptocurrency", "mutual",
+    "index", "etf", "etfs", "fund", "funds", "sip", "sips", "fd", "fds", "real", "property", "house", "home", "land",
+    "equity", "equities", "debt", "market", "markets", "now", "today", "which", "what", "penny", "us", "indian",
+    "tech", "bank", "banks", "them", "new", "good", "best", "small", "large", "mid", "blue", "dividend", "growth",
+    "money", "savings", "cash", "insurance", "ppf", "nps", "elss", "and", "or", "to", "for", "in", "on", "of",
+}
+_CUE_BEFORE = re.compile(r"\b(?:invest(?:ing)?\s+in|buy(?:ing)?|sell(?:ing)?|shares\s+of|stocks?\s+of)\s+([a-z][\w&.\-]*)")
+_CUE_AFTER = re.compile(r"\b([a-z][\w&.\-]*)(?:'s)?\s+(?:stock|shares|share\s+price)\b")
+_SYMBOL_TOKEN = re.compile(r"\$?\b[A-Z][A-Z0-9.\-=^&]{1,11}\b")
+
+_alias_pattern = None
+_alias_lock = threading.Lock()
+
+
+def _get_alias_pattern(index) -> re.Pattern:
+    global _alias_pattern
+    if _alias_pattern is None:
+        with _alias_lock:
+            if _alias_pattern is None:
+                aliases = sorted((a for a in index.by_name if a not in AMBIGUOUS_ALIASES), key=len, reverse=True)
+                _alias_pattern = re.compile(r"\b(" + "|".join(map(re.escape, aliases)) + r")\b")
+    return _alias_pattern
+
+
+def _is_ambiguous_symbol(symbol: str) -> bool:
+    return len(symbol) <= 2 or symbol in AMBIGUOUS_SYMBOLS
+
+
+def _in_listing(index, candidate: str) -> bool:
+    """Exact symbol or name/alias match in the local symbol index (no fuzzy matching)."""
+    symbol = candidate.upper()
+    return normalize_name(candidate) in index.by_name or \
+        (symbol in index.symbols and not _is_ambiguous_symbol(symbol))
+
+
+def find_company_match(text: str) -> Tuple[Optional[str], bool]:
+    """
+    (company, verified) for the first company/ticker mentioned in the text.
+    Verified mentions resolve through the local symbol index: uppercase tickers
+    ("AAPL", "$GE"), listed names and aliases ("hdfc bank"), or a listed name after
+    an investing cue ("buy meta"). Otherwise the first unlisted candidate (a word
+    after a cue, "invest in zomato", or an ambiguous ticker like "MS") is returned
+    unverified, or None when there is nothing.
+    """
+    index = get_symbol_index()
+    candidate = None
+    for token in _SYMBOL_TOKEN.findall(text):
+        symbol = token.lstrip("$")
+        if symbol in index.symbols:
+            if token.startswith("$") or not _is_ambiguous_symbol(symbol):
+                return symbol, True
+            candidate = candidate or symbol
+
+    match = _get_alias_pattern(index).search(normalize_name(text))
+    if match:
+        return match.group(1), True
+
+    lowered = text.lower()
+    for pattern in (_CUE_BEFORE, _CUE_AFTER):
+        for word in pattern.findall(lowered):
+            word = word.strip(".-")
+            if not word or word in GENERIC_WORDS or word.isdigit():
+                continue
+            if _in_listing(index, word):
+                return word, True
+            candidate = candidate or word
+    return candidate, False
+
+
+def find_company(text: str) -> Optional[str]:
+    """First company/ticker mentioned in the text that resolves through the symbol index, or None."""
+    company, verified = find_company_match(text)
+    return company if verified else None
+
+
+# -----------------------------
+# Stage 1: rules
+# -----------------------------
+_GREETING = re.compile(
+    r"^\s*(?:hi+|hello|hey+|hiya|yo|namaste|good\s+(?:morning|afternoon|evening|night)|thanks?|thank\s+you|thx|ty|"
+    r"bye|goodbye|see\s+you(?:\s+later)?|how\s+are\s+you(?:\s+doing)?(?:\s+today)?|what'?s\s+up|whats\s+up|"
+    r"ok(?:ay)?|cool|great|nice|awesome|lol|haha)"
+    r"(?:[\s,!.]+(?:there|so\s+much|a\s+lot|for\s+(?:the|your)\s+help|again|finchat|buddy|you|cool|thanks))*[\s!.?]*$",
+    re.IGNORECASE,
+)
+_KNOWLEDGE = re.compile(
+    r"^\s*(?:(?:can|could)\s+you\s+|please\s+)?(?:what\s+(?:is|are|does)|what'?s|whats|explain|define|"
+    r"meaning\s+of|difference\s+between|how\s+(?:does|do)\s+[\w\s]{1,25}\s+work|tell\s+me\s+about)\b",
+    re.IGNORECASE,
+)
+_FUTURE = re.compile(
+    r"\b(?:predict\w*|forecast\w*|future|outlook|target\s+price|trend\w*|undervalued|overvalued|"
+    r"will\s+[\w\s]{1,30}\s+(?:go|rise|fall|grow|crash|recover|perform|do|be))\b",
+    re.IGNORECASE,
+)
+# Time / opinion words that also occur in general questions ("what is inflation today",
+# "a good time to start a SIP", "buy a car next year"): prediction cues only next to a
+# listed company; without one the route is left to the model at GENERIC_CUE_CONFIDENCE
+_FUTURE_GENERIC = re.compile(
+    r"\b(?:next\s+(?:week|month|quarter|year)|today|right\s+now|happening|worth\s+(?:it|buying)|"
+    r"good\s+(?:choice|buy|investment|idea|time)|should\s+i\s+(?:buy|sell|hold))\b",
+    re.IGNORECASE,
+)
+_INVEST_CUE = re.compile(r"\b(?:invest\w*|buy\w*|sell\w*|hold|stocks?|shares?|price|returns?)\b", re.IGNORECASE)
+_PROFILE_FACTS = re.compile(
+    r"\b(?:i'?m|i\s+am|age[d]?)\s*\d{2}\b|\b\d{2}\s*(?:years?\s+old|yo)\b|\b(?:earn\w*|salary|income)\b|"
+    r"\d\s*(?:k|lakhs?|lacs?|crores?|cr)\b|\b(?:conservative|moderate|aggressive)\b|\bretire\w*\b",
+    re.IGNORECASE,
+)
+_ALLOCATION = re.compile(
+    r"\b(?:allocat\w*|portfolio|diversify\w*|asset\s+mix|distribute|split|divide|rebalanc\w*|investment\s+plan|"
+    r"plan\s+my|how\s+(?:should|do|can)\s+i\s+(?:start\s+)?invest\w*|where\s+should\s+i\s+(?:invest|put)|"
+    r"how\s+to\s+invest|save\s+for)\b",
+    re.IGNORECASE,
+)
+
+
+def rule_intent(text: str, company: Optional[str]) -> Optional[Tuple[str, float, str]]:
+    """(intent, confidence, rationale) when a rule clearly applies, else None."""
+    if _GREETING.match(text):
+        return "General_Chat", 0.97, "Greeting / small talk"
+
+    future = bool(_FUTURE.search(text))
+    generic = bool(_FUTURE_GENERIC.search(text))
+    if company and (future or generic or _INVEST_CUE.search(text)):
+        return "Investment_Prediction", 0.92, f"Asks about investing in '{company}'"
+    if generic and not future:
+        return None  # e.g. "what is inflation today": leave to the model (capped in classify_local)
+
+    facts = bool(_PROFILE_FACTS.search(text))
+    personal = facts or bool(_ALLOCATION.search(text))
+    if future and personal:
+        return None  # e.g. "will my portfolio grow next year": leave to the model
+    if future:
+        return "Investment_Prediction", 0.85, "Asks about future prices / market direction"
+    if _KNOWLEDGE.match(text):
+        if not personal:
+            return "Knowledge", 0.9, "Definition / explanation question"
+        if not facts:
+            return None  # e.g. "what is asset allocation": leave to the model
+    if personal:
+        return "Portfolio_Allocation", 0.88, "Personal situation and allocation request"
+    return None
+
+
+# -----------------------------
+# Stage 2: hashed n-gram linear model
+# -----------------------------
+N_FEATURES = 2 ** 12
+_WORD = re.compile(r"[a-z0-9']+")
+
+
+def hashed_features(text: str) -> Tuple[np.ndarray, np.ndarray]:
+    """Word unigrams + bigrams and char trigrams, hashed (with sign) into N_FEATURES buckets, L2-normalized."""
+    words = _WORD.findall(text.lower())
+    grams = [f"w:{w}" for w in words] + [f"b:{a}_{b}" for a, b in zip(words, words[1:])]
+    for w in words:
+        padded = f"<{w}>"
+        grams += [f"c:{padded[i:i + 3]}" for i in range(len(padded) - 2)]
+
+    counts: Dict[int, float] = {}
+    for gram in grams:
+        h = zlib.crc32(gram.encode("utf-8"))
+        counts[h % N_FEATURES] = counts.get(h % N_FEATURES, 0.0) + (1.0 if h & 0x80000000 else -1.0)
+    idx = np.fromiter(counts.keys(), dtype=np.int64, count=len(counts))
+    val = np.fromiter(counts.values(), dtype=np.float32, count=len(counts))
+    norm = float(np.linalg.norm(val))
+    return idx, (val / norm if norm else val)
+
+
+class HashedIntentModel:
+    """Multinomial logistic regression over hashed_features."""
+
+    def __init__(self, labels=INTENTS):
+        self.labels = tuple(labels)
+        self.W = np.zeros((N_FEATURES, len(self.labels)), dtype=np.float32)
+        self.b = np.zeros(len(self.labels), dtype=np.float32)
+
+    def fit(self, texts: List[str], labels: List[str], epochs: int = 300, lr: float = 2.0, l2: float = 1e-4):
+        X = np.zeros((len(texts), N_FEATURES), dtype=np.float32)
+        for row, text in enumerate(texts):
+            idx, val = hashed_features(text)
+            X[row, idx] = val
+        Y = np.zeros((len(texts), len(self.labels)), dtype=np.float32)
+        Y[np.arange(len(texts)), [self.labels.index(l) for l in labels]] = 1.0
+
+        for _ in range(epochs):
+            P = _softmax(X @ self.W + self.b)
+            grad = (P - Y) / len(texts)
+            self.W -= lr * (X.T @ grad + l2 * self.W)
+            self.b -= lr * grad.sum(axis=0)
+        return self
+
+    def predict_proba(self, text: str) -> Dict[str, float]:
+        idx, val = hashed_features(text)
+        probs = _softmax(val @ self.W[idx] + self.b)
+        return dict(zip(self.labels, probs.tolist()))
+
+
+def _softmax(z: np.ndarray) -> np.ndarray:
+    z = z - z.max(axis=-1, keepdims=True)
+    e = np.exp(z)
+    return e / e.sum(axis=-1, keepdims=True)
+
+
+def load_examples(path: Path) -> List[Dict]:
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+_model: Optional[HashedIntentModel] = None
+_model_lock = threading.Lock()
+
+
+def get_intent_model() -> HashedIntentModel:
+    """Trained once per process from TRAIN_FILE (a few ms)."""
+    global _model
+    if _model is None:
+        with _model_lock:
+            if _model is None:
+                examples = load_examples(TRAIN_FILE)
+                _model = HashedIntentModel().fit([e["text"] for e in examples], [e["intent"] for e in examples])
+    return _model
+
+
+# -----------------------------
+# Routing
+# -----------------------------
+def classify_local(user_query: str) -> TurnRoute:
+    """
+    Best local answer (rules, else the linear model), with its confidence. Routes to
+    a company that is not in the symbol listing are capped at UNVERIFIED_COMPANY_CONFIDENCE,
+    and turns whose only prediction cue is generic ("today", "good time") at GENERIC_CUE_CONFIDENCE.
+    """
+    company, verified = find_company_match(user_query)
+    rule = rule_intent(user_query, company if verified else None)
+    if rule:
+        intent, confidence, rationale = rule
+        source = "rules"
+    else:
+        probs = get_intent_model().predict_proba(user_query)
+        intent = max(probs, key=probs.get)
+        confidence = probs[intent]
+        rationale = f"Hashed n-gram model (p={confidence:.2f})"
+        source = "model"
+
+    prediction = intent == "Investment_Prediction" and company is not None
+    if prediction and not verified and confidence > UNVERIFIED_COMPANY_CONFIDENCE:
+        confidence = UNVERIFIED_COMPANY_CONFIDENCE
+        rationale += f"; '{company}' is not in the symbol listing"
+    elif not verified and confidence > GENERIC_CUE_CONFIDENCE and \
+            _FUTURE_GENERIC.search(user_query) and not _FUTURE.search(user_query):
+        confidence = GENERIC_CUE_CONFIDENCE
+        rationale += "; generic time/opinion cue without a listed company"
+    return TurnRoute(
+        intent=IntentSchema(intent=intent, confidence=round(confidence, 4), rationale=rationale),
+        target="company" if prediction else "profile",
+        company_name=company if prediction else None,
+        source=source,
+    )
+
+
+def route_query(user_query: str, threshold: float = None, use_llm: bool = True) -> TurnRoute:
+    """
+    Classify a chat turn: intent plus profile-vs-company target.
+    The LLM classifiers run only when the local confidence is below `threshold`.
+    """
+    threshold = FAST_INTENT_THRESHOLD if threshold is None else threshold
+    local = classify_local(user_query)
+    if local.intent.confidence >= threshold or not use_llm:
+        return local
+
+    intent = detect_intent(user_query)
+    if intent.confidence < local.intent.confidence:
+        return local  # LLM failed or was less sure than the local guess
+
+    target, company_name = "profile", None
+    if intent.intent == "Investment_Prediction":
+        company_name = find_company(user_query)
+        if company_name:
+            target = "company"
+        else:
+            decision = decide_and_execute(user_query)
+            target = "company" if decision["intent"] == "company" and decision.get("company_name") else "profile"
+            company_name = decision.get("company_name") if target == "company" else None
+    return TurnRoute(intent=intent, target=target, company_name=company_name, source="llm")
+
+
+# -----------------------------
+# Evaluation
+# -----------------------------
+def evaluate(path: Path = EVAL_FILE, threshold: float = None, use_llm: bool = False) -> Dict[str, float]:
+    """Accuracy, fast-path rate and latency of route_query on a labelled JSONL set."""
+    threshold = FAST_INTENT_THRESHOLD if threshold is None else threshold
+    examples = load_examples(path)
+    get_intent_model()  # exclude training from the latency numbers
+
+    correct = fast = fast_correct = company_total = company_correct = 0
+    elapsed = 0.0
+    for example in examples:
+        start = time.perf_counter()
+        route = route_query(example["text"], threshold=threshold, use_llm=use_llm)
+        elapsed += time.perf_counter() - start
+
+        ok = route.intent.intent == example["intent"]
+        correct += ok
+        if route.source != "llm" and route.intent.confidence >= threshold:
+            fast += 1
+            fast_correct += ok
+        elif not use_llm:
+            print(f"  fallback: {example['text']!r} -> {route.intent.intent} ({route.intent.confidence:.2f})")
+        if not ok:
+            print(f"  wrong:    {example['text']!r} -> {route.intent.intent}, expected {example['intent']}")
+
+        if example["intent"] == "Investment_Prediction":
+            company_total += 1
+            expected = (example.get("company_name") or "").lower() or None
+            company_correct += (route.company_name or "").lower() == (expected or "") and \
+                route.target == (example.get("target") or "profile")
+
+    n = len(examples)
+    return {
+        "examples": n,
+        "accuracy": round(correct / n, 4),
+        "fast_path_rate": round(fast / n, 4),
+        "fallback_rate": round(1 - fast / n, 4),
+        "fast_path_accuracy": round(fast_correct / fast, 4) if fast else 0.0,
+        "company_accuracy": round(company_correct / company_total, 4) if company_total else 0.0,
+        "mean_latency_ms": round(elapsed * 1000 / n, 4),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Evaluate the local intent router on a labelled set.")
+    parser.add_argument("--eval", default=str(EVAL_FILE), help="JSONL with text, intent, target, company_name")
+    parser.add_argument("--threshold", type=float, default=FAST_INTENT_THRESHOLD)
+    parser.add_argument("--llm", action="store_true", help="Enable the LLM fallback below the threshold")
+    args = parser.parse_args(argv)
+
+    for key, value in evaluate(Path(args.eval), args.threshold, args.llm).items():
+        print(f"{key}: {value}")
+
+
+if __name__ == "__main__":
+    main()
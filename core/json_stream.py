@@ -0,0 +1,66 @@
+# json_stream.py
+# Incremental parser for a streamed JSON object: feed text chunks as the LLM
+# produces them and get each top-level field back as soon as its value is complete.
+# Leading prose or ```json fences before the first "{" are skipped.
+
+import json
+from typing import Any, Dict, List, Tuple
+
+_decoder = json.JSONDecoder()
+_WS = " \t\r\n"
+
+
+class IncrementalJSONObject:
+    def __init__(self):
+        self.buffer = ""
+        self.pos = None  # index just after "{", set once the object starts
+        self.fields: Dict[str, Any] = {}
+        self.done = False
+
+    def _skip(self, chars: str):
+        while self.pos < len(self.buffer) and self.buffer[self.pos] in chars:
+            self.pos += 1
+
+    def feed(self, chunk: str) -> List[Tuple[str, Any]]:
+        """Add text; return the (key, value) pairs completed by it, in order."""
+        self.buffer += chunk
+        completed = []
+        if self.done:
+            return completed
+
+        if self.pos is None:
+            start = self.buffer.find("{")
+            if start < 0:
+                return completed
+            self.pos = start + 1
+
+        while True:
+            self._skip(_WS + ",")
+            if self.pos >= len(self.buffer):
+                break
+            if self.buffer[self.pos] == "}":
+                self.done = True
+                break
+            try:
+                key, key_end = _decoder.raw_decode(self.buffer, self.pos)
+            except json.JSONDecodeError:
+                break  # key still streaming
+            colon = key_end
+            while colon < len(self.buffer) and self.buffer[colon] in _WS:
+                colon += 1
+            if colon >= len(self.buffer) or self.buffer[colon] != ":":
+                break
+            value_start = colon + 1
+            while value_start < len(self.buffer) and self.buffer[value_start] in _WS:
+                value_start += 1
+            try:
+                value, value_end = _decoder.raw_decode(self.buffer, value_start)
+            except json.JSONDecodeError:
+                break  # value still streaming
+            # A number at the very end of the buffer may still be growing ("12" -> "123")
+            if value_end >= len(self.buffer) and isinstance(value, (int, float)):
+                break
+            self.fields[key] = value
+            completed.append((key, value))
+            self.pos = value_end
+        return completed
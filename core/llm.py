@@ -1,17 +1,130 @@
 # llm.py
 import os
+import threading
+from typing import Any, Dict, Iterator, Optional, Tuple
+
+import httpx
 from langchain_groq import ChatGroq
 from dotenv import load_dotenv
 
+from core.llm_cache import CachedLLM, should_cache
+
 load_dotenv()
 
-def get_llm():
+# -----------------------------
+# Config (overridable via env)
+# -----------------------------
+DEFAULT_MODEL = os.getenv("GROQ_MODEL", "meta-llama/llama-4-maverick-17b-128e-instruct")
+DEFAULT_TEMPERATURE = float(os.getenv("GROQ_TEMPERATURE", "0.0"))  # Deterministic output (good for reasoning & classification)
+DEFAULT_TIMEOUT = float(os.getenv("GROQ_TIMEOUT", "60"))
+
+# Connection pool shared by every Groq client in the process
+HTTP_LIMITS = httpx.Limits(max_connections=32, max_keepalive_connections=16, keepalive_expiry=120.0)
+
+_lock = threading.Lock()
+_http_client: Optional[httpx.Client] = None
+_registry: Dict[Tuple[str, float, float], Any] = {}
+_override: Optional[Any] = None
+
+
+def _get_http_client() -> httpx.Client:
+    """Process-wide pooled, keep-alive HTTP client (reuses TLS connections across calls)."""
+    global _http_client
+    if _http_client is None or _http_client.is_closed:
+        _http_client = httpx.Client(limits=HTTP_LIMITS, timeout=DEFAULT_TIMEOUT)
+    return _http_client
+
+
+def get_llm(model: Optional[str] = None, temperature: Optional[float] = None, timeout: Optional[float] = None,
+            site: Optional[str] = None, cache: bool = True):
     """
-    Returns a Groq LLM instance (gemma2-9b-it).
+    Returns the shared Groq LLM instance for (model, temperature, timeout).
+    Instances are created once per process and reuse one pooled HTTP client.
     Requires GROQ_API_KEY to be set in environment.
+
+    Deterministic clients are wrapped in the response cache (core.llm_cache);
+    `site` names the call site (its TTL and counters), `cache=False` bypasses it.
+    """
+    if _override is not None:
+        llm, requested = _override, None
+    else:
+        requested = DEFAULT_TEMPERATURE if temperature is None else temperature
+        llm = _get_client(model, requested, timeout)
+    # Decided on the requested temperature: ChatGroq stores 0 as 1e-8
+    if cache and should_cache(llm, site, requested):
+        return CachedLLM(llm, site)
+    return llm
+
+
+def _get_client(model: Optional[str], temperature: Optional[float], timeout: Optional[float]):
+    key = (
+        model or DEFAULT_MODEL,
+        DEFAULT_TEMPERATURE if temperature is None else temperature,
+        DEFAULT_TIMEOUT if timeout is None else timeout,
+    )
+    llm = _registry.get(key)
+    if llm is not None:
+        return llm
+
+    with _lock:
+        llm = _registry.get(key)
+        if llm is None:
+            llm = ChatGroq(
+                model=key[0],
+                temperature=key[1],
+                request_timeout=key[2],
+                api_key=os.getenv("GROQ_API_KEY"),
+                http_client=_get_http_client(),
+            )
+            _registry[key] = llm
+    return llm
+
+
+def set_llm(llm) -> None:
     """
-    return ChatGroq(
-        model="meta-llama/llama-4-maverick-17b-128e-instruct",       # gemma2-9b-it hosted on Groq
-        temperature=0.0,                   # Deterministic output (good for reasoning & classification)
-        api_key=os.getenv("GROQ_API_KEY"),
-    )
\ No newline at end of file
+    Make get_llm() return the given model everywhere (e.g. a local fake in tests).
+    Pass None to restore the Groq registry.
+    """
+    global _override
+    _override = llm
+
+
+def reset_llm_registry() -> None:
+    """Drop all cached clients and close the shared connection pool."""
+    global _http_client
+    with _lock:
+        _registry.clear()
+        if _http_client is not None:
+            _http_client.close()
+            _http_client = None
+
+
+def stream_text(messages, llm=None, site: Optional[str] = None) -> Iterator[str]:
+    """
+    Yield the completion's text as it is generated (token chunks), for st.write_stream.
+    Models without native streaming yield their whole answer as one chunk.
+    """
+    llm = llm or get_llm(site=site)
+    for chunk in llm.stream(messages):
+        text = chunk.content if hasattr(chunk, "content") else str(chunk)
+        if text:
+            yield text
+
+
+# -----------------------------
+# Example usage
+# -----------------------------
+if __name__ == "__main__":
+    # Which call sites get the response cache (no request is sent)
+    from core.llm_cache import SITE_TTLS
+
+    os.environ.setdefault("GROQ_API_KEY", "unused")
+    for site in SITE_TTLS:
+        llm = get_llm(site=site)
+        print(f"{site:18} {type(llm).__name__:10} temperature={getattr(llm, 'temperature', None)}")
+    assert isinstance(get_llm(site="intent"), CachedLLM)
+    assert not isinstance(get_llm(site="intent", temperature=0.7), CachedLLM)
+
+    os.environ["LLM_CACHE_TTL_SENTIMENT"] = "3600"  # sentiment is off by default (own cache in market_data.db)
+    assert isinstance(get_llm(site="sentiment"), CachedLLM)
+    print("sentiment with LLM_CACHE_TTL_SENTIMENT set:", type(get_llm(site="sentiment")).__name__)
@@ -0,0 +1,253 @@
+# llm_cache.py
+# Content-addressed cache of LLM completions. The key is a hash of the model,
+# its sampling params and the canonicalized message list, so byte-identical
+# prompts from any call site (intent, profile, final response, ...) are answered
+# without an LLM call. Two tiers: an in-memory LRU in front of a SQLite file.
+# Only deterministic clients (temperature 0) are cached.
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict, defaultdict
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage
+
+from db.connection import ensure_schema, get_connection, transaction
+
+LLM_CACHE_ENABLED = os.getenv("LLM_CACHE", "1") == "1"
+LLM_CACHE_DB = os.getenv("LLM_CACHE_DB", str(Path(__file__).resolve().parent.parent / "db" / "llm_cache.db"))
+LLM_CACHE_MEMORY_ITEMS = int(os.getenv("LLM_CACHE_MEMORY_ITEMS", "2048"))
+DEFAULT_TTL = float(os.getenv("LLM_CACHE_TTL", str(24 * 3600)))  # seconds
+# ChatGroq stores a requested temperature of 0 as 1e-8, so "deterministic" is a tolerance
+DETERMINISTIC_TEMPERATURE = 1e-6
+
+# Per-call-site TTLs (seconds; 0 disables caching for the site).
+# Override one with LLM_CACHE_TTL_<SITE>, e.g. LLM_CACHE_TTL_INTENT=3600.
+SITE_TTLS = {
+    "intent": 7 * 24 * 3600,
+    "profile": 7 * 24 * 3600,
+    "company": 7 * 24 * 3600,
+    "investment_amount": 7 * 24 * 3600,
+    "final_response": 24 * 3600,
+    "advice": 3600,          # prompt embeds live prices, so it rarely repeats anyway
+    "rag": 24 * 3600,
+    "chat": 3600,
+    "sentiment": 0,          # headlines already have their own cache in market_data.db
+}
+
+_ROLES = {"human": "user", "ai": "assistant", "system": "system", "tool": "tool", "function": "function"}
+
+
+def site_ttl(site: Optional[str]) -> float:
+    if site is None:
+        return DEFAULT_TTL
+    env = os.getenv(f"LLM_CACHE_TTL_{site.upper()}")
+    return float(env) if env is not None else SITE_TTLS.get(site, DEFAULT_TTL)
+
+
+# -----------------------------
+# Keys
+# -----------------------------
+def _canonical_text(content: Any) -> Any:
+    if isinstance(content, str):
+        # Trailing spaces and surrounding blank lines never change a prompt's meaning
+        return "\n".join(line.rstrip() for line in content.strip().splitlines())
+    return content  # multimodal content blocks are kept as-is
+
+
+def canonical_messages(messages: Any) -> List[Tuple[str, Any]]:
+    """str | dict | BaseMessage | list of those -> [(role, content)]"""
+    if isinstance(messages, (str, dict, BaseMessage)):
+        messages = [messages]
+    canonical = []
+    for message in messages:
+        if isinstance(message, str):
+            role, content = "user", message
+        elif isinstance(message, dict):
+            role, content = message.get("role", "user"), message.get("content", "")
+        elif isinstance(message, BaseMessage):
+            role, content = _ROLES.get(message.type, message.type), message.content
+        else:
+            role, content = "user", str(message)
+        canonical.append((role, _canonical_text(content)))
+    return canonical
+
+
+def model_params(llm: Any) -> Dict[str, Any]:
+    params = {"model": getattr(llm, "model_name", None) or type(llm).__name__}
+    for name in ("temperature", "max_tokens", "top_p", "stop"):
+        value = getattr(llm, name, None)
+        if value is not None:
+            params[name] = value
+    return params
+
+
+def cache_key(llm: Any, messages: Any, **kwargs) -> str:
+    payload = {"params": model_params(llm), "kwargs": kwargs, "messages": canonical_messages(messages)}
+    raw = json.dumps(payload, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+def is_deterministic(llm: Any, temperature: Optional[float] = None) -> bool:
+    """`temperature` is the one the client was requested with; defaults to the client's own attribute."""
+    if temperature is None:
+        temperature = getattr(llm, "temperature", None)
+    return temperature is not None and temperature <= DETERMINISTIC_TEMPERATURE
+
+
+def should_cache(llm: Any, site: Optional[str] = None, temperature: Optional[float] = None) -> bool:
+    return LLM_CACHE_ENABLED and site_ttl(site) > 0 and is_deterministic(llm, temperature)
+
+
+# -----------------------------
+# Storage (memory LRU + SQLite)
+# -----------------------------
+class LLMResponseCache:
+    def __init__(self, db_path: str = LLM_CACHE_DB, memory_items: int = LLM_CACHE_MEMORY_ITEMS):
+        self.db_path = db_path
+        self.memory_items = memory_items
+        self._memory: "OrderedDict[str, Tuple[str, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats: Dict[str, Dict[str, int]] = defaultdict(lambda: {"memory_hits": 0, "disk_hits": 0, "misses": 0})
+
+    @staticmethod
+    def _create_table(conn: sqlite3.Connection):
+        conn.execute("""CREATE TABLE IF NOT EXISTS llm_responses (
+                            key TEXT PRIMARY KEY,
+                            site TEXT,
+                            model TEXT,
+                            content TEXT,
+                            created_at REAL
+                        )""")
+
+    def _connect(self) -> sqlite3.Connection:
+        ensure_schema(self.db_path, "llm_responses", self._create_table)
+        return get_connection(self.db_path)
+
+    def _count(self, site: Optional[str], field: str):
+        with self._lock:
+            self._stats[site or "default"][field] += 1
+
+    def _remember(self, key: str, content: str, created_at: float):
+        with self._lock:
+            self._memory[key] = (content, created_at)
+            self._memory.move_to_end(key)
+            if len(self._memory) > self.memory_items:
+                self._memory.popitem(last=False)
+
+    def get(self, key: str, ttl: float, site: Optional[str] = None) -> Optional[str]:
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None and now - entry[1] <= ttl:
+                self._memory.move_to_end(key)
+                self._stats[site or "default"]["memory_hits"] += 1
+                return entry[0]
+
+        try:
+            row = self._connect().execute("SELECT content, created_at FROM llm_responses WHERE key=?", (key,)).fetchone()
+        except sqlite3.Error as e:
+            print(f"⚠️ LLM cache read failed: {e}")
+            row = None
+        if row is not None and now - row[1] <= ttl:
+            self._remember(key, row[0], row[1])
+            self._count(site, "disk_hits")
+            return row[0]
+
+        self._count(site, "misses")
+        return None
+
+    def put(self, key: str, content: str, site: Optional[str] = None, model: Optional[str] = None):
+        created_at = time.time()
+        self._remember(key, content, created_at)
+        try:
+            self._connect()
+            with transaction(self.db_path) as conn:
+                conn.execute("INSERT OR REPLACE INTO llm_responses (key, site, model, content, created_at) VALUES (?, ?, ?, ?, ?)",
+                             (key, site, model, content, created_at))
+        except sqlite3.Error as e:
+            print(f"⚠️ LLM cache write failed: {e}")
+
+    def stats(self) -> Dict[str, Dict[str, int]]:
+        with self._lock:
+            return {site: dict(counts) for site, counts in self._stats.items()}
+
+    def clear(self, memory_only: bool = False):
+        with self._lock:
+            self._memory.clear()
+            self._stats.clear()
+        if not memory_only:
+            self._connect()
+            with transaction(self.db_path) as conn:
+                conn.execute("DELETE FROM llm_responses")
+
+
+_cache: Optional[LLMResponseCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_response_cache() -> LLMResponseCache:
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = LLMResponseCache()
+    return _cache
+
+
+def llm_cache_stats() -> Dict[str, Dict[str, int]]:
+    """Hit/miss counters per call site since process start."""
+    return get_response_cache().stats()
+
+
+# -----------------------------
+# Transparent client wrapper
+# -----------------------------
+class CachedLLM:
+    """
+    Wraps a chat model: invoke() and stream() consult the response cache first.
+    Everything else (attributes, other methods) is forwarded to the wrapped client.
+    """
+
+    def __init__(self, llm: Any, site: Optional[str] = None, cache: Optional[LLMResponseCache] = None):
+        self.llm = llm
+        self.site = site
+        self.ttl = site_ttl(site)
+        self.cache = cache or get_response_cache()
+
+    def __getattr__(self, name):
+        return getattr(self.llm, name)
+
+    def invoke(self, input, config=None, **kwargs):
+        key = cache_key(self.llm, input, **kwargs)
+        content = self.cache.get(key, self.ttl, self.site)
+        if content is not None:
+            return AIMessage(content=content, response_metadata={"cache_hit": True})
+
+        response = self.llm.invoke(input, config=config, **kwargs)
+        text = getattr(response, "content", None)
+        if isinstance(text, str) and text.strip():
+            self.cache.put(key, text, self.site, model_params(self.llm)["model"])
+        return response
+
+    def stream(self, input, config=None, **kwargs) -> Iterator[Any]:
+        key = cache_key(self.llm, input, **kwargs)
+        content = self.cache.get(key, self.ttl, self.site)
+        if content is not None:
+            yield AIMessageChunk(content=content, response_metadata={"cache_hit": True})
+            return
+
+        parts = []
+        for chunk in self.llm.stream(input, config=config, **kwargs):
+            if isinstance(getattr(chunk, "content", None), str):
+                parts.append(chunk.content)
+            yield chunk
+        # Only a stream that ran to completion is stored
+        text = "".join(parts)
+        if text.strip():
+            self.cache.put(key, text, self.site, model_params(self.llm)["model"])
@@ -0,0 +1,167 @@
+# pipeline.py
+# Runs the independent stages of a chat turn concurrently as a small DAG.
+# Each stage starts as soon as its dependencies have finished, so turn latency
+# follows the critical path instead of the sum of all LLM / network calls.
+
+import time
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional
+
+_MISSING = object()
+
+
+# -----------------------------
+# Stage / Result definitions
+# -----------------------------
+@dataclass
+class Stage:
+    """
+    One unit of work. `fn` is called with the results of `deps` as keyword
+    arguments (by stage name). If `when` is given it receives the same
+    arguments and the stage is skipped (result None) when it returns False.
+    On error or timeout the stage yields `default` if one is set; otherwise
+    the stage fails and every stage depending on it is cancelled.
+    """
+    name: str
+    fn: Callable[..., Any]
+    deps: List[str] = field(default_factory=list)
+    timeout: Optional[float] = None
+    when: Optional[Callable[..., bool]] = None
+    default: Any = _MISSING
+
+
+@dataclass
+class PipelineResult:
+    results: Dict[str, Any] = field(default_factory=dict)
+    errors: Dict[str, BaseException] = field(default_factory=dict)
+    skipped: List[str] = field(default_factory=list)
+    timings: Dict[str, float] = field(default_factory=dict)
+
+    def get(self, name: str, default: Any = None) -> Any:
+        return self.results.get(name, default)
+
+
+# -----------------------------
+# Scheduler
+# -----------------------------
+def run_pipeline(stages: List[Stage], max_workers: int = 4, timeout: Optional[float] = None) -> PipelineResult:
+    """
+    Execute stages on a thread pool in dependency order.
+    `timeout` bounds the whole run; stages still running when it expires are
+    cancelled. Worker threads cannot be interrupted, so a timed-out call keeps
+    running in the background but its result is discarded.
+    """
+    names = {s.name for s in stages}
+    for s in stages:
+        unknown = [d for d in s.deps if d not in names]
+        if unknown:
+            raise ValueError(f"Stage '{s.name}' depends on unknown stages: {unknown}")
+
+    out = PipelineResult()
+    pending = list(stages)
+    finished = set()
+    failed = set()
+    running = {}  # future -> (stage, start time)
+    deadline = time.monotonic() + timeout if timeout else None
+
+    def fail(stage: Stage, err: BaseException):
+        out.errors[stage.name] = err
+        if stage.default is not _MISSING:
+            out.results[stage.name] = stage.default
+        else:
+            failed.add(stage.name)
+        finished.add(stage.name)
+
+    def skip(stage: Stage, propagate: bool):
+        out.skipped.append(stage.name)
+        out.results[stage.name] = None
+        if propagate:
+            failed.add(stage.name)
+        finished.add(stage.name)
+
+    executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="finchat-stage")
+    try:
+        while pending or running:
+            # Start (or resolve) every stage whose inputs are ready
+            progressed = True
+            while progressed:
+                progressed = False
+                for s in list(pending):
+                    if any(d not in finished for d in s.deps):
+                        continue
+                    pending.remove(s)
+                    progressed = True
+
+                    if any(d in failed for d in s.deps):
+                        skip(s, propagate=True)
+                        continue
+
+                    kwargs = {d: out.results.get(d) for d in s.deps}
+                    try:
+                        if s.when is not None and not s.when(**kwargs):
+                            skip(s, propagate=False)
+                            continue
+                    except Exception as e:
+                        fail(s, e)
+                        continue
+                    running[executor.submit(s.fn, **kwargs)] = (s, time.monotonic())
+
+            if not running:
+                if pending:
+                    raise ValueError(f"Cyclic stage dependencies: {[s.name for s in pending]}")
+                break
+
+            # Sleep until a stage completes or the nearest deadline passes
+            deadlines = [start + s.timeout for s, start in running.values() if s.timeout]
+            if deadline:
+                deadlines.append(deadline)
+            wait_for = max(0.0, min(deadlines) - time.monotonic()) if deadlines else None
+            done, _ = wait(list(running), timeout=wait_for, return_when=FIRST_COMPLETED)
+
+            for fut in done:
+                s, start = running.pop(fut)
+                out.timings[s.name] = time.monotonic() - start
+                try:
+                    out.results[s.name] = fut.result()
+                    finished.add(s.name)
+                except Exception as e:
+                    fail(s, e)
+
+            now = time.monotonic()
+            expired_run = deadline is not None and now >= deadline
+            for fut, (s, start) in list(running.items()):
+                if expired_run or (s.timeout and now - start >= s.timeout):
+                    fut.cancel()
+                    running.pop(fut)
+                    out.timings[s.name] = now - start
+                    fail(s, TimeoutError(f"Stage '{s.name}' timed out"))
+
+            if expired_run:
+                for s in pending:
+                    skip(s, propagate=True)
+                pending.clear()
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    return out
+
+
+# -----------------------------
+# Example usage
+# -----------------------------
+if __name__ == "__main__":
+    def slow(value, delay):
+        time.sleep(delay)
+        return value
+
+    result = run_pipeline([
+        Stage("intent", lambda: slow("Investment_Prediction", 0.3)),
+        Stage("profile", lambda: slow({"age": 25}, 0.3)),
+        Stage("allocation", lambda intent, profile: slow({"Stocks": 0.6}, 0.2), deps=["intent", "profile"]),
+        Stage("company", lambda intent: slow("Tesla", 0.2), deps=["intent"]),
+        Stage("stock", lambda company: slow(f"{company} data", 5), deps=["company"], timeout=0.5, default=None),
+    ])
+    print(result.results)
+    print(result.errors)
+    print(result.timings)
@@ -0,0 +1,248 @@
+# portfolio_batch.py
+# Vectorized allocate_portfolio for many profiles at once (nightly rebalancing
+# reports, what-if analysis). Profiles come in as columns (DataFrame or NumPy
+# structured array); the age, risk, income and goal rules are applied as masked
+# array operations and the result is an N x len(ASSET_CLASSES) weight matrix
+# whose rows equal allocate_portfolio(profile) exactly:
+#   - the same float64 operations run in the same order as the scalar code,
+#   - the normalizing total is summed column by column in dict order,
+#   - values next to a rounding tie go through Python's round() (np.round can differ there).
+#
+#   weights = allocate_portfolio_batch(df)          # shape (len(df), 6)
+#   python -m core.portfolio_batch --profiles 200000
+
+import argparse
+import time
+from typing import Any, Dict, List, Sequence, Union
+
+import numpy as np
+import pandas as pd
+
+from core.portfolio import allocate_portfolio
+from core.userInfo import UserProfile
+
+# Column order of the weight matrix (the scalar function's dict order)
+ASSET_CLASSES = ["Stocks", "Bonds", "Gold", "RealEstate", "Crypto", "Cash"]
+_COL = {asset: i for i, asset in enumerate(ASSET_CLASSES)}
+
+ProfileTable = Union[pd.DataFrame, np.ndarray, Dict[str, Sequence[Any]]]
+
+
+# -----------------------------
+# Columnar input
+# -----------------------------
+def profiles_to_frame(profiles: List[UserProfile]) -> pd.DataFrame:
+    return pd.DataFrame([p.model_dump() for p in profiles],
+                        columns=["age", "monthly_income", "risk_tolerance", "investment_goal"])
+
+
+def _column(profiles: ProfileTable, name: str, n: int) -> pd.Series:
+    if isinstance(profiles, np.ndarray):
+        present = profiles.dtype.names and name in profiles.dtype.names
+    else:
+        present = name in profiles
+    if not present:
+        return pd.Series(np.full(n, None, dtype=object))
+    column = profiles[name]
+    # DataFrame columns are used as-is (string columns may be Arrow-backed)
+    return column.reset_index(drop=True) if isinstance(column, pd.Series) else pd.Series(np.asarray(column))
+
+
+def _numeric(values: pd.Series) -> np.ndarray:
+    """float64 column; None / NaN mean "not provided"."""
+    if values.dtype.kind in "fiu":
+        return values.to_numpy(dtype=np.float64)
+    return pd.to_numeric(values.astype(object), errors="coerce").to_numpy(dtype=np.float64)
+
+
+def _is_set(values: np.ndarray) -> np.ndarray:
+    """Python truthiness of the scalar `if profile.x:` checks (missing, NaN and 0 are unset)."""
+    return ~np.isnan(values) & (values != 0)
+
+
+def _codes(values: pd.Series, code) -> np.ndarray:
+    """code(value) per row, evaluated once per distinct value (missing values get code(None))."""
+    codes, uniques = pd.factorize(values, use_na_sentinel=True)
+    table = np.array([code(v) for v in uniques] + [code(None)], dtype=np.int8)  # last slot: missing (-1)
+    return table[codes]
+
+
+def _risk_codes(risks: pd.Series) -> np.ndarray:
+    """1 Aggressive, 2 Conservative, 0 anything else."""
+    return _codes(risks, lambda risk: {"Aggressive": 1, "Conservative": 2}.get(risk, 0))
+
+
+def _goal_codes(goals: pd.Series) -> np.ndarray:
+    """
+    Goal rule per row: 0 none, 1 retirement, 2 short-term, 3 wealth/growth.
+    Matching runs once per distinct goal string, with the scalar code's exact tests.
+    """
+    def code(goal) -> int:
+        if not isinstance(goal, str) or not goal:
+            return 0
+        goal = goal.lower()
+        if "retirement" in goal:
+            return 1
+        if "short" in goal or "short-term" in goal:
+            return 2
+        if "wealth" in goal or "growth" in goal:
+            return 3
+        return 0
+
+    return _codes(goals, code)
+
+
+def _round_exact(values: np.ndarray, digits: int = 2) -> np.ndarray:
+    """
+    Python's round(v, digits) elementwise. np.round scales by 10**digits first, which
+    can tip values next to a .5 tie the other way, so those few go through round().
+    """
+    scaled = values * 10 ** digits
+    rounded = np.round(values, digits)
+    near_tie = np.abs(scaled - np.floor(scaled) - 0.5) < 1e-6
+    if near_tie.any():
+        uniques, inverse = np.unique(values[near_tie], return_inverse=True)
+        rounded[near_tie] = np.array([round(float(v), digits) for v in uniques])[inverse]
+    return rounded
+
+
+# -----------------------------
+# Batch allocation
+# -----------------------------
+# weights is (len(ASSET_CLASSES), N): each asset's column is contiguous, so the
+# masked updates below are single ufunc passes rather than fancy indexing.
+def _assign(weights: np.ndarray, mask: np.ndarray, values: Dict[str, float]):
+    for asset, value in values.items():
+        np.copyto(weights[_COL[asset]], value, where=mask)
+
+
+def _add(weights: np.ndarray, mask: np.ndarray, asset: str, delta: float):
+    column = weights[_COL[asset]]
+    np.add(column, delta, out=column, where=mask)
+
+
+def allocate_portfolio_batch(profiles: ProfileTable) -> np.ndarray:
+    """
+    allocate_portfolio over a table of profiles with columns age, monthly_income,
+    risk_tolerance and investment_goal (missing columns count as not provided).
+    Returns float64 weights of shape (N, len(ASSET_CLASSES)).
+    """
+    n = len(profiles) if not isinstance(profiles, dict) else len(next(iter(profiles.values()), []))
+    age = _numeric(_column(profiles, "age", n))
+    income = _numeric(_column(profiles, "monthly_income", n))
+    risk = _risk_codes(_column(profiles, "risk_tolerance", n))
+    goal = _goal_codes(_column(profiles, "investment_goal", n))
+
+    # Default conservative allocation
+    weights = np.repeat(np.array([[0.3], [0.4], [0.1], [0.1], [0.05], [0.05]]), n, axis=1)
+
+    # Step 1: Base on age
+    has_age = _is_set(age)
+    young = has_age & (age < 30)
+    middle = has_age & ~young & (age < 50)
+    older = has_age & ~young & ~middle
+    _assign(weights, young, {"Stocks": 0.55, "Bonds": 0.2, "Gold": 0.1, "Crypto": 0.1, "Cash": 0.05})
+    _assign(weights, middle, {"Stocks": 0.45, "Bonds": 0.3, "Gold": 0.15, "RealEstate": 0.05, "Cash": 0.05})
+    _assign(weights, older, {"Stocks": 0.25, "Bonds": 0.45, "Gold": 0.15, "RealEstate": 0.1, "Cash": 0.05})
+
+    # Step 2: Adjust by risk tolerance
+    aggressive = risk == 1
+    conservative = risk == 2
+    _add(weights, aggressive, "Stocks", 0.15)
+    _add(weights, aggressive, "Crypto", 0.05)
+    _add(weights, aggressive, "Bonds", -0.1)
+    _add(weights, aggressive, "Cash", -0.05)
+    _add(weights, conservative, "Stocks", -0.15)
+    _add(weights, conservative, "Bonds", 0.1)
+    _add(weights, conservative, "Cash", 0.05)
+
+    # Step 3: Adjust by income
+    has_income = _is_set(income)
+    low = has_income & (income < 30000)
+    high = has_income & ~low & (income > 100000)
+    _add(weights, low, "Cash", 0.1)
+    _add(weights, low, "Stocks", -0.05)
+    _assign(weights, low, {"Crypto": 0.0})
+    _add(weights, high, "Stocks", 0.1)
+    _add(weights, high, "Crypto", 0.05)
+
+    # Step 4: Adjust by goals
+    _assign(weights, goal == 1, {"Bonds": 0.5, "Stocks": 0.25, "Gold": 0.15, "Cash": 0.1})
+    _assign(weights, goal == 2, {"Cash": 0.4, "Bonds": 0.3, "Stocks": 0.2, "Gold": 0.1, "Crypto": 0.0})
+    _assign(weights, goal == 3, {"Stocks": 0.6, "Crypto": 0.1, "Bonds": 0.15, "Gold": 0.1, "Cash": 0.05})
+
+    # Normalize to sum = 1 (sequential sum, same order as sum(allocation.values()))
+    total = np.zeros(n)
+    for column in weights:
+        total = total + column
+    return _round_exact((weights / total).T)
+
+
+def allocations_frame(profiles: ProfileTable) -> pd.DataFrame:
+    """allocate_portfolio_batch as a DataFrame with one column per asset class."""
+    index = profiles.index if isinstance(profiles, pd.DataFrame) else None
+    return pd.DataFrame(allocate_portfolio_batch(profiles), columns=ASSET_CLASSES, index=index)
+
+
+# -----------------------------
+# Benchmark
+# -----------------------------
+RISK_CHOICES = np.array([None, "Conservative", "Moderate", "Aggressive"], dtype=object)
+GOAL_CHOICES = np.array([None, "Retirement", "short-term savings", "buy a house", "Wealth creation",
+                         "long-term growth", "child's education"], dtype=object)
+
+
+def random_profiles(n: int, seed: int = 0) -> pd.DataFrame:
+    """Synthetic profiles covering every rule branch, with ~10% of each field missing."""
+    rng = np.random.default_rng(seed)
+    age = rng.integers(18, 80, n).astype(float)
+    income = np.round(rng.lognormal(np.log(60000), 0.8, n), -2)
+    age[rng.random(n) < 0.1] = np.nan
+    income[rng.random(n) < 0.1] = np.nan
+    return pd.DataFrame({
+        "age": age,
+        "monthly_income": income,
+        "risk_tolerance": RISK_CHOICES[rng.integers(0, len(RISK_CHOICES), n)],
+        "investment_goal": GOAL_CHOICES[rng.integers(0, len(GOAL_CHOICES), n)],
+    })
+
+
+def _as_profile(row: Dict[str, Any]) -> UserProfile:
+    return UserProfile(**{k: (None if isinstance(v, float) and np.isnan(v) else v) for k, v in row.items()})
+
+
+def benchmark(n: int = 100_000, scalar_sample: int = 20_000, seed: int = 0) -> Dict[str, float]:
+    """
+    Time the batch engine on n profiles and the scalar function on a sample
+    (extrapolated to n), and check that every sampled row matches exactly.
+    """
+    frame = random_profiles(n, seed)
+
+    start = time.perf_counter()
+    weights = allocate_portfolio_batch(frame)
+    batch_s = time.perf_counter() - start
+
+    sample = min(scalar_sample, n)
+    profiles = [_as_profile(row) for row in frame.iloc[:sample].to_dict("records")]
+    start = time.perf_counter()
+    scalar = [allocate_portfolio(p) for p in profiles]
+    scalar_s = (time.perf_counter() - start) * n / sample
+
+    mismatches = sum(
+        any(alloc[asset] != weights[i, j] for j, asset in enumerate(ASSET_CLASSES)) for i, alloc in enumerate(scalar)
+    )
+    return {"profiles": n, "batch_s": round(batch_s, 4), "scalar_s_est": round(scalar_s, 2),
+            "speedup": round(scalar_s / batch_s, 1), "checked_rows": sample, "mismatches": mismatches}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Batch vs scalar allocate_portfolio: speed and exactness.")
+    parser.add_argument("--profiles", type=int, default=100_000)
+    parser.add_argument("--scalar-sample", type=int, default=20_000, help="Rows timed and checked with the scalar function")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+    print(benchmark(args.profiles, args.scalar_sample, args.seed))
+
+
+if __name__ == "__main__":
+    main()
@@ -36,7 +36,7 @@ def suggest_investment_amount(query: str, user_profile: UserProfile) -> float:
     """
     Use LLM to suggest a reasonable investment amount based on user's profile.
     """
-    llm = get_llm()
+    llm = get_llm(site="investment_amount")
     prompt = f"""
     The user has the following profile:
     Age: {user_profile.age}
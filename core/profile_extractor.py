@@ -0,0 +1,276 @@
+# profile_extractor.py
+# Deterministic extraction of UserProfile fields from free text:
+#   age                       "I'm 25", "25 years old", "age: 40"
+#   monthly_income (INR)      "earning 50,000 monthly", "1.2 lakh salary", "12 LPA", "80k/month"
+#   risk_tolerance            "risk moderate", "low risk", "aggressively"
+#   investment_horizon_years  "in 10 years", "over the next five years", "retire at 60"
+#   investment_goal           retirement, house, car, education, wealth-building, short-term, ...
+# Every field comes with a confidence; core.userInfo asks the LLM only for
+# fields that are mentioned but could not be resolved confidently.
+
+import datetime
+import math
+import re
+from dataclasses import dataclass
+from typing import Dict, Optional
+
+FIELDS = ("age", "monthly_income", "risk_tolerance", "investment_goal", "investment_horizon_years")
+
+
+@dataclass
+class FieldMatch:
+    value: object
+    confidence: float
+    evidence: str
+
+
+# -----------------------------
+# Numbers & units
+# -----------------------------
+NUMBER_WORDS = {
+    "one": 1, "two": 2, "three": 3, "four": 4, "five": 5, "six": 6, "seven": 7, "eight": 8, "nine": 9, "ten": 10,
+    "eleven": 11, "twelve": 12, "fifteen": 15, "twenty": 20, "twenty five": 25, "thirty": 30, "forty": 40, "fifty": 50,
+}
+_NUM = r"(\d+(?:,\d+)*(?:\.\d+)?|" + "|".join(sorted(NUMBER_WORDS, key=len, reverse=True)) + r")"
+UNIT_MULTIPLIERS = {"k": 1e3, "thousand": 1e3, "lakh": 1e5, "lakhs": 1e5, "lac": 1e5, "lacs": 1e5, "l": 1e5,
+                    "lpa": 1e5, "million": 1e6, "mn": 1e6, "crore": 1e7, "crores": 1e7, "cr": 1e7}
+_UNIT = r"(k|thousand|lakhs?|lacs?|lpa|l|million|mn|crores?|cr)?"
+
+
+def parse_number(text: str) -> Optional[float]:
+    text = text.strip().lower()
+    if text in NUMBER_WORDS:
+        return float(NUMBER_WORDS[text])
+    try:
+        return float(text.replace(",", ""))
+    except ValueError:
+        return None
+
+
+# -----------------------------
+# Age
+# -----------------------------
+_NOT_AGE_UNIT = r"(?!\s*(?:k\b|%|per\s*cent|percentage|pct\b|lakh|lac|crore|cr\b|rs|inr|rupees|₹|years?\s+(?:from|later|ago)|months?|yrs?\s+(?:from|later)))"
+_AGE_PATTERNS = [
+    (re.compile(r"\b(\d{1,2})\s*(?:years?|yrs?)[\s-]*old\b|\b(\d{1,2})\s*(?:y/?o|years?\s+of\s+age)\b", re.I), 0.97),
+    (re.compile(r"\bage[d]?\s*(?:is|:|=|of)?\s*(\d{1,2})\b" + _NOT_AGE_UNIT, re.I), 0.95),
+    (re.compile(r"\b(?:i'?m|i\s+am|im)\s+(\d{1,2})\b" + _NOT_AGE_UNIT, re.I), 0.9),
+]
+
+
+def _extract_age(text: str) -> Optional[FieldMatch]:
+    for pattern, confidence in _AGE_PATTERNS:
+        for match in pattern.finditer(text):
+            value = int(next(g for g in match.groups() if g))
+            if 10 <= value <= 100:
+                return FieldMatch(value, confidence, match.group(0))
+    return None
+
+
+# -----------------------------
+# Income
+# -----------------------------
+_MONTHLY = r"(?:per\s+month|a\s+month|every\s+month|monthly|/\s*month|/\s*mo|p\.?m\.?|pm)"
+_YEARLY = r"(?:per\s+annum|per\s+year|a\s+year|yearly|annually|annual|/\s*year|/\s*yr|p\.?a\.?|pa)"
+# "6 figures" / "six-figure" is a size, not an amount
+_AMOUNT = r"(?:₹|rs\.?|inr)?\s*" + _NUM + r"\s*" + _UNIT + r"\b(?![\s-]*(?:figures?|digits?)\b)\s*(?:rupees|rs|inr|₹)?"
+_INCOME_KEYWORD = r"(?:earn\w*|salary|income|make|making|take[\s-]*home|ctc|paid|get\s+paid)"
+_INCOME_PATTERNS = [
+    # "earning 50,000 INR monthly", "salary is 1.2 lakh per month"
+    re.compile(_INCOME_KEYWORD + r"(?:\s+(?:is|of|around|about|approx\w*|nearly|roughly|~))*\s*" + _AMOUNT
+               + r"\s*(?:(" + _MONTHLY + r")|(" + _YEARLY + r"))?", re.I),
+    # "my 1 lakh salary", "50k monthly income"
+    re.compile(_AMOUNT + r"\s*(?:(" + _MONTHLY + r")|(" + _YEARLY + r"))?\s*(?:salary|income|take[\s-]*home|ctc)\b", re.I),
+    # "18 LPA" (lakh per annum) needs no keyword
+    re.compile(r"(?:₹|rs\.?|inr)?\s*" + _NUM + r"\s*(lpa)\b()()", re.I),
+]
+_ANNUAL_HINT = re.compile(r"\b(?:ctc|lpa|annual\w*|per\s+annum|yearly)\b", re.I)
+MIN_UNITLESS_INCOME = 1000  # a bare number below this is not read as an income
+# Confidence of a bare number with no unit or period ("earning 5000"); below the
+# default threshold, so the LLM confirms it
+UNITLESS_INCOME_CONFIDENCE = 0.7
+
+
+def _extract_income(text: str) -> Optional[FieldMatch]:
+    for pattern in _INCOME_PATTERNS:
+        match = pattern.search(text)
+        if not match:
+            continue
+        number, unit, monthly, yearly = match.groups()[:4]
+        amount = parse_number(number)
+        if amount is None:
+            continue
+        unit = (unit or "").lower()
+        if not unit and amount < MIN_UNITLESS_INCOME:
+            continue
+        amount *= UNIT_MULTIPLIERS.get(unit, 1.0)
+
+        if yearly or unit == "lpa" or _ANNUAL_HINT.search(match.group(0)):
+            return FieldMatch(round(amount / 12, 2), 0.9, match.group(0).strip())
+        # Salaries are quoted per month unless stated otherwise; an unstated period is less certain
+        if monthly:
+            confidence = 0.95
+        else:
+            confidence = 0.8 if unit else UNITLESS_INCOME_CONFIDENCE
+        return FieldMatch(amount, confidence, match.group(0).strip())
+    return None
+
+
+# -----------------------------
+# Risk tolerance
+# -----------------------------
+_NEGATION = re.compile(r"\b(?:not|no|don'?t|can'?t|cannot|never|n't)\s+(?:\w+\s+)?$", re.I)
+_RISK_PATTERNS = [
+    (re.compile(r"\brisk(?:\s+(?:tolerance|appetite|profile|level))?\s*(?:is|:|=|-)?\s*(low|medium|moderate|high|conservative|aggressive)\b", re.I), None, 0.97),
+    (re.compile(r"\b(low|medium|moderate|high)[\s-]+risk\b", re.I), None, 0.95),
+    (re.compile(r"\b(conservative|moderate|aggressive|balanced)(?:\s+(?:investor|risk|approach|profile|portfolio))?\b", re.I), None, 0.9),
+    (re.compile(r"\b(aggressively|risk[\s-]*taker|take\s+(?:a\s+lot\s+of|high|big)\s+risks?)\b", re.I), "Aggressive", 0.85),
+    (re.compile(r"\b(risk[\s-]*averse|cautious|minimal\s+risk|can'?t\s+(?:afford|take)\s+(?:to\s+lose|risks?))\b", re.I), "Conservative", 0.85),
+    # Weak hints: below the default threshold, so the LLM confirms them
+    (re.compile(r"\b(safe|safety|secure)\b", re.I), "Conservative", 0.6),
+]
+RISK_LEVELS = {"low": "Conservative", "conservative": "Conservative", "medium": "Moderate", "moderate": "Moderate",
+               "balanced": "Moderate", "high": "Aggressive", "aggressive": "Aggressive"}
+
+
+def _extract_risk(text: str) -> Optional[FieldMatch]:
+    for pattern, fixed, confidence in _RISK_PATTERNS:
+        for match in pattern.finditer(text):
+            if _NEGATION.search(text[:match.start()]):
+                continue
+            value = fixed if fixed else RISK_LEVELS[match.group(1).lower()]
+            return FieldMatch(value, confidence, match.group(0))
+    return None
+
+
+# -----------------------------
+# Horizon
+# -----------------------------
+_HORIZON_PATTERNS = [
+    (re.compile(r"\bhorizon\s*(?:is|of|:|=)?\s*(?:about\s+|around\s+)?" + _NUM + r"\s*(years?|yrs?|months?)\b", re.I), 0.97),
+    (re.compile(r"\b(?:in|after|within|for|over|next)\s+(?:the\s+)?(?:next\s+)?(?:about\s+|around\s+)?" + _NUM
+                + r"\s*(years?|yrs?|months?)\b(?!\s+old)", re.I), 0.9),
+    (re.compile(r"\b" + _NUM + r"[\s-]*(years?|yrs?)[\s-]+(?:horizon|goal|plan|term)\b", re.I), 0.9),
+]
+_DECADES = re.compile(r"\b(a|one|two|three)\s+decades?\b", re.I)
+_BY_YEAR = re.compile(r"\b(?:by|in|before|until|till)\s+(20\d\d)\b", re.I)
+_RETIRE_AT = re.compile(r"\bretire\w*\s+(?:at|by)\s+(?:the\s+age\s+of\s+|age\s+)?(\d{2})\b", re.I)
+
+
+def _extract_horizon(text: str, age: Optional[int]) -> Optional[FieldMatch]:
+    for pattern, confidence in _HORIZON_PATTERNS:
+        match = pattern.search(text)
+        if match:
+            amount = parse_number(match.group(1))
+            if amount is None:
+                continue
+            years = amount if match.group(2).lower().startswith("y") else math.ceil(amount / 12)
+            if 0 < years <= 80:
+                return FieldMatch(int(years), confidence, match.group(0))
+
+    match = _DECADES.search(text)
+    if match:
+        count = 1 if match.group(1).lower() == "a" else NUMBER_WORDS[match.group(1).lower()]
+        return FieldMatch(10 * count, 0.85, match.group(0))
+
+    match = _BY_YEAR.search(text)
+    if match:
+        years = int(match.group(1)) - datetime.date.today().year
+        if 0 < years <= 80:
+            return FieldMatch(years, 0.85, match.group(0))
+
+    match = _RETIRE_AT.search(text)
+    if match and age:
+        years = int(match.group(1)) - age
+        if 0 < years <= 80:
+            return FieldMatch(years, 0.85, match.group(0))
+    return None
+
+
+# -----------------------------
+# Goal
+# -----------------------------
+# Canonical goal strings; allocate_portfolio keys off "retirement", "short" and "wealth"/"growth"
+_GOAL_PATTERNS = [
+    (re.compile(r"\bretire\w*|\bpension\b", re.I), "retirement", 0.95),
+    (re.compile(r"\bshort[\s-]*term\b|\bquick\s+(?:gains|returns|profit)", re.I), "short-term gains", 0.9),
+    (re.compile(r"\b(?:buy|buying|purchase)\s+(?:a\s+|my\s+(?:own\s+)?)?(?:house|home|flat|apartment|property)\b|\bdown\s*payment\b", re.I), "buy a house", 0.9),
+    (re.compile(r"\b(?:buy|buying|purchase)\s+(?:a\s+|my\s+)?(?:car|bike)\b", re.I), "buy a car", 0.9),
+    (re.compile(r"\b(?:education|college|university|higher\s+studies|school\s+fees)\b", re.I), "education", 0.85),
+    (re.compile(r"\b(?:wedding|marriage)\b", re.I), "wedding", 0.85),
+    (re.compile(r"\bemergency\s+fund\b", re.I), "emergency fund", 0.9),
+    (re.compile(r"\b(?:travel|vacation|trip)\b", re.I), "travel", 0.8),
+    (re.compile(r"\bwealth|\blong[\s-]*term\s+growth\b|\bgrow\s+my\s+(?:money|wealth|savings)\b", re.I), "wealth-building", 0.9),
+]
+
+
+def _extract_goal(text: str) -> Optional[FieldMatch]:
+    for pattern, goal, confidence in _GOAL_PATTERNS:
+        match = pattern.search(text)
+        if match:
+            return FieldMatch(goal, confidence, match.group(0))
+    return None
+
+
+# -----------------------------
+# Mentions (does the text talk about a field at all?)
+# -----------------------------
+FIELD_CUES = {
+    "age": re.compile(r"\bage[d]?\b|\byears?\s+old\b|\by/?o\b|\bborn\b|\b(?:i'?m|i\s+am|im)\s+(?:\d|twenty|thirty|forty|fifty|sixty)", re.I),
+    "monthly_income": re.compile(r"\b(?:earn\w*|salary|income|make|making|take[\s-]*home|ctc|lpa|paid|stipend)\b", re.I),
+    "risk_tolerance": re.compile(r"\brisk\w*|\b(?:safe|aggressive\w*|conservative|moderate|cautious|volatil\w*)\b", re.I),
+    "investment_horizon_years": re.compile(r"\b" + _NUM + r"\s*(?:years?|yrs?|months?)\b(?!\s*old)|\b(?:horizon|decades?)\b", re.I),
+    "investment_goal": re.compile(r"\b(?:goal|saving\s+for|save\s+for|want\s+to\s+(?:buy|retire|save|build)|plan(?:ning)?\s+(?:to|for)|retire\w*)\b", re.I),
+}
+
+
+def field_mentioned(text: str, field: str) -> bool:
+    return bool(FIELD_CUES[field].search(text))
+
+
+# -----------------------------
+# Public API
+# -----------------------------
+def extract_profile_fields(text: str) -> Dict[str, FieldMatch]:
+    """All profile fields that could be parsed from the text, with confidences."""
+    text = text.replace("’", "'")
+    found: Dict[str, FieldMatch] = {}
+    age = _extract_age(text)
+    if age:
+        found["age"] = age
+    for field, extractor in (("monthly_income", _extract_income), ("risk_tolerance", _extract_risk),
+                             ("investment_goal", _extract_goal)):
+        match = extractor(text)
+        if match:
+            found[field] = match
+    horizon = _extract_horizon(text, age.value if age else None)
+    if horizon:
+        found["investment_horizon_years"] = horizon
+    return found
+
+
+def unresolved_fields(text: str, found: Dict[str, FieldMatch], min_confidence: float) -> list:
+    """Fields the text mentions but that were not parsed with at least min_confidence."""
+    text = text.replace("’", "'")
+    return [f for f in FIELDS
+            if (f not in found or found[f].confidence < min_confidence) and field_mentioned(text, f)]
+
+
+# -----------------------------
+# Example usage
+# -----------------------------
+if __name__ == "__main__":
+    queries = [
+        "I’m 20, earning 5000, what should I do?",
+        "I’m 45, conservative, saving for retirement in 15 years.",
+        "I want to aggressively invest my 1 lakh salary for short-term gains.",
+        "I’m 18 years old and I earn 1000 rupees per month. I want to buy a car after 10 years.",
+        "I'm 25, earning 50,000 INR monthly, risk moderate, goal: buy a house in 10 years",
+        "30 yo, 18 LPA, can take high risk, want to retire at 50",
+    ]
+    for q in queries:
+        found = extract_profile_fields(q)
+        print(q)
+        for name, match in found.items():
+            print(f"  {name}: {match.value!r} ({match.confidence}) <- {match.evidence!r}")
+        print("  unresolved:", unresolved_fields(q, found, 0.8))
@@ -0,0 +1,60 @@
+# profile_memory.py
+# Per-chat user profile that accumulates across turns: facts from earlier
+# messages are kept, new ones override, and extraction only runs when a
+# message looks like it carries profile facts. The profile hash keys the
+# cached portfolio allocation, so it is recomputed only when the profile changes.
+
+import hashlib
+import json
+from typing import Any, Dict, Optional, Tuple
+
+from core.profile_extractor import FIELDS, extract_profile_fields, field_mentioned
+from core.userInfo import UserProfile, extract_user_profile
+
+
+def looks_like_profile_facts(user_query: str) -> bool:
+    """Cheap check: does the message mention age, income, risk, horizon or a goal?"""
+    text = user_query.replace("’", "'")
+    return bool(extract_profile_fields(text)) or any(field_mentioned(text, f) for f in FIELDS)
+
+
+def merge_profiles(current: Optional[UserProfile], update: UserProfile) -> UserProfile:
+    """Fields set in `update` replace those in `current`; unset ones are kept."""
+    merged = current.model_dump() if current else {}
+    merged.update({k: v for k, v in update.model_dump().items() if v is not None})
+    return UserProfile(**merged)
+
+
+def profile_hash(profile: UserProfile) -> str:
+    payload = json.dumps(profile.model_dump(), sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()[:16]
+
+
+def update_profile(current: Optional[UserProfile], user_query: str) -> Tuple[UserProfile, bool]:
+    """
+    Merge the facts in `user_query` into the chat's profile.
+    Returns (profile, changed); small talk returns the current profile untouched.
+    """
+    current = current or UserProfile()
+    if not looks_like_profile_facts(user_query):
+        return current, False
+    merged = merge_profiles(current, extract_user_profile(user_query))
+    return merged, profile_hash(merged) != profile_hash(current)
+
+
+def cached_allocation_for(profile: UserProfile, cached: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+    """The cached allocation if it was computed for this exact profile, else None."""
+    if cached and cached.get("profile_hash") == profile_hash(profile):
+        return cached
+    return None
+
+
+# -----------------------------
+# Example usage
+# -----------------------------
+if __name__ == "__main__":
+    profile = None
+    for message in ["hi!", "I'm 25 and earn 50k a month", "thanks", "actually my risk appetite is high",
+                    "I'm 26 now"]:
+        profile, changed = update_profile(profile, message)
+        print(f"{message!r:40} changed={changed} hash={profile_hash(profile)} {profile.model_dump()}")
@@ -0,0 +1,248 @@
+# prompt_budget.py
+# Token-budgeted prompt assembly. Each prompt section gets its own token cap,
+# large payloads are summarized before they reach the LLM (a year of closing
+# prices becomes a handful of statistics and a sparkline), and the assembled
+# prompt carries a per-section token report so prompt size can be measured.
+#
+#   builder = PromptBuilder()
+#   builder.add("Stock Data", compact_json(compact_stock_data(stock)), max_tokens=300)
+#   prompt = builder.build()
+#   builder.report()  # {"Stock Data": 142, ..., "total": 812}
+
+import json
+import math
+import os
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Sequence
+
+import numpy as np
+
+CHARS_PER_TOKEN = 4  # rough average for English text and JSON under BPE tokenizers
+SPARK_CHARS = "▁▂▃▄▅▆▇█"
+TRUNCATION_MARK = " …[truncated]"
+
+
+# -----------------------------
+# Token counting
+# -----------------------------
+_encoding = None
+
+
+def _get_encoding():
+    """tiktoken's cl100k encoding when installed; otherwise the chars/4 estimate is used."""
+    global _encoding
+    if _encoding is None:
+        try:
+            import tiktoken
+            _encoding = tiktoken.get_encoding("cl100k_base")
+        except Exception:
+            _encoding = False
+    return _encoding
+
+
+def count_tokens(text: str) -> int:
+    if not text:
+        return 0
+    encoding = _get_encoding()
+    if encoding:
+        return len(encoding.encode(text))
+    return math.ceil(len(text) / CHARS_PER_TOKEN)
+
+
+def truncate_to_tokens(text: str, max_tokens: int) -> str:
+    """Cut `text` so it fits in max_tokens, marking the cut."""
+    if count_tokens(text) <= max_tokens:
+        return text
+    budget = max(max_tokens - count_tokens(TRUNCATION_MARK), 0)
+    encoding = _get_encoding()
+    if encoding:
+        cut = encoding.decode(encoding.encode(text)[:budget])
+    else:
+        cut = text[:budget * CHARS_PER_TOKEN]
+    return cut.rstrip() + TRUNCATION_MARK
+
+
+# -----------------------------
+# Compact serialization
+# -----------------------------
+def _round_floats(obj: Any, digits: int) -> Any:
+    if isinstance(obj, float):
+        return round(obj, digits)
+    if isinstance(obj, dict):
+        return {k: _round_floats(v, digits) for k, v in obj.items() if v is not None}
+    if isinstance(obj, (list, tuple)):
+        return [_round_floats(v, digits) for v in obj]
+    if hasattr(obj, "model_dump"):
+        return _round_floats(obj.model_dump(), digits)
+    return obj
+
+
+def compact_json(obj: Any, digits: int = 2) -> str:
+    """Minified JSON with floats rounded and null fields dropped."""
+    return json.dumps(_round_floats(obj, digits), separators=(",", ":"), ensure_ascii=False, default=str)
+
+
+# -----------------------------
+# Price history summary
+# -----------------------------
+def sparkline(prices: Sequence[float], points: int = 24) -> str:
+    """Downsample to `points` buckets (bucket means) and draw them with block characters."""
+    values = np.asarray(prices, dtype=float)
+    if values.size == 0:
+        return ""
+    buckets = np.array_split(values, min(points, values.size))
+    means = np.array([b.mean() for b in buckets])
+    low, high = means.min(), means.max()
+    if high == low:
+        return SPARK_CHARS[len(SPARK_CHARS) // 2] * len(means)
+    levels = np.round((means - low) / (high - low) * (len(SPARK_CHARS) - 1)).astype(int)
+    return "".join(SPARK_CHARS[i] for i in levels)
+
+
+def summarize_prices(prices: Optional[Sequence[float]], trading_days: int = 252) -> Optional[Dict[str, Any]]:
+    """
+    Compact statistics for a daily close series: period and ~1-month returns,
+    annualized volatility, max drawdown, range and a sparkline. All percentages.
+    """
+    if not prices:
+        return None
+    values = np.asarray([p for p in prices if p is not None], dtype=float)
+    if values.size == 0:
+        return None
+
+    summary = {
+        "days": int(values.size),
+        "first": round(float(values[0]), 2),
+        "last": round(float(values[-1]), 2),
+        "low": round(float(values.min()), 2),
+        "high": round(float(values.max()), 2),
+    }
+    if values.size > 1 and values[0] != 0:
+        daily = np.diff(values) / values[:-1]
+        running_peak = np.maximum.accumulate(values)
+        summary["return_pct"] = round(float((values[-1] / values[0] - 1) * 100), 2)
+        if values.size > 21:
+            summary["return_1m_pct"] = round(float((values[-1] / values[-22] - 1) * 100), 2)
+        summary["volatility_annual_pct"] = round(float(daily.std() * np.sqrt(trading_days) * 100), 2)
+        summary["max_drawdown_pct"] = round(float(((values - running_peak) / running_peak).min() * 100), 2)
+    summary["sparkline"] = sparkline(values)
+    return summary
+
+
+def compact_stock_data(stock_data: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+    """stock_data with `historical_prices` replaced by summarize_prices()."""
+    if not stock_data:
+        return stock_data
+    compact = {k: v for k, v in stock_data.items() if k != "historical_prices" and v is not None}
+    history = summarize_prices(stock_data.get("historical_prices"))
+    if history:
+        compact["price_history"] = history
+    return compact
+
+
+# -----------------------------
+# Chat history
+# -----------------------------
+def message_text(content: Any) -> str:
+    """Text of a history entry; structured assistant replies contribute only their summary text."""
+    if isinstance(content, dict):
+        return str(content.get("text") or content.get("final_text") or "")
+    return str(content)
+
+
+def compact_history(history: List[Dict[str, Any]], turns: int = 3, max_tokens_per_turn: int = 120) -> str:
+    """The last `turns` messages as 'role: text' lines, each capped at max_tokens_per_turn."""
+    lines = []
+    for message in history[-turns:]:
+        text = " ".join(message_text(message.get("content")).split())
+        if text:
+            lines.append(f"{message['role']}: {truncate_to_tokens(text, max_tokens_per_turn)}")
+    return "\n".join(lines)
+
+
+# -----------------------------
+# Builder
+# -----------------------------
+@dataclass
+class PromptSection:
+    name: str
+    text: str
+    max_tokens: Optional[int] = None  # None = no cap
+    heading: bool = True
+    tokens: int = 0
+    truncated: bool = False
+
+
+class PromptBuilder:
+    def __init__(self, total_budget: Optional[int] = None):
+        self.total_budget = total_budget
+        self.sections: List[PromptSection] = []
+
+    def add(self, name: str, body: Any, max_tokens: Optional[int] = None, heading: bool = True) -> "PromptBuilder":
+        """
+        max_tokens caps the rendered section, heading included, so report() can be
+        checked against it (a cap smaller than the heading plus the truncation mark can't be met).
+        """
+        text = body if isinstance(body, str) else compact_json(body)
+        text = text.strip()
+        section = PromptSection(name, text, max_tokens, heading)
+        if max_tokens is not None and count_tokens(self._render(section)) > max_tokens:
+            section.truncated = True
+            budget = max_tokens - count_tokens(self._render(PromptSection(name, "", heading=heading)))
+            section.text = truncate_to_tokens(text, budget)
+            # Token counts aren't exactly additive across the join; shave until the section fits
+            while budget > 0 and count_tokens(self._render(section)) > max_tokens:
+                budget -= 1
+                section.text = truncate_to_tokens(text, budget)
+        section.tokens = count_tokens(self._render(section))
+        self.sections.append(section)
+        return self
+
+    @staticmethod
+    def _render(section: PromptSection) -> str:
+        return f"## {section.name}\n{section.text}" if section.heading else section.text
+
+    def build(self) -> str:
+        prompt = "\n\n".join(self._render(s) for s in self.sections)
+        truncated = [s.name for s in self.sections if s.truncated]
+        if truncated:
+            print(f"⚠️ Prompt sections truncated to budget: {', '.join(truncated)}")
+        if self.total_budget is not None and self.total_tokens() > self.total_budget:
+            print(f"⚠️ Prompt is {self.total_tokens()} tokens, over the {self.total_budget} token budget")
+        return prompt
+
+    def total_tokens(self) -> int:
+        return sum(s.tokens for s in self.sections)
+
+    def report(self) -> Dict[str, int]:
+        """Token count per section, plus the total."""
+        report = {s.name: s.tokens for s in self.sections}
+        report["total"] = self.total_tokens()
+        return report
+
+
+def section_budgets(defaults: Dict[str, int], env_prefix: str) -> Dict[str, int]:
+    """Per-section budgets, each overridable with <env_prefix>_<SECTION>, e.g. ADVICE_BUDGET_STOCK_DATA=200."""
+    return {
+        name: int(os.getenv(f"{env_prefix}_{name.upper()}", budget))
+        for name, budget in defaults.items()
+    }
+
+
+# -----------------------------
+# Example usage
+# -----------------------------
+if __name__ == "__main__":
+    rng = np.random.default_rng(7)
+    prices = list(100 * np.exp(np.cumsum(rng.normal(0.0005, 0.02, 252))))
+    stock = {"ticker": "TSLA", "company_name": "Tesla, Inc.", "current_price": prices[-1], "historical_prices": prices}
+
+    print("raw stock_data tokens:    ", count_tokens(str(stock)))
+    print("compact stock_data tokens:", count_tokens(compact_json(compact_stock_data(stock))))
+    print(compact_json(compact_stock_data(stock)))
+
+    builder = PromptBuilder(total_budget=600)
+    builder.add("User Query", "Should I buy Tesla for the next 5 years?", max_tokens=200)
+    builder.add("Stock Data", compact_stock_data(stock), max_tokens=250)
+    builder.build()
+    print(builder.report())
@@ -0,0 +1,49 @@
+# ratelimit.py
+# Client-side throttling and retries for upstream APIs (embeddings, NewsAPI,
+# AlphaVantage, Yahoo): a per-source request spacer shared across threads and
+# an exponential-backoff retry helper.
+
+import random
+import threading
+import time
+from typing import Callable, Optional, TypeVar
+
+T = TypeVar("T")
+
+
+class RateLimiter:
+    """Spaces calls so at most `per_minute` start in any minute (shared across threads)."""
+
+    def __init__(self, per_minute: float):
+        self.interval = 60.0 / per_minute if per_minute > 0 else 0.0
+        self._next = 0.0
+        self._lock = threading.Lock()
+
+    def wait(self):
+        if not self.interval:
+            return
+        with self._lock:
+            now = time.monotonic()
+            start = max(now, self._next)
+            self._next = start + self.interval
+        if start > now:
+            time.sleep(start - now)
+
+
+def retry_with_backoff(fn: Callable[[], T], retries: int = 3, base_delay: float = 1.0, max_delay: float = 60.0,
+                       should_retry: Optional[Callable[[Exception], bool]] = None, label: str = "Request",
+                       sleep: Callable[[float], None] = time.sleep) -> T:
+    """
+    Call fn(), retrying failures up to `retries` times with exponential backoff
+    (base_delay * 2^attempt, capped at max_delay, with jitter). Errors for which
+    should_retry(e) is False are raised immediately.
+    """
+    for attempt in range(retries + 1):
+        try:
+            return fn()
+        except Exception as e:
+            if attempt == retries or (should_retry is not None and not should_retry(e)):
+                raise
+            delay = min(max_delay, base_delay * 2 ** attempt) * random.uniform(0.5, 1.0)
+            print(f"⚠️ {label} failed ({e}); retrying in {delay:.1f}s")
+            sleep(delay)
@@ -1,16 +1,11 @@
 # response.py
 from core.userInfo import UserProfile
 from core.sentiment_adjust import AdjustmentResult
-from typing import Dict
-from core.llm import get_llm
+from typing import Dict, Iterator
+from core.llm import get_llm, stream_text
 from langchain.schema import HumanMessage, SystemMessage
 import textwrap
 
-# -----------------------------
-# LLM Setup
-# -----------------------------
-llm = get_llm()
-
 # -----------------------------
 # Professional Goal-Oriented Financial Advice
 # -----------------------------
@@ -20,6 +15,22 @@ def generate_final_response(profile: UserProfile, base_alloc: Dict[str, float],
     Combines user profile, base & adjusted allocations, and news-driven sentiment reasoning.
     Highlights key allocations with emojis and provides warnings/tips.
     """
+    try:
+        response = get_llm(site="final_response").invoke(_build_messages(profile, base_alloc, adjusted))
+        return response.content.strip()
+    except Exception as e:
+        return f"[Error generating final response: {e}]"
+
+
+def stream_final_response(profile: UserProfile, base_alloc: Dict[str, float], adjusted: AdjustmentResult) -> Iterator[str]:
+    """Same advice as generate_final_response, yielded token by token (for st.write_stream)."""
+    try:
+        yield from stream_text(_build_messages(profile, base_alloc, adjusted), site="final_response")
+    except Exception as e:
+        yield f"[Error generating final response: {e}]"
+
+
+def _build_messages(profile: UserProfile, base_alloc: Dict[str, float], adjusted: AdjustmentResult):
     system_prompt = textwrap.dedent("""
         You are a senior financial advisor. Your task is to provide a complete investment plan
         tailored to the user's goal. Consider the following:
@@ -51,17 +62,11 @@ def generate_final_response(profile: UserProfile, base_alloc: Dict[str, float],
         {adjusted.sentiment_summary}
     """)
 
-    messages = [
+    return [
         SystemMessage(content=system_prompt),
         HumanMessage(content=user_context)
     ]
 
-    try:
-        response = llm.invoke(messages)
-        return response.content.strip()
-    except Exception as e:
-        return f"[Error generating final response: {e}]"
-
 # -----------------------------
 # Example usage
 # -----------------------------
@@ -1,7 +1,10 @@
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Callable, Optional
 from pydantic import BaseModel
-from core.llm import get_llm
+from core.llm import stream_text
+from core.json_stream import IncrementalJSONObject
+from core.prompt_budget import PromptBuilder, compact_history, compact_stock_data, section_budgets
 import json
+import os
 
 
 # Define structured advice format
@@ -16,77 +19,117 @@ class FinancialAdvice(BaseModel):
     sources: List[str]
 
 
+# Token budget per prompt section (override with ADVICE_BUDGET_<SECTION>)
+ADVICE_SECTION_BUDGETS = section_budgets({
+    "conversation": 400,
+    "user_query": 300,
+    "user_profile": 150,
+    "portfolio": 250,
+    "stock_data": 300,
+    "monte_carlo": 150,
+}, "ADVICE_BUDGET")
+ADVICE_PROMPT_BUDGET = int(os.getenv("ADVICE_PROMPT_BUDGET", "2500"))
+
+ADVICE_INTRO = """You are acting as a **real-time advanced financial advisor**.
+Analyze everything and provide a complete, reliable, and humanized
+financial recommendation."""
+
+ADVICE_INSTRUCTIONS = """### Instructions:
+1. Start with a **clear summary** of the user’s situation and query.
+2. Provide a **decision validation** (is the user’s query/idea financially sound?).
+3. Give a **trustworthiness rating** and explain why the advice is reliable (based on diversification, SIPs, inflation, market history, etc).
+4. Suggest a **detailed investment plan**: asset classes, percentages, timelines (short-term vs long-term).
+5. Provide a **risk analysis**: best-case, average-case, worst-case scenarios.
+6. Give **expected returns** (with numbers & explanation).
+7. Create a **step-by-step actionable roadmap** for the user (from today to future).
+8. Include **sources/references** (e.g. market history, financial principles, or links if known).
+9. Format response strictly in JSON with fields:
+{
+    "summary": "...",
+    "decision_validation": "...",
+    "trustworthiness": "...",
+    "investment_plan": "...",
+    "risk_analysis": "...",
+    "expected_returns": "...",
+    "step_by_step": ["...", "..."],
+    "sources": ["...", "..."]
+}"""
+
+
 def generate_financial_advice(
     user_query: str,
     user_profile: Dict[str, Any],
     stock_data: Dict[str, Any] = None,
     monte_carlo: Dict[str, Any] = None,
-    portfolio: Dict[str, Any] = None
+    portfolio: Dict[str, Any] = None,
+    on_field: Optional[Callable[[str, Any], None]] = None,
+    history: Optional[List[Dict[str, Any]]] = None
 ) -> FinancialAdvice:
     """
     Generate advanced, humanized financial advice using LLM reasoning
     by combining user query, profile, stock data, portfolio recommendations,
     and Monte Carlo simulations. Provides step-by-step actionable insights
     with expected returns and sources.
-    """
 
-    llm = get_llm()
-
-    # Build advanced advisor prompt
-    prompt = f"""
-    You are acting as a **real-time advanced financial advisor**.
-    Analyze everything and provide a complete, reliable, and humanized
-    financial recommendation.
-
-    ## User Query
-    {user_query}
-
-    ## User Profile
-    {user_profile}
-
-    ## Portfolio Recommendation
-    {portfolio if portfolio else "Not provided"}
-
-    ## Stock Data
-    {stock_data if stock_data else "Not provided"}
-
-    ## Monte Carlo Simulation (future risk/returns)
-    {monte_carlo if monte_carlo else "Not provided"}
-
-    ### Instructions:
-    1. Start with a **clear summary** of the user’s situation and query.
-    2. Provide a **decision validation** (is the user’s query/idea financially sound?).
-    3. Give a **trustworthiness rating** and explain why the advice is reliable (based on diversification, SIPs, inflation, market history, etc).
-    4. Suggest a **detailed investment plan**: asset classes, percentages, timelines (short-term vs long-term).
-    5. Provide a **risk analysis**: best-case, average-case, worst-case scenarios.
-    6. Give **expected returns** (with numbers & explanation).
-    7. Create a **step-by-step actionable roadmap** for the user (from today to future).
-    8. Include **sources/references** (e.g. market history, financial principles, or links if known).
-    9. Format response strictly in JSON with fields:
-    {{
-        "summary": "...",
-        "decision_validation": "...",
-        "trustworthiness": "...",
-        "investment_plan": "...",
-        "risk_analysis": "...",
-        "expected_returns": "...",
-        "step_by_step": ["...", "..."],
-        "sources": ["...", "..."]
-    }}
+    The completion is streamed; `on_field(name, value)` is called as soon as
+    each top-level JSON field (summary, investment_plan, ...) is complete.
+    `history` is the chat's prior messages; only a compact tail is included.
     """
+    prompt = build_advice_prompt(user_query, user_profile, stock_data, monte_carlo, portfolio, history).build()
+
+    # Stream the LLM response, surfacing fields as they complete
+    parser = IncrementalJSONObject()
+    for chunk in stream_text(prompt, site="advice"):
+        for name, value in parser.feed(chunk):
+            if on_field is not None:
+                on_field(name, value)
 
-    # Get LLM response
-    raw_response = llm.invoke(prompt)
+    return parse_financial_advice(parser.buffer, parser.fields)
 
-    if hasattr(raw_response, "content"):
-        response_text = raw_response.content
-    else:
-        response_text = str(raw_response)
 
+def build_advice_prompt(
+    user_query: str,
+    user_profile: Dict[str, Any],
+    stock_data: Dict[str, Any] = None,
+    monte_carlo: Dict[str, Any] = None,
+    portfolio: Dict[str, Any] = None,
+    history: Optional[List[Dict[str, Any]]] = None
+) -> PromptBuilder:
+    """
+    Assemble the advisor prompt section by section, each within its token budget.
+    Price history is summarized (returns, volatility, drawdown, sparkline) and
+    structured inputs are sent as compact JSON. `.build()` gives the prompt text,
+    `.report()` the token count per section.
+    """
+    budgets = ADVICE_SECTION_BUDGETS
+    builder = PromptBuilder(total_budget=ADVICE_PROMPT_BUDGET)
+    builder.add("Intro", ADVICE_INTRO, heading=False)
+    if history:
+        builder.add("Recent Conversation", compact_history(history), max_tokens=budgets["conversation"])
+    builder.add("User Query", user_query, max_tokens=budgets["user_query"])
+    builder.add("User Profile", user_profile, max_tokens=budgets["user_profile"])
+    builder.add("Portfolio Recommendation", portfolio if portfolio else "Not provided",
+                max_tokens=budgets["portfolio"])
+    builder.add("Stock Data", compact_stock_data(stock_data) if stock_data else "Not provided",
+                max_tokens=budgets["stock_data"])
+    builder.add("Monte Carlo Simulation (future risk/returns)", monte_carlo if monte_carlo else "Not provided",
+                max_tokens=budgets["monte_carlo"])
+    builder.add("Instructions", ADVICE_INSTRUCTIONS, heading=False)
+    return builder
+
+
+def parse_financial_advice(response_text: str, streamed_fields: Optional[Dict[str, Any]] = None) -> FinancialAdvice:
+    """
+    Parse the LLM's JSON answer. Fields already recovered by the incremental
+    parser are used when the full text is not bare JSON (e.g. wrapped in ```json fences).
+    """
     # Parse JSON safely
     try:
         parsed = json.loads(response_text)
     except json.JSONDecodeError:
+        parsed = dict(streamed_fields) if streamed_fields else None
+
+    if not isinstance(parsed, dict):
         parsed = {
             "summary": "Unable to parse advice.",
             "decision_validation": "Could not verify user query.",
@@ -1,14 +1,20 @@
 # sentiment_adjust.py
-from typing import Dict, List
-from pydantic import BaseModel, Field
+from typing import Dict, List, Literal, Optional, Tuple
+from pydantic import BaseModel, Field, ValidationError
 import numpy as np
+import json
 from core.llm import get_llm  # 👈 Import your LLM loader
 import os
 from langchain.schema import HumanMessage, SystemMessage
 import re
+import threading
+import time
+import datetime
 from core.portfolio import allocate_portfolio
 from core.userInfo import UserProfile
-from db.newsdb import get_latest_news
+from db.newsdb import (headline_hash, get_latest_news_rows, get_latest_news_ids, get_cached_sentiments,
+                       store_sentiments, get_asset_sentiments, store_asset_sentiments)
+from core.singleflight import get_group
 
 
 
@@ -21,6 +27,23 @@ class AdjustmentResult(BaseModel):
     sentiment_summary: str = Field(..., description="Summary of sentiment reasoning")
 
 
+class HeadlineSentiment(BaseModel):
+    id: int = Field(..., description="Index of the headline in the request")
+    label: Literal["Positive", "Negative", "Neutral"]
+    score: float = Field(..., ge=0.0, le=1.0)
+
+
+class AssetSentiment(BaseModel):
+    asset: str
+    avg_score: float
+    details: str
+    headline_ids: List[int] = Field(default_factory=list, description="news ids the average was computed from")
+    latest_news_id: Optional[int] = Field(None, description="Newest news id for the asset when computed")
+    model_id: str
+    prompt_version: int
+    computed_at: str
+
+
 
 # -----------------------------
 # HuggingFace FinBERT Setup
@@ -62,52 +85,161 @@ class AdjustmentResult(BaseModel):
 # -----------------------------
 def load_llm_sentiment():
     """Load the LLM defined in llm.py"""
-    return get_llm()
+    return get_llm(site="sentiment")
 
 
 # -----------------------------
-# Use LLM to analyze sentiment
+# Use LLM to analyze sentiment (batched)
 # -----------------------------
-def analyze_sentiment(asset: str, headlines: list[str], sentiment_llm):
-    scores = []
-    summary = []
-
-    system_prompt = """You are a financial sentiment classifier.
-For each news headline, respond with one of:
+SENTIMENT_SYSTEM_PROMPT = """You are a financial sentiment classifier.
+You receive a JSON array of news headlines, each with an "id" and the asset class it concerns.
+For each headline, respond with one of:
 - Positive (score between 0.6 and 1.0)
 - Negative (score between 0.6 and 1.0)
 - Neutral (score exactly 0.0)
 
-Respond strictly in JSON like:
-{"label": "Positive", "score": 0.87}
+Respond strictly with ONE JSON array containing one object per headline, no extra text, like:
+[{"id": 0, "label": "Positive", "score": 0.87}, {"id": 1, "label": "Neutral", "score": 0.0}]
 """
 
-    for h in headlines:
-        messages = [
-            SystemMessage(content=system_prompt),
-            HumanMessage(content=f"Headline: {h}")
-        ]
+# Upper bound on headlines per LLM request; the whole allocation turn fits in one.
+MAX_BATCH_SIZE = 40
+
+# Bump when SENTIMENT_SYSTEM_PROMPT changes so cached labels are re-scored.
+SENTIMENT_PROMPT_VERSION = 1
+SENTIMENT_CACHE_TTL_DAYS = float(os.getenv("SENTIMENT_CACHE_TTL_DAYS", "30"))
+
+
+def model_id(sentiment_llm) -> str:
+    return getattr(sentiment_llm, "model_name", None) or type(sentiment_llm).__name__
+
+
+def parse_sentiment_batch(raw: str, expected_ids: List[int]) -> Dict[int, HeadlineSentiment]:
+    """
+    Strictly parse an LLM reply into {id: HeadlineSentiment}.
+    Raises ValueError unless the reply is one JSON array covering exactly expected_ids.
+    """
+    text = raw.strip()
+    if text.startswith("```"):
+        text = re.sub(r"^```(?:json)?\s*|\s*```$", "", text)
+
+    data = json.loads(text)
+    if not isinstance(data, list):
+        raise ValueError("Sentiment reply is not a JSON array")
+
+    try:
+        items = [HeadlineSentiment.model_validate(d) for d in data]
+    except ValidationError as ve:
+        raise ValueError(f"Invalid sentiment item: {ve}") from ve
+
+    parsed = {item.id: item for item in items}
+    if len(parsed) != len(items) or set(parsed) != set(expected_ids):
+        raise ValueError("Sentiment reply ids do not match the request")
+    return parsed
+
+
+def _neutral(items: List[Tuple[int, str, str]], failed: set) -> Dict[int, HeadlineSentiment]:
+    failed.update(i for i, _, _ in items)
+    return {i: HeadlineSentiment(id=i, label="Neutral", score=0.0) for i, _, _ in items}
+
+
+def _score_batch(items: List[Tuple[int, str, str]], sentiment_llm, failed: set) -> Dict[int, HeadlineSentiment]:
+    """
+    Score (id, asset, headline) items in one LLM call.
+    Malformed output is retried in two halves, down to single headlines. A failed
+    call (network, auth, rate limit) is not retried: the whole batch is labelled
+    Neutral. Headlines labelled Neutral this way have their ids added to failed.
+    """
+    payload = [{"id": i, "asset": asset, "headline": h} for i, asset, h in items]
+    messages = [
+        SystemMessage(content=SENTIMENT_SYSTEM_PROMPT),
+        HumanMessage(content=json.dumps(payload, ensure_ascii=False))
+    ]
+
+    try:
+        raw = sentiment_llm.invoke(messages).content
+    except Exception as e:
+        print(f"⚠️ Sentiment LLM call failed, defaulting {len(items)} headline(s) to Neutral: {e}")
+        return _neutral(items, failed)
+
+    try:
+        return parse_sentiment_batch(raw, [i for i, _, _ in items])
+    except (ValueError, ValidationError) as e:  # includes json.JSONDecodeError
+        if len(items) == 1:
+            print(f"⚠️ Sentiment scoring failed, defaulting to Neutral: {e}")
+            return _neutral(items, failed)
+        mid = len(items) // 2
+        return {**_score_batch(items[:mid], sentiment_llm, failed), **_score_batch(items[mid:], sentiment_llm, failed)}
+
+
+def _score_unique(pairs: List[Tuple[str, str]], sentiment_llm, batch_size: int, llm_id: str,
+                  use_cache: bool) -> Dict[Tuple[str, str], HeadlineSentiment]:
+    """Score distinct (asset, headline) pairs in batches and cache the successful labels."""
+    numbered = [(i, asset, h) for i, (asset, h) in enumerate(pairs)]
+    results: Dict[int, HeadlineSentiment] = {}
+    failed: set = set()
+    for start in range(0, len(numbered), batch_size):
+        results.update(_score_batch(numbered[start:start + batch_size], sentiment_llm, failed))
+
+    if use_cache:
+        fresh = {headline_hash(h): (results[i].label, results[i].score) for i, _, h in numbered if i not in failed}
+        try:
+            store_sentiments(fresh, llm_id, SENTIMENT_PROMPT_VERSION)
+        except Exception as e:
+            print(f"⚠️ Sentiment cache write failed: {e}")
+    return {pair: results[i] for i, pair in enumerate(pairs)}
+
+
+def score_headlines(items: List[Tuple[str, str]], sentiment_llm, batch_size: int = MAX_BATCH_SIZE,
+                    use_cache: bool = True) -> List[HeadlineSentiment]:
+    """
+    Score (asset, headline) pairs with as few LLM calls as possible, preserving order.
+    Labels already in the sentiment cache for this model are reused and only the
+    misses are sent to the LLM; fresh labels are written back.
+    """
+    hashes = [headline_hash(h) for _, h in items]
+    llm_id = model_id(sentiment_llm)
+
+    cached = {}
+    if use_cache:
+        try:
+            cached = get_cached_sentiments(list(set(hashes)), llm_id, SENTIMENT_PROMPT_VERSION,
+                                           max_age_days=SENTIMENT_CACHE_TTL_DAYS)
+        except Exception as e:
+            print(f"⚠️ Sentiment cache read failed: {e}")
+
+    results: Dict[int, HeadlineSentiment] = {}
+    misses = []
+    for i, ((asset, h), hh) in enumerate(zip(items, hashes)):
+        if hh in cached:
+            label, score = cached[hh]
+            results[i] = HeadlineSentiment(id=i, label=label, score=score)
+        else:
+            misses.append((i, asset, h))
+
+    if misses:
+        # Sessions scoring the same fresh headlines at once share one set of LLM calls
+        pairs = sorted({(asset, h) for _, asset, h in misses})
+        key = (llm_id, SENTIMENT_PROMPT_VERSION, use_cache, tuple(pairs))
+        scored = get_group("sentiment").do(key, _score_unique, pairs, sentiment_llm, batch_size, llm_id, use_cache)
+        for i, asset, h in misses:
+            sentiment = scored[(asset, h)]
+            results[i] = HeadlineSentiment(id=i, label=sentiment.label, score=sentiment.score)
 
-        raw = sentiment_llm.invoke(messages).content.strip()
+    return [results[i] for i in range(len(items))]
 
-        # Extract JSON (basic cleanup)
-        match = re.search(r'{.*}', raw, re.DOTALL)
-        if not match:
-            label, score = "Neutral", 0.0
-        else:
-            try:
-                data = eval(match.group())  # ⚠️ for production replace with json.loads
-                label = data.get("label", "Neutral")
-                score = float(data.get("score", 0.0))
-            except Exception:
-                label, score = "Neutral", 0.0
-
-        summary.append(f"{h} → {label} ({score:.2f})")
-
-        if label == "Positive":
-            scores.append(score)
-        elif label == "Negative":
-            scores.append(-score)
+
+def summarize_sentiment(headlines: List[str], labels: List[HeadlineSentiment]) -> Tuple[float, str]:
+    scores = []
+    summary = []
+
+    for h, s in zip(headlines, labels):
+        summary.append(f"{h} → {s.label} ({s.score:.2f})")
+
+        if s.label == "Positive":
+            scores.append(s.score)
+        elif s.label == "Negative":
+            scores.append(-s.score)
         else:
             scores.append(0.0)
 
@@ -115,23 +247,122 @@ Respond strictly in JSON like:
     return avg_score, "\n".join(summary)
 
 
+def analyze_sentiment_batch(news_by_asset: Dict[str, List[str]], sentiment_llm) -> Dict[str, Tuple[float, str]]:
+    """
+    Score the headlines of every asset in one structured request.
+    Returns {asset: (avg_score, details)} like analyze_sentiment.
+    """
+    items = [(asset, h) for asset, headlines in news_by_asset.items() for h in headlines]
+    labels = score_headlines(items, sentiment_llm)
+
+    results = {}
+    pos = 0
+    for asset, headlines in news_by_asset.items():
+        results[asset] = summarize_sentiment(headlines, labels[pos:pos + len(headlines)])
+        pos += len(headlines)
+    return results
+
+
+def analyze_sentiment(asset: str, headlines: list[str], sentiment_llm):
+    return analyze_sentiment_batch({asset: headlines}, sentiment_llm)[asset]
+
+
+
+# -----------------------------
+# Per-asset sentiment snapshots
+# -----------------------------
+# Sentiment depends only on each asset's latest headlines, not on the user, so it
+# is computed once per news update (by db.ingest, or by the first request that
+# finds it stale) and shared by every session.
+SENTIMENT_ASSETS = ["Stocks", "Gold", "Crypto", "RealEstate"]
+SNAPSHOT_HEADLINES = 3
+SNAPSHOT_RELOAD_SECONDS = float(os.getenv("SENTIMENT_SNAPSHOT_RELOAD_SECONDS", "60"))
+
+_snapshots: Dict[str, AssetSentiment] = {}
+_snapshots_checked_at = 0.0
+_snapshots_lock = threading.Lock()
+
+
+def refresh_asset_sentiment(assets: List[str] = SENTIMENT_ASSETS, sentiment_llm=None) -> Dict[str, AssetSentiment]:
+    """
+    Score each asset's latest headlines and store the averaged snapshot.
+    Snapshots with a headline that could not be scored are returned but not
+    stored, so the next read tries again.
+    """
+    sentiment_llm = sentiment_llm or load_llm_sentiment()
+    llm_id = model_id(sentiment_llm)
+    rows = get_latest_news_rows(assets, limit=SNAPSHOT_HEADLINES)
+    latest_ids = get_latest_news_ids(assets)
+    news_by_asset = {asset: [h for _, h in rows[asset]] for asset in assets if rows.get(asset)}
+    sentiment = analyze_sentiment_batch(news_by_asset, sentiment_llm) if news_by_asset else {}
+
+    hashes = [headline_hash(h) for headlines in news_by_asset.values() for h in headlines]
+    scored = get_cached_sentiments(hashes, llm_id, SENTIMENT_PROMPT_VERSION) if hashes else {}
+    now = datetime.datetime.utcnow().isoformat(timespec="seconds")
+
+    snapshots, complete = {}, []
+    for asset in assets:
+        avg_score, details = sentiment.get(asset, (0.0, ""))
+        snapshots[asset] = AssetSentiment(
+            asset=asset, avg_score=avg_score, details=details,
+            headline_ids=[news_id for news_id, _ in rows.get(asset, [])],
+            latest_news_id=latest_ids.get(asset), model_id=llm_id,
+            prompt_version=SENTIMENT_PROMPT_VERSION, computed_at=now,
+        )
+        if all(headline_hash(h) in scored for h in news_by_asset.get(asset, [])):
+            complete.append(snapshots[asset])
+
+    store_asset_sentiments([snapshot.model_dump() for snapshot in complete])
+    with _snapshots_lock:
+        _snapshots.update({snapshot.asset: snapshot for snapshot in complete})
+    return snapshots
+
+
+def get_asset_sentiment(assets: List[str] = SENTIMENT_ASSETS) -> Dict[str, AssetSentiment]:
+    """
+    Current snapshot per asset. Served from memory; at most every
+    SNAPSHOT_RELOAD_SECONDS the stored snapshots are re-read and checked against
+    the newest news ids, and only stale or missing assets are recomputed
+    (once, however many sessions ask at the same time).
+    """
+    global _snapshots_checked_at
+    with _snapshots_lock:
+        if (time.monotonic() - _snapshots_checked_at < SNAPSHOT_RELOAD_SECONDS
+                and all(asset in _snapshots for asset in assets)):
+            return {asset: _snapshots[asset] for asset in assets}
+
+    llm_id = model_id(load_llm_sentiment())
+    latest_ids = get_latest_news_ids(assets)
+    current = {}
+    for asset, row in get_asset_sentiments(assets).items():
+        snapshot = AssetSentiment(**row)
+        if (snapshot.latest_news_id == latest_ids.get(asset) and snapshot.model_id == llm_id
+                and snapshot.prompt_version == SENTIMENT_PROMPT_VERSION):
+            current[asset] = snapshot
+
+    stale = [asset for asset in assets if asset not in current]
+    if stale:
+        current.update(get_group("asset_sentiment").do((llm_id, tuple(stale)), refresh_asset_sentiment, stale))
+
+    with _snapshots_lock:
+        _snapshots.update({asset: snapshot for asset, snapshot in current.items() if asset not in stale})
+        _snapshots_checked_at = time.monotonic()
+    return {asset: current[asset] for asset in assets}
+
 
 # -----------------------------
 # Adjust Portfolio
 # -----------------------------
 def adjust_portfolio(profile: UserProfile, base_alloc: Dict[str, float]) -> AdjustmentResult:
-    sentiment_model = load_llm_sentiment()
-
     adjusted = base_alloc.copy()
     full_summary = []
 
-    for asset in ["Stocks", "Gold", "Crypto","RealEstate"]:
-        news = get_latest_news(asset, limit=3)
-        if not news:
+    # Precomputed per-asset sentiment: a lookup, recomputed only when the news changed
+    for asset, snapshot in get_asset_sentiment(SENTIMENT_ASSETS).items():
+        if not snapshot.headline_ids:
             continue
-
-        avg_score, details = analyze_sentiment(asset, news, sentiment_model)
-        full_summary.append(f"### {asset}\n{details}")
+        avg_score = snapshot.avg_score
+        full_summary.append(f"### {asset}\n{snapshot.details}")
 
         if avg_score > 0.2:   # bullish
             adjusted[asset] = round(adjusted.get(asset, 0.0) + 0.05, 2)
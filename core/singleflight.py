@@ -0,0 +1,132 @@
+# singleflight.py
+# Request coalescing: concurrent callers asking for the same key share one
+# in-flight computation instead of each hitting the upstream (Yahoo, Groq).
+# The first caller (the leader) runs the work; callers arriving while it runs
+# wait for and receive the same result, or the same exception. Nothing is
+# kept once the call completes; that is left to the caches behind it.
+#
+#   info = get_group("stock").do(ticker, fetch_snapshot, ticker)
+
+import threading
+from typing import Any, Callable, Dict, Hashable, Optional, Tuple
+
+
+class Flight:
+    """One in-flight computation for a key."""
+
+    def __init__(self, group: "SingleFlight", key: Hashable):
+        self.group = group
+        self.key = key
+        self._done = threading.Event()
+        self._result: Any = None
+        self._error: Optional[BaseException] = None
+
+    def finish(self, result: Any):
+        self._result = result
+        self._complete()
+
+    def fail(self, error: BaseException):
+        self._error = error
+        self._complete()
+
+    def _complete(self):
+        self.group._release(self.key, self)
+        self._done.set()
+
+    @property
+    def done(self) -> bool:
+        return self._done.is_set()
+
+    def wait(self, timeout: Optional[float] = None) -> Any:
+        """Result of the leader's computation (re-raises its exception)."""
+        if not self._done.wait(timeout):
+            raise TimeoutError(f"Timed out waiting for in-flight '{self.key}'")
+        if self._error is not None:
+            raise self._error
+        return self._result
+
+
+class SingleFlight:
+    def __init__(self, name: str = ""):
+        self.name = name
+        self._lock = threading.Lock()
+        self._flights: Dict[Hashable, Flight] = {}
+        self.stats = {"calls": 0, "executed": 0, "coalesced": 0}
+
+    def join(self, key: Hashable) -> Tuple[Flight, bool]:
+        """
+        (flight, is_leader). The leader must call flight.finish() or flight.fail()
+        exactly once; everyone else calls flight.wait().
+        """
+        with self._lock:
+            self.stats["calls"] += 1
+            flight = self._flights.get(key)
+            if flight is not None:
+                self.stats["coalesced"] += 1
+                return flight, False
+            flight = Flight(self, key)
+            self._flights[key] = flight
+            self.stats["executed"] += 1
+            return flight, True
+
+    def _release(self, key: Hashable, flight: Flight):
+        with self._lock:
+            if self._flights.get(key) is flight:
+                del self._flights[key]
+
+    def do(self, key: Hashable, fn: Callable[..., Any], *args, **kwargs) -> Any:
+        """Run fn(*args, **kwargs) once per key among concurrent callers and share the outcome."""
+        flight, leader = self.join(key)
+        if not leader:
+            return flight.wait()
+        try:
+            result = fn(*args, **kwargs)
+        except BaseException as e:
+            flight.fail(e)
+            raise
+        flight.finish(result)
+        return result
+
+    def in_flight(self) -> int:
+        with self._lock:
+            return len(self._flights)
+
+
+# -----------------------------
+# Named groups (one per upstream)
+# -----------------------------
+_groups: Dict[str, SingleFlight] = {}
+_groups_lock = threading.Lock()
+
+
+def get_group(name: str) -> SingleFlight:
+    with _groups_lock:
+        if name not in _groups:
+            _groups[name] = SingleFlight(name)
+        return _groups[name]
+
+
+def singleflight_stats() -> Dict[str, Dict[str, int]]:
+    with _groups_lock:
+        return {name: dict(group.stats) for name, group in _groups.items()}
+
+
+# -----------------------------
+# Example usage
+# -----------------------------
+if __name__ == "__main__":
+    import time
+    from concurrent.futures import ThreadPoolExecutor
+
+    calls = []
+
+    def slow_fetch(ticker):
+        calls.append(ticker)
+        time.sleep(0.5)
+        return f"{ticker} snapshot"
+
+    group = get_group("demo")
+    with ThreadPoolExecutor(max_workers=20) as pool:
+        results = list(pool.map(lambda _: group.do("TSLA", slow_fetch, "TSLA"), range(20)))
+    print(results[:3], "... upstream calls:", len(calls))
+    print(singleflight_stats())
@@ -1,6 +1,12 @@
 from pydantic import BaseModel, Field
-from typing import Dict, List, Optional
+from typing import Dict, List, Optional, Protocol
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+import json
+import os
+import pandas as pd
 import yfinance as yf
+from db.pricecache import get_close_histories
 
 # -------------------------
 # Stock Info Schema
@@ -35,39 +41,130 @@ ASSET_CLASS_STOCKS = {
 }
 
 
+# -------------------------
+# Price Providers
+# -------------------------
+METADATA_WORKERS = 8  # bounded pool for per-ticker `.info` lookups
+
+
+class PriceProvider(Protocol):
+    def history(self, tickers: List[str], days: int = 365) -> Dict[str, pd.Series]:
+        """Daily closes per ticker (tickers without data are omitted)."""
+        ...
+
+    def name(self, ticker: str) -> str:
+        ...
+
+
+@lru_cache(maxsize=512)
+def _yahoo_long_name(ticker: str) -> str:
+    try:
+        return yf.Ticker(ticker).info.get("longName", ticker)
+    except Exception as e:
+        print(f"Error fetching metadata for {ticker}: {e}")
+        return ticker
+
+
+class YahooProvider:
+    """
+    Serves history from the local price cache (db/pricecache); stale tickers
+    are refreshed together in one batched yf.download call.
+    """
+
+    def history(self, tickers: List[str], days: int = 365) -> Dict[str, pd.Series]:
+        return get_close_histories(tickers, days=days)
+
+    def name(self, ticker: str) -> str:
+        return _yahoo_long_name(ticker)
+
+
+class FixtureProvider:
+    """
+    Offline provider backed by a dict or JSON file of the form
+    {"AAPL": {"name": "Apple Inc.", "closes": [189.1, 190.4, ...]}, ...}
+    """
+
+    def __init__(self, fixtures: Dict[str, Dict]):
+        self.fixtures = fixtures
+
+    @classmethod
+    def from_json(cls, path: str) -> "FixtureProvider":
+        with open(path, encoding="utf-8") as f:
+            return cls(json.load(f))
+
+    def history(self, tickers: List[str], days: int = 365) -> Dict[str, pd.Series]:
+        return {t: pd.Series(self.fixtures[t]["closes"], dtype=float)
+                for t in tickers if self.fixtures.get(t, {}).get("closes")}
+
+    def name(self, ticker: str) -> str:
+        return self.fixtures.get(ticker, {}).get("name", ticker)
+
+
+def get_default_provider() -> PriceProvider:
+    """Use STOCK_FIXTURES_FILE for offline runs, otherwise Yahoo Finance."""
+    fixtures = os.getenv("STOCK_FIXTURES_FILE")
+    return FixtureProvider.from_json(fixtures) if fixtures else YahooProvider()
+
+
 # -------------------------
 # Helper: Fetch stock info from Yahoo Finance
 # -------------------------
-def fetch_stock_info(ticker: str) -> StockInfo:
-    data = yf.Ticker(ticker)
-    price = data.history(period="1d")["Close"][-1]
-    
+def _build_stock_info(ticker: str, name: str, hist: pd.Series) -> StockInfo:
+    price = hist.iloc[-1]  # current price = last daily bar
+
     # Calculate simple 1-year historical return
-    hist = data.history(period="1y")["Close"]
     if len(hist) > 1:
-        expected_return = (hist[-1] - hist[0]) / hist[0] * 100
+        expected_return = (hist.iloc[-1] - hist.iloc[0]) / hist.iloc[0] * 100
         risk_score = hist.pct_change().std() * 100  # simple volatility %
     else:
         expected_return = None
         risk_score = None
-    
+
     return StockInfo(
         ticker=ticker,
-        name=data.info.get("longName", ticker),
+        name=name,
         current_price=round(price, 2),
         expected_return_1yr=round(expected_return, 2) if expected_return else None,
         risk_score=round(risk_score, 2) if risk_score else None
     )
 
 
+def fetch_stock_infos(tickers: List[str], provider: Optional[PriceProvider] = None) -> Dict[str, StockInfo]:
+    """
+    Fetch many tickers at once: one bulk history download plus metadata
+    lookups on a bounded thread pool. Tickers without price data are skipped.
+    """
+    provider = provider or get_default_provider()
+    tickers = list(dict.fromkeys(tickers))
+    closes = provider.history(tickers, days=365)
+    found = [t for t in tickers if t in closes]
+    for t in tickers:
+        if t not in closes:
+            print(f"No price data for {t}")
+
+    if not found:
+        return {}
+    with ThreadPoolExecutor(max_workers=min(METADATA_WORKERS, len(found))) as pool:
+        names = dict(zip(found, pool.map(provider.name, found)))
+
+    return {t: _build_stock_info(t, names[t], closes[t]) for t in found}
+
+
+def fetch_stock_info(ticker: str, provider: Optional[PriceProvider] = None) -> Optional[StockInfo]:
+    return fetch_stock_infos([ticker], provider).get(ticker)
+
+
 # -------------------------
 # Main Recommendation Function
 # -------------------------
-def recommend_stocks(portfolio_allocation: Dict[str, float]) -> PortfolioStockRecommendation:
+def recommend_stocks(portfolio_allocation: Dict[str, float], provider: Optional[PriceProvider] = None) -> PortfolioStockRecommendation:
+    all_tickers = [t for asset_class in portfolio_allocation for t in ASSET_CLASS_STOCKS.get(asset_class, [])]
+    infos = fetch_stock_infos(all_tickers, provider)
+
     recommendations = []
     for asset_class, amount in portfolio_allocation.items():
         tickers = ASSET_CLASS_STOCKS.get(asset_class, [])
-        stocks = [fetch_stock_info(t) for t in tickers]
+        stocks = [infos[t] for t in tickers if t in infos]
         recommendations.append(StockRecommendation(
             asset_class=asset_class,
             suggested_stocks=stocks
@@ -0,0 +1,223 @@
+# ticker_resolver.py
+# Maps company names / tickers ("Tesla", "aapl", "hdfc bank") to Yahoo symbols.
+# Order: in-process LRU -> local symbol/alias index (exact, then fuzzy)
+#        -> on-disk cache of past resolutions -> yahooquery.search (network).
+
+import csv
+import datetime
+import difflib
+import os
+import re
+import sqlite3
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Dict, Optional
+
+from yahooquery import search
+
+from db.connection import ensure_schema, get_connection, transaction
+from db.newsdb import DB_FILE
+from core.singleflight import get_group
+
+SYMBOL_LISTING_FILE = os.getenv(
+    "SYMBOL_LISTING_FILE", str(Path(__file__).resolve().parent.parent / "db" / "symbols.csv")
+)
+FUZZY_CUTOFF = 0.85
+
+# Corporate suffixes dropped before name matching ("Apple Inc." == "apple")
+_SUFFIXES = re.compile(
+    r"\b(inc|incorporated|corp|corporation|co|company|ltd|limited|plc|llc|sa|ag|nv|"
+    r"holdings?|group|the|class [ab])\b"
+)
+
+
+# -----------------------------
+# Normalization
+# -----------------------------
+def normalize_name(name: str) -> str:
+    name = name.lower().replace("&", " and ")
+    name = re.sub(r"[^a-z0-9 ]", " ", name)
+    name = _SUFFIXES.sub(" ", name)
+    return " ".join(name.split())
+
+
+def _clean_symbol(text: str) -> str:
+    return re.sub(r"[^A-Z0-9.=^&-]", "", text.upper().strip())
+
+
+def _clean_search_query(text: str) -> str:
+    """Remove $ and non-alphanumeric characters (same cleaning as company_stock.clean_input)"""
+    return re.sub(r'[^A-Z0-9 .&]', '', text.upper().strip())
+
+
+# -----------------------------
+# Local symbol index
+# -----------------------------
+class SymbolIndex:
+    """In-memory symbol + alias index loaded from a CSV listing (symbol,name,aliases)."""
+
+    def __init__(self, path: str = SYMBOL_LISTING_FILE):
+        self.symbols: set = set()
+        self.by_name: Dict[str, str] = {}
+        self.load(path)
+
+    def load(self, path: str):
+        symbols, by_name = set(), {}
+        if os.path.exists(path):
+            with open(path, encoding="utf-8", newline="") as f:
+                for row in csv.DictReader(f):
+                    symbol = row["symbol"].strip().upper()
+                    symbols.add(symbol)
+                    for alias in [row.get("name", "")] + (row.get("aliases") or "").split("|"):
+                        key = normalize_name(alias)
+                        if key:
+                            by_name.setdefault(key, symbol)
+        self.symbols, self.by_name = symbols, by_name
+        self._names = list(by_name)
+
+    def lookup(self, query: str) -> Optional[str]:
+        symbol = _clean_symbol(query)
+        if " " not in query.strip() and symbol in self.symbols:
+            return symbol
+
+        key = normalize_name(query)
+        if not key:
+            return None
+        if key in self.by_name:
+            return self.by_name[key]
+
+        match = difflib.get_close_matches(key, self._names, n=1, cutoff=FUZZY_CUTOFF)
+        return self.by_name[match[0]] if match else None
+
+
+_index: Optional[SymbolIndex] = None
+_index_lock = threading.Lock()
+
+
+def get_symbol_index() -> SymbolIndex:
+    global _index
+    if _index is None:
+        with _index_lock:
+            if _index is None:
+                _index = SymbolIndex()
+    return _index
+
+
+def reload_symbol_index(path: str = SYMBOL_LISTING_FILE):
+    """Reload a refreshed listing file and drop memoized resolutions."""
+    global _index
+    with _index_lock:
+        _index = SymbolIndex(path)
+    with _memo_lock:
+        _memo.clear()
+
+
+# -----------------------------
+# On-disk resolution cache
+# -----------------------------
+def _create_resolution_table(conn: sqlite3.Connection):
+    conn.execute("""CREATE TABLE IF NOT EXISTS ticker_resolution (
+                    query TEXT PRIMARY KEY,
+                    symbol TEXT,
+                    resolved_at TEXT
+                )""")
+
+
+def init_resolution_cache():
+    ensure_schema(DB_FILE, "ticker_resolution", _create_resolution_table)
+
+
+def _cached_resolution(key: str) -> Optional[str]:
+    init_resolution_cache()
+    row = get_connection(DB_FILE).execute("SELECT symbol FROM ticker_resolution WHERE query=?", (key,)).fetchone()
+    return row[0] if row else None
+
+
+def _store_resolution(key: str, symbol: str):
+    init_resolution_cache()
+    with transaction(DB_FILE) as conn:
+        conn.execute("INSERT OR REPLACE INTO ticker_resolution (query, symbol, resolved_at) VALUES (?, ?, ?)",
+                     (key, symbol, datetime.datetime.utcnow().isoformat()))
+
+
+# -----------------------------
+# Network fallback
+# -----------------------------
+def search_yahoo(company_name: str) -> Optional[str]:
+    """yahooquery search; concurrent identical queries share one request."""
+    query = _clean_search_query(company_name)
+    return get_group("ticker_search").do(query, _search_yahoo, query)
+
+
+def _search_yahoo(query: str) -> Optional[str]:
+    results = search(query)
+    quotes = results.get('quotes', []) if isinstance(results, dict) else []
+    if not quotes:
+        return None
+    for q in quotes:
+        if q.get('quoteType') == 'EQUITY':
+            return q['symbol']
+    return quotes[0]['symbol']  # fallback
+
+
+# -----------------------------
+# Resolver
+# -----------------------------
+MEMO_SIZE = 4096
+_memo: "OrderedDict[str, str]" = OrderedDict()  # LRU of successful resolutions
+_memo_lock = threading.Lock()
+
+
+def _remember(company_name: str, symbol: str) -> str:
+    with _memo_lock:
+        _memo[company_name] = symbol
+        _memo.move_to_end(company_name)
+        if len(_memo) > MEMO_SIZE:
+            _memo.popitem(last=False)
+    return symbol
+
+
+def resolve_ticker(company_name: str, allow_network: bool = True) -> Optional[str]:
+    """Resolve a company name or ticker to a Yahoo symbol, hitting the network only on a miss."""
+    with _memo_lock:
+        symbol = _memo.get(company_name)
+        if symbol:
+            _memo.move_to_end(company_name)
+            return symbol
+
+    symbol = get_symbol_index().lookup(company_name)
+    if symbol:
+        return _remember(company_name, symbol)
+
+    key = normalize_name(company_name) or company_name.strip().lower()
+    try:
+        symbol = _cached_resolution(key)
+    except sqlite3.Error as e:
+        print(f"Ticker cache read failed: {e}")
+        symbol = None
+    if symbol:
+        return _remember(company_name, symbol)
+    if not allow_network:
+        return None
+
+    symbol = search_yahoo(company_name)
+    if symbol:
+        try:
+            _store_resolution(key, symbol)
+        except sqlite3.Error as e:
+            print(f"Ticker cache write failed: {e}")
+        _remember(company_name, symbol)
+    return symbol
+
+
+# -----------------------------
+# Example usage
+# -----------------------------
+if __name__ == "__main__":
+    import time
+
+    for name in ["Tesla", "aapl", "Apple Inc", "HDFC Bank", "microsft", "bitcoin"]:
+        start = time.perf_counter()
+        symbol = resolve_ticker(name, allow_network=False)
+        print(f"{name!r} -> {symbol} ({(time.perf_counter() - start) * 1e6:.0f} µs)")
@@ -1,5 +1,5 @@
 # userInfo.py
-from typing import Optional, Literal
+from typing import Dict, List, Optional, Literal
 from pydantic import BaseModel, Field, ValidationError
 from langchain_google_genai import ChatGoogleGenerativeAI
 from langchain.schema import HumanMessage, SystemMessage
@@ -8,6 +8,7 @@ import re
 import os
 from dotenv import load_dotenv
 from core.llm import get_llm  
+from core.profile_extractor import FIELDS, extract_profile_fields, unresolved_fields
 # from llm import get_llm  
 
 
@@ -32,12 +33,30 @@ class UserProfile(BaseModel):
 
 
 # -----------------------------
-# LLM setup (Gemini)
+# LLM setup (shared client from core.llm)
 # -----------------------------
-llm = get_llm()
 parser = PydanticOutputParser(pydantic_object=UserProfile)
 
 
+# Locally parsed fields below this confidence are sent to the LLM
+PROFILE_FIELD_CONFIDENCE = float(os.getenv("PROFILE_FIELD_CONFIDENCE", "0.8"))
+
+FIELD_SCHEMA = {
+    "age": "int | null",
+    "monthly_income": "float | null",
+    "risk_tolerance": '"Conservative" | "Moderate" | "Aggressive" | null',
+    "investment_goal": "string | null",
+    "investment_horizon_years": "int | null",
+}
+
+
+class ProfileExtraction(BaseModel):
+    profile: UserProfile
+    confidence: Dict[str, float] = Field(default_factory=dict, description="Per-field confidence of the value")
+    sources: Dict[str, Literal["rules", "llm"]] = Field(default_factory=dict, description="Where each value came from")
+    llm_fields: List[str] = Field(default_factory=list, description="Fields the LLM was asked for")
+
+
 # -----------------------------
 # Extract structured info
 # -----------------------------
@@ -45,16 +64,42 @@ def extract_user_profile(user_query: str) -> UserProfile:
     """
     Extract structured user profile attributes from free-text query.
     """
+    return extract_user_profile_detailed(user_query).profile
+
+
+def extract_user_profile_detailed(user_query: str, min_confidence: float = None, use_llm: bool = True) -> ProfileExtraction:
+    """
+    Parse profile fields locally (core.profile_extractor) and call the LLM only
+    for fields the query mentions but that could not be parsed with `min_confidence`.
+    """
+    min_confidence = PROFILE_FIELD_CONFIDENCE if min_confidence is None else min_confidence
+    found = extract_profile_fields(user_query)
+
+    values = {name: match.value for name, match in found.items()}
+    confidence = {name: match.confidence for name, match in found.items()}
+    sources = {name: "rules" for name in found}
+
+    llm_fields = unresolved_fields(user_query, found, min_confidence) if use_llm else []
+    if llm_fields:
+        llm_values = extract_fields_with_llm(user_query, llm_fields)
+        for name in llm_fields:
+            if llm_values.get(name) is not None:
+                values[name] = llm_values[name]
+                confidence[name] = min_confidence
+                sources[name] = "llm"
+
+    return ProfileExtraction(profile=UserProfile(**values), confidence=confidence, sources=sources, llm_fields=llm_fields)
+
+
+def extract_fields_with_llm(user_query: str, fields: List[str] = FIELDS) -> Dict[str, object]:
+    """
+    LLM extraction restricted to `fields`. Returns {} on any failure.
+    """
+    schema = ",\n".join(f'  "{name}": {FIELD_SCHEMA[name]}' for name in fields)
     system_prompt = (
         "You are a financial assistant that extracts structured user profile information "
         "from free-text queries. Always output valid JSON ONLY that matches this schema:\n"
-        "{\n"
-        '  "age": int | null,\n'
-        '  "monthly_income": float | null,\n'
-        '  "risk_tolerance": "Conservative" | "Moderate" | "Aggressive" | null,\n'
-        '  "investment_goal": string | null,\n'
-        '  "investment_horizon_years": int | null\n'
-        "}\n\n"
+        "{\n" + schema + "\n}\n\n"
         "If info is missing, set it as null."
     )
 
@@ -64,27 +109,14 @@ def extract_user_profile(user_query: str) -> UserProfile:
     ]
 
     try:
-        raw_response = llm.invoke(messages)
-        raw_text = raw_response.content.strip()
-
-        # # Strip ```json fences if present
-        # match = re.search(r"\{.*\}", raw_text, re.DOTALL)
-        # cleaned = match.group(0) if match else raw_text
-
-        # profile = UserProfile.model_validate_json(cleaned)
+        raw_response = get_llm(site="profile").invoke(messages)
         profile: UserProfile = parser.parse(raw_response.content)
-        return profile
-
-    except ValidationError as ve:
-        return UserProfile(
-            age=None,
-            monthly_income=None,
-            risk_tolerance=None,
-            investment_goal=None,
-            investment_horizon_years=None
-        )
+        return {name: getattr(profile, name) for name in fields}
+
+    except ValidationError:
+        return {}
     except Exception:
-        return UserProfile()
+        return {}
 
 
 # -----------------------------
@@ -100,6 +132,7 @@ if __name__ == "__main__":
 
     for q in queries:
         print(f"Query: {q}")
-        profile = extract_user_profile(q)
-        print(profile.model_dump())
+        result = extract_user_profile_detailed(q)
+        print(result.profile.model_dump())
+        print("sources:", result.sources, "| asked LLM for:", result.llm_fields)
         print("-" * 40)
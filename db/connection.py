@@ -0,0 +1,95 @@
+# connection.py
+# Shared SQLite access: one long-lived connection per (thread, database file)
+# instead of a connect/close around every query. Connections run in WAL mode
+# so readers don't block the writer, keep a prepared-statement cache, and wait
+# on a busy database instead of failing. Schemas are applied once per file.
+#
+#   conn = get_connection(DB_FILE)
+#   rows = conn.execute("SELECT ...", params).fetchall()
+#   with transaction(DB_FILE) as conn:
+#       conn.executemany("INSERT ...", rows)
+
+import os
+import sqlite3
+import threading
+import weakref
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator
+
+BUSY_TIMEOUT_SECONDS = float(os.getenv("SQLITE_BUSY_TIMEOUT", "10"))
+STATEMENT_CACHE_SIZE = 256
+
+class _ThreadConnections(dict):
+    """{path: connection} for one thread; dropped (and its connections closed) when the thread exits."""
+
+    __hash__ = object.__hash__  # identity, so the registry can hold it weakly
+
+
+_local = threading.local()
+_registry: "weakref.WeakSet[_ThreadConnections]" = weakref.WeakSet()
+_registry_lock = threading.Lock()
+_schemas_ready: Dict[str, set] = {}
+_generation = 0  # bumped by close_connections() so every thread reopens
+
+
+def _open(path: str) -> sqlite3.Connection:
+    # check_same_thread=False only so close_connections() can close it from another thread;
+    # each connection is otherwise used by the thread that opened it
+    conn = sqlite3.connect(path, timeout=BUSY_TIMEOUT_SECONDS, cached_statements=STATEMENT_CACHE_SIZE,
+                           check_same_thread=False)
+    if path != ":memory:":
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")  # durable at checkpoints; safe with WAL
+    return conn
+
+
+def get_connection(path: str) -> sqlite3.Connection:
+    """This thread's connection to `path`, opened on first use and reused afterwards."""
+    connections = getattr(_local, "connections", None)
+    if connections is None or _local.generation != _generation:
+        connections = _local.connections = _ThreadConnections()
+        _local.generation = _generation
+        with _registry_lock:
+            _registry.add(connections)
+    conn = connections.get(path)
+    if conn is None:
+        conn = connections[path] = _open(path)
+    return conn
+
+
+@contextmanager
+def transaction(path: str) -> Iterator[sqlite3.Connection]:
+    """Commit on success, roll back on error."""
+    conn = get_connection(path)
+    with conn:
+        yield conn
+
+
+def ensure_schema(path: str, name: str, create: Callable[[sqlite3.Connection], None]):
+    """Run `create(conn)` once per process for each (database file, schema name)."""
+    ready = _schemas_ready.setdefault(path, set())
+    if name in ready:
+        return
+    with transaction(path) as conn:
+        create(conn)
+    ready.add(name)
+
+
+def placeholders(n: int) -> str:
+    return ",".join("?" * n)
+
+
+def close_connections():
+    """Close every pooled connection (all threads), e.g. before deleting or vacuuming a file."""
+    global _generation
+    with _registry_lock:
+        _generation += 1
+        for connections in list(_registry):
+            for conn in list(connections.values()):
+                try:
+                    conn.close()
+                except sqlite3.Error:
+                    pass
+            connections.clear()
+        _registry.clear()
+        _schemas_ready.clear()
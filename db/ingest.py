@@ -0,0 +1,314 @@
+# ingest.py
+# Background ingestion that keeps market_data.db fresh so request-time code only
+# reads precomputed data. On a schedule it pulls news (NewsAPI) and daily prices
+# (AlphaVantage) for every asset class, refreshes the Yahoo bars of the tracked
+# tickers, and pre-scores sentiment for the newest headlines (refreshing the
+# per-asset snapshots adjust_portfolio reads).
+#
+# - bounded concurrency: jobs run on a fixed-size thread pool
+# - per-source rate limiting: one RateLimiter per upstream
+# - retries: exponential backoff on network errors, throttling and 5xx; API error
+#   replies (bad symbol, invalid key) fail fast and wait a full interval
+# - checkpointing: each job's last success is stored, so a restarted daemon
+#   only runs what is due and news is fetched from the last success onwards
+#
+#   python -m db.ingest            # run forever
+#   python -m db.ingest --once     # run the due jobs once and exit
+
+import argparse
+import datetime
+import os
+import re
+import sqlite3
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Optional
+
+import requests
+
+from core.ratelimit import RateLimiter, retry_with_backoff
+from db.connection import ensure_schema, get_connection, transaction
+from db.newsdb import (ALPHAVANTAGE_KEY, DB_FILE, NEWSAPI_KEY, UpstreamThrottled, fetch_and_store_news,
+                       fetch_and_store_prices, get_latest_news_multi)
+
+# Asset classes: NewsAPI query and an AlphaVantage-listed proxy symbol for daily prices
+ASSET_SOURCES = {
+    "Stocks": {"query": "stock market", "symbol": "SPY"},
+    "Gold": {"query": "gold price", "symbol": "GLD"},
+    "Crypto": {"query": "bitcoin OR cryptocurrency", "symbol": "BITO"},
+    "RealEstate": {"query": "real estate market", "symbol": "VNQ"},
+}
+
+# Seconds between runs of each job kind. Yahoo bars are refreshed well inside
+# PRICE_CACHE_MAX_AGE_MINUTES so request-time reads never have to download.
+NEWS_INTERVAL = float(os.getenv("INGEST_NEWS_INTERVAL", str(30 * 60)))
+PRICES_INTERVAL = float(os.getenv("INGEST_PRICES_INTERVAL", str(6 * 3600)))
+TICKERS_INTERVAL = float(os.getenv("INGEST_TICKERS_INTERVAL", str(30 * 60)))
+
+# Requests per minute per upstream (0 = unlimited)
+SOURCE_RPM = {
+    "newsapi": float(os.getenv("NEWSAPI_RPM", "30")),
+    "alphavantage": float(os.getenv("ALPHAVANTAGE_RPM", "5")),  # free tier limit
+    "yahoo": float(os.getenv("YAHOO_RPM", "30")),
+}
+
+INGEST_WORKERS = int(os.getenv("INGEST_WORKERS", "4"))
+INGEST_RETRIES = int(os.getenv("INGEST_RETRIES", "3"))
+INGEST_BACKOFF_SECONDS = float(os.getenv("INGEST_BACKOFF_SECONDS", "2"))
+SCORE_LATEST_HEADLINES = 10  # per asset; covers what adjust_portfolio reads
+
+
+# -----------------------------
+# Checkpoints
+# -----------------------------
+def _create_checkpoints(conn: sqlite3.Connection):
+    conn.execute("""CREATE TABLE IF NOT EXISTS ingest_checkpoints (
+                    job TEXT PRIMARY KEY,
+                    last_success TEXT,
+                    last_attempt TEXT,
+                    last_error TEXT,
+                    rows INTEGER,
+                    failures INTEGER DEFAULT 0,
+                    retryable INTEGER DEFAULT 1
+                )""")
+    columns = {row[1] for row in conn.execute("PRAGMA table_info(ingest_checkpoints)")}
+    if "retryable" not in columns:
+        conn.execute("ALTER TABLE ingest_checkpoints ADD COLUMN retryable INTEGER DEFAULT 1")
+
+
+def get_checkpoints() -> Dict[str, dict]:
+    ensure_schema(DB_FILE, "ingest_checkpoints", _create_checkpoints)
+    rows = get_connection(DB_FILE).execute(
+        "SELECT job, last_success, last_attempt, last_error, rows, failures, retryable FROM ingest_checkpoints"
+    ).fetchall()
+    return {r[0]: {"last_success": r[1], "last_attempt": r[2], "last_error": r[3], "rows": r[4], "failures": r[5],
+                   "retryable": bool(r[6])}
+            for r in rows}
+
+
+def _save_checkpoint(job: str, rows: Optional[int] = None, error: Optional[str] = None, retryable: bool = True):
+    ensure_schema(DB_FILE, "ingest_checkpoints", _create_checkpoints)
+    now = datetime.datetime.utcnow().isoformat(timespec="seconds")
+    with transaction(DB_FILE) as conn:
+        if error is None:
+            conn.execute("""INSERT INTO ingest_checkpoints (job, last_success, last_attempt, last_error, rows, failures)
+                            VALUES (?, ?, ?, NULL, ?, 0)
+                            ON CONFLICT(job) DO UPDATE SET last_success=excluded.last_success,
+                                last_attempt=excluded.last_attempt, last_error=NULL, rows=excluded.rows, failures=0,
+                                retryable=1""",
+                         (job, now, now, rows))
+        else:
+            conn.execute("""INSERT INTO ingest_checkpoints (job, last_attempt, last_error, failures, retryable)
+                            VALUES (?, ?, ?, 1, ?)
+                            ON CONFLICT(job) DO UPDATE SET last_attempt=excluded.last_attempt,
+                                last_error=excluded.last_error, failures=ingest_checkpoints.failures + 1,
+                                retryable=excluded.retryable""",
+                         (job, now, error, int(retryable)))
+
+
+# -----------------------------
+# Jobs
+# -----------------------------
+@dataclass
+class IngestJob:
+    name: str
+    source: str  # key into the daemon's rate limiters
+    interval: float  # seconds between successful runs
+    run: Callable[[Optional[str]], int]  # last_success (or None) -> rows written
+
+
+def _is_retryable(error: Exception) -> bool:
+    """
+    Connection errors, timeouts, HTTP 429 / 5xx and AlphaVantage throttling replies
+    are retried. Everything else (other HTTP errors, API error replies such as a bad
+    symbol or invalid key, local database or programming errors) fails fast.
+    """
+    if isinstance(error, (requests.ConnectionError, requests.Timeout, UpstreamThrottled)):
+        return True
+    if isinstance(error, requests.HTTPError) and error.response is not None:
+        status = error.response.status_code
+        return status == 429 or status >= 500
+    return False
+
+
+def redact(message: str) -> str:
+    return re.sub(r"(api_?key=)[^&\s]+", r"\1***", message, flags=re.IGNORECASE)
+
+
+def tracked_tickers() -> List[str]:
+    """Tickers recommend_stocks draws from, plus any in INGEST_TICKERS (comma-separated)."""
+    from core.stocks import ASSET_CLASS_STOCKS
+
+    tickers = [t for symbols in ASSET_CLASS_STOCKS.values() for t in symbols]
+    tickers += [t.strip().upper() for t in os.getenv("INGEST_TICKERS", "").split(",") if t.strip()]
+    return list(dict.fromkeys(tickers))
+
+
+def default_jobs(newsapi_key: Optional[str] = NEWSAPI_KEY, alphavantage_key: Optional[str] = ALPHAVANTAGE_KEY,
+                 tickers: Optional[List[str]] = None) -> List[IngestJob]:
+    """News and prices per asset class (when the API key is set) and one Yahoo refresh for the tracked tickers."""
+    jobs = []
+    for asset, source in ASSET_SOURCES.items():
+        if newsapi_key:
+            jobs.append(IngestJob(f"news:{asset}", "newsapi", NEWS_INTERVAL,
+                                  lambda since, a=asset, q=source["query"]: fetch_and_store_news(a, newsapi_key, q, since)))
+        if alphavantage_key:
+            jobs.append(IngestJob(f"prices:{asset}", "alphavantage", PRICES_INTERVAL,
+                                  lambda since, a=asset, s=source["symbol"]: fetch_and_store_prices(a, s, alphavantage_key)))
+    if not newsapi_key:
+        print("⚠️ NEWSAPI_KEY not set; skipping news ingestion")
+    if not alphavantage_key:
+        print("⚠️ ALPHAVANTAGE_KEY not set; skipping asset-class price ingestion")
+
+    tickers = tracked_tickers() if tickers is None else tickers
+    if tickers:
+        jobs.append(IngestJob("yahoo:tickers", "yahoo", TICKERS_INTERVAL, lambda since: _refresh_tickers(tickers)))
+    return jobs
+
+
+def _refresh_tickers(tickers: List[str]) -> int:
+    from db.pricecache import refresh_prices
+
+    refresh_prices(tickers, max_age_minutes=0)
+    return len(tickers)
+
+
+def prescore_sentiment(assets: List[str], limit: int = SCORE_LATEST_HEADLINES) -> int:
+    """
+    Score the newest headlines per asset (cached labels are skipped, so only new
+    ones hit the LLM), then refresh the per-asset snapshots adjust_portfolio reads.
+    """
+    from core.sentiment_adjust import SENTIMENT_ASSETS, load_llm_sentiment, refresh_asset_sentiment, score_headlines
+
+    sentiment_llm = load_llm_sentiment()
+    news = get_latest_news_multi(assets, limit)
+    items = [(asset, headline) for asset, headlines in news.items() for headline in headlines]
+    if items:
+        score_headlines(items, sentiment_llm)
+    snapshot_assets = [asset for asset in assets if asset in SENTIMENT_ASSETS]
+    if snapshot_assets:
+        refresh_asset_sentiment(snapshot_assets, sentiment_llm)
+    return len(items)
+
+
+# -----------------------------
+# Scheduler
+# -----------------------------
+class IngestionDaemon:
+    def __init__(self, jobs: List[IngestJob], max_workers: int = INGEST_WORKERS,
+                 source_rpm: Optional[Dict[str, float]] = None, retries: int = INGEST_RETRIES,
+                 backoff: float = INGEST_BACKOFF_SECONDS, score_sentiment: bool = True):
+        self.jobs = jobs
+        self.max_workers = max_workers
+        rpm = {**SOURCE_RPM, **(source_rpm or {})}
+        self.limiters = {job.source: RateLimiter(rpm.get(job.source, 0)) for job in jobs}
+        self.retries = retries
+        self.backoff = backoff
+        self.score_sentiment = score_sentiment
+        self.stop_event = threading.Event()
+
+    def next_run(self, job: IngestJob, checkpoint: Optional[dict]) -> datetime.datetime:
+        """
+        Due `interval` after the last success. A failing job also waits out a growing
+        cooldown, or a full interval when the error was not retryable (bad symbol, invalid key).
+        """
+        if not checkpoint:
+            return datetime.datetime.min
+        due = datetime.datetime.min
+        if checkpoint.get("last_success"):
+            due = datetime.datetime.fromisoformat(checkpoint["last_success"]) + datetime.timedelta(seconds=job.interval)
+        if checkpoint.get("failures") and checkpoint.get("last_attempt"):
+            cooldown = job.interval if not checkpoint.get("retryable", True) else \
+                min(job.interval, self.backoff * 2 ** (self.retries + checkpoint["failures"]))
+            due = max(due, datetime.datetime.fromisoformat(checkpoint["last_attempt"]) + datetime.timedelta(seconds=cooldown))
+        return due
+
+    def due_jobs(self, now: Optional[datetime.datetime] = None) -> List[IngestJob]:
+        now = now or datetime.datetime.utcnow()
+        checkpoints = get_checkpoints()
+        return [job for job in self.jobs if self.next_run(job, checkpoints.get(job.name)) <= now]
+
+    def run_job(self, job: IngestJob) -> Optional[int]:
+        """Run one job with rate limiting and retries; returns rows written, or None if it failed."""
+        since = get_checkpoints().get(job.name, {}).get("last_success")
+        limiter = self.limiters[job.source]
+
+        def attempt():
+            limiter.wait()
+            try:
+                return job.run(since)
+            except requests.RequestException as e:
+                # Request URLs can carry API keys (AlphaVantage); keep them out of logs and checkpoints
+                raise type(e)(redact(str(e)), response=e.response) from None
+
+        try:
+            rows = retry_with_backoff(attempt, retries=self.retries, base_delay=self.backoff,
+                                      should_retry=_is_retryable, label=f"Ingestion job '{job.name}'",
+                                      sleep=self.stop_event.wait)
+        except Exception as e:
+            print(f"⚠️ Ingestion job '{job.name}' failed: {e}")
+            _save_checkpoint(job.name, error=str(e), retryable=_is_retryable(e))
+            return None
+        _save_checkpoint(job.name, rows=rows)
+        return rows
+
+    def run_once(self) -> Dict[str, Optional[int]]:
+        """Run every due job (bounded concurrency), then pre-score sentiment for assets with new news."""
+        due = self.due_jobs()
+        if not due:
+            return {}
+        with ThreadPoolExecutor(max_workers=max(1, self.max_workers)) as pool:
+            results = dict(zip([job.name for job in due], pool.map(self.run_job, due)))
+
+        fresh_news = [name.split(":", 1)[1] for name, rows in results.items() if name.startswith("news:") and rows]
+        if self.score_sentiment and fresh_news:
+            try:
+                results["sentiment"] = prescore_sentiment(fresh_news)
+            except Exception as e:
+                print(f"⚠️ Sentiment pre-scoring failed: {e}")
+                results["sentiment"] = None
+        return results
+
+    def seconds_until_next(self) -> float:
+        checkpoints = get_checkpoints()
+        now = datetime.datetime.utcnow()
+        waits = [(self.next_run(job, checkpoints.get(job.name)) - now).total_seconds() for job in self.jobs]
+        return max(1.0, min(waits, default=60.0))
+
+    def run_forever(self, max_sleep: float = 300.0):
+        while not self.stop_event.is_set():
+            results = self.run_once()
+            if results:
+                print(f"Ingestion run: {results}")
+            self.stop_event.wait(min(max_sleep, self.seconds_until_next()))
+
+    def stop(self):
+        self.stop_event.set()
+
+
+# -----------------------------
+# CLI
+# -----------------------------
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Keep market_data.db fresh: news, prices and sentiment.")
+    parser.add_argument("--once", action="store_true", help="Run the due jobs once and exit")
+    parser.add_argument("--workers", type=int, default=INGEST_WORKERS)
+    parser.add_argument("--tickers", help="Comma-separated tickers to refresh (default: tracked tickers)")
+    parser.add_argument("--no-sentiment", action="store_true", help="Skip sentiment pre-scoring")
+    args = parser.parse_args(argv)
+
+    tickers = [t.strip().upper() for t in args.tickers.split(",") if t.strip()] if args.tickers else None
+    daemon = IngestionDaemon(default_jobs(tickers=tickers), max_workers=args.workers,
+                             score_sentiment=not args.no_sentiment)
+    if args.once:
+        print(daemon.run_once())
+        return
+    try:
+        daemon.run_forever()
+    except KeyboardInterrupt:
+        daemon.stop()
+
+
+if __name__ == "__main__":
+    main()
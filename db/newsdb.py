@@ -2,111 +2,379 @@
 import sqlite3
 import requests
 import datetime
-from typing import List, Dict
-from langdetect import detect
+import hashlib
+import json
+from typing import List, Dict, Optional, Tuple
+from langdetect import DetectorFactory, detect
 import os
 from dotenv import load_dotenv
 
+from db.connection import ensure_schema, get_connection, placeholders, transaction
+
 load_dotenv()
 
 DB_FILE = "market_data.db"
 NEWSAPI_KEY = os.getenv("NEWSAPI_KEY")
 ALPHAVANTAGE_KEY = os.getenv("ALPHAVANTAGE_KEY")
+# Overridable so ingestion can run against mirrors or local stub servers
+NEWSAPI_BASE_URL = os.getenv("NEWSAPI_BASE_URL", "https://newsapi.org/v2").rstrip("/")
+ALPHAVANTAGE_BASE_URL = os.getenv("ALPHAVANTAGE_BASE_URL", "https://www.alphavantage.co").rstrip("/")
+HTTP_TIMEOUT = float(os.getenv("INGEST_HTTP_TIMEOUT", "20"))  # seconds
+
+DetectorFactory.seed = 0  # langdetect is randomized; a fixed seed keeps re-ingestion idempotent
+
+
+class UpstreamError(RuntimeError):
+    """An API answered with an error body (bad symbol, invalid key, bad query); retrying won't help."""
+
+
+class UpstreamThrottled(RuntimeError):
+    """An API answered with a throttling message instead of data; worth retrying later."""
+
+
+def headline_hash(headline: str) -> str:
+    """Hash of the case- and whitespace-normalized headline."""
+    normalized = " ".join(headline.casefold().split())
+    return hashlib.sha256(normalized.encode("utf-8")).hexdigest()
+
 
 # -----------------------------
 # DB Init
 # -----------------------------
-def init_db():
-    conn = sqlite3.connect(DB_FILE)
-    c = conn.cursor()
-    c.execute("""CREATE TABLE IF NOT EXISTS news (
+def _create_base_tables(conn: sqlite3.Connection):
+    conn.execute("""CREATE TABLE IF NOT EXISTS news (
                     id INTEGER PRIMARY KEY AUTOINCREMENT,
                     asset TEXT,
                     headline TEXT,
+                    headline_hash TEXT,
                     published_at TEXT
                 )""")
-    c.execute("""CREATE TABLE IF NOT EXISTS prices (
+    conn.execute("""CREATE TABLE IF NOT EXISTS prices (
                     id INTEGER PRIMARY KEY AUTOINCREMENT,
                     asset TEXT,
                     date TEXT,
                     close REAL
                 )""")
-    conn.commit()
-    conn.close()
+
+    # Databases created before headline_hash existed: add and backfill it
+    columns = {row[1] for row in conn.execute("PRAGMA table_info(news)")}
+    if "headline_hash" not in columns:
+        conn.execute("ALTER TABLE news ADD COLUMN headline_hash TEXT")
+    missing = conn.execute("SELECT id, headline FROM news WHERE headline_hash IS NULL").fetchall()
+    if missing:
+        conn.executemany("UPDATE news SET headline_hash=? WHERE id=?",
+                         [(headline_hash(headline or ""), row_id) for row_id, headline in missing])
+
+
+def _create_indexes(conn: sqlite3.Connection):
+    # Latest-N-per-asset reads become an index range scan instead of a full scan + sort
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_news_asset_published ON news (asset, published_at)")
+    # Unique keys make re-ingestion an upsert instead of appending duplicates;
+    # the (asset, date) one also serves the latest-prices reads
+    conn.execute("DROP INDEX IF EXISTS idx_prices_asset_date")
+    conn.execute("CREATE UNIQUE INDEX IF NOT EXISTS ux_prices_asset_date ON prices (asset, date)")
+    conn.execute("CREATE UNIQUE INDEX IF NOT EXISTS ux_news_asset_headline ON news (asset, headline_hash)")
+
+
+def _create_market_tables(conn: sqlite3.Connection):
+    _create_base_tables(conn)
+    try:
+        _create_indexes(conn)
+    except sqlite3.IntegrityError:
+        removed = _remove_duplicates(conn)
+        print(f"⚠️ Removed duplicate rows before adding unique keys: {removed}")
+        _create_indexes(conn)
+
+
+def init_db():
+    ensure_schema(DB_FILE, "market", _create_market_tables)
+    init_sentiment_cache()
 
 
 # -----------------------------
-# Fetch & Store News
+# Headline Sentiment Cache
 # -----------------------------
-def fetch_and_store_news(asset: str, api_key: str):
+def _create_sentiment_cache(conn: sqlite3.Connection):
+    conn.execute("""CREATE TABLE IF NOT EXISTS sentiment_cache (
+                    headline_hash TEXT,
+                    model_id TEXT,
+                    prompt_version INTEGER,
+                    label TEXT,
+                    score REAL,
+                    scored_at TEXT,
+                    PRIMARY KEY (headline_hash, model_id, prompt_version)
+                )""")
+
+
+def init_sentiment_cache():
     """
-    Fetch financial news for an asset using NewsAPI (example).
-    Store into SQLite.
+    Labels are keyed by normalized-headline hash, model id and prompt version,
+    so switching model or prompt invalidates old entries automatically.
     """
-    url = f"https://newsapi.org/v2/everything?q={asset}&sortBy=publishedAt&apiKey={api_key}"
-    resp = requests.get(url).json()
-    articles = resp.get("articles", [])
+    ensure_schema(DB_FILE, "sentiment_cache", _create_sentiment_cache)
 
-    conn = sqlite3.connect(DB_FILE)
-    c = conn.cursor()
 
-    for art in articles[:20]:
-        headline = art["title"].strip()
-        published = art["publishedAt"]
+def get_cached_sentiments(headline_hashes: List[str], model_id: str, prompt_version: int,
+                          max_age_days: Optional[float] = None) -> Dict[str, Tuple[str, float]]:
+    """Return {headline_hash: (label, score)} for the hashes already scored by this model."""
+    if not headline_hashes:
+        return {}
+    init_sentiment_cache()
 
-        # Language filter
-        try:
-            if detect(headline) != "en":
-                continue
-        except:
+    query = (f"SELECT headline_hash, label, score FROM sentiment_cache "
+             f"WHERE model_id=? AND prompt_version=? AND headline_hash IN ({placeholders(len(headline_hashes))})")
+    params = [model_id, prompt_version, *headline_hashes]
+    if max_age_days is not None:
+        cutoff = datetime.datetime.utcnow() - datetime.timedelta(days=max_age_days)
+        query += " AND scored_at >= ?"
+        params.append(cutoff.isoformat())
+
+    rows = get_connection(DB_FILE).execute(query, params).fetchall()
+    return {r[0]: (r[1], r[2]) for r in rows}
+
+
+def store_sentiments(labels: Dict[str, Tuple[str, float]], model_id: str, prompt_version: int):
+    """Upsert {headline_hash: (label, score)} scored by model_id."""
+    if not labels:
+        return
+    init_sentiment_cache()
+
+    now = datetime.datetime.utcnow().isoformat()
+    with transaction(DB_FILE) as conn:
+        conn.executemany("INSERT OR REPLACE INTO sentiment_cache "
+                         "(headline_hash, model_id, prompt_version, label, score, scored_at) VALUES (?, ?, ?, ?, ?, ?)",
+                         [(h, model_id, prompt_version, label, score, now) for h, (label, score) in labels.items()])
+
+
+# -----------------------------
+# Per-asset sentiment snapshots
+# -----------------------------
+def _create_asset_sentiment(conn: sqlite3.Connection):
+    conn.execute("""CREATE TABLE IF NOT EXISTS asset_sentiment (
+                    asset TEXT PRIMARY KEY,
+                    avg_score REAL,
+                    details TEXT,
+                    headline_ids TEXT,
+                    latest_news_id INTEGER,
+                    model_id TEXT,
+                    prompt_version INTEGER,
+                    computed_at TEXT
+                )""")
+
+
+def init_asset_sentiment():
+    """
+    One row per asset: the averaged sentiment of its latest headlines, the ids of
+    those headlines and the newest news id at the time, so a snapshot can be
+    checked for staleness without re-reading the headlines.
+    """
+    ensure_schema(DB_FILE, "asset_sentiment", _create_asset_sentiment)
+
+
+def get_asset_sentiments(assets: List[str]) -> Dict[str, Dict]:
+    if not assets:
+        return {}
+    init_asset_sentiment()
+    rows = get_connection(DB_FILE).execute(
+        f"SELECT asset, avg_score, details, headline_ids, latest_news_id, model_id, prompt_version, computed_at "
+        f"FROM asset_sentiment WHERE asset IN ({placeholders(len(assets))})", assets).fetchall()
+    return {r[0]: {"asset": r[0], "avg_score": r[1], "details": r[2], "headline_ids": json.loads(r[3] or "[]"),
+                   "latest_news_id": r[4], "model_id": r[5], "prompt_version": r[6], "computed_at": r[7]}
+            for r in rows}
+
+
+def store_asset_sentiments(snapshots: List[Dict]):
+    if not snapshots:
+        return
+    init_asset_sentiment()
+    with transaction(DB_FILE) as conn:
+        conn.executemany("INSERT OR REPLACE INTO asset_sentiment (asset, avg_score, details, headline_ids, latest_news_id, "
+                         "model_id, prompt_version, computed_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                         [(s["asset"], s["avg_score"], s["details"], json.dumps(s["headline_ids"]), s["latest_news_id"],
+                           s["model_id"], s["prompt_version"], s["computed_at"]) for s in snapshots])
+
+
+# -----------------------------
+# Idempotent ingestion
+# -----------------------------
+def detect_languages(texts: List[str]) -> List[Optional[str]]:
+    """Language code per text (None if undetectable); each distinct text is detected once."""
+    languages: Dict[str, Optional[str]] = {}
+    for text in texts:
+        if text in languages:
             continue
-        c.execute("INSERT INTO news (asset, headline, published_at) VALUES (?, ?, ?)",
-                (asset, art["title"], art["publishedAt"]))
-    conn.commit()
-    conn.close()
+        try:
+            languages[text] = detect(text)
+        except Exception:
+            languages[text] = None
+    return [languages[t] for t in texts]
+
+
+def upsert_news(asset: str, items: List[Tuple[str, Optional[str]]], language: str = "en") -> int:
+    """
+    Store (headline, published_at) pairs for `asset` in one transaction.
+    Headlines are deduplicated by normalized hash, both within the batch and
+    against what is already stored, and only new ones go through language
+    detection. Returns the number of rows written.
+    """
+    init_db()
+    batch: Dict[str, Tuple[str, Optional[str]]] = {}
+    for headline, published in items:
+        headline = (headline or "").strip()
+        if headline:
+            batch.setdefault(headline_hash(headline), (headline, published))
+    if not batch:
+        return 0
+
+    hashes = list(batch)
+    known = {r[0] for r in get_connection(DB_FILE).execute(
+        f"SELECT headline_hash FROM news WHERE asset=? AND headline_hash IN ({placeholders(len(hashes))})",
+        [asset, *hashes])}
+    new = [h for h in hashes if h not in known]
+    languages = detect_languages([batch[h][0] for h in new])
+    rows = [(asset, batch[h][0], h, batch[h][1]) for h, lang in zip(new, languages) if lang == language]
+    if not rows:
+        return 0
+
+    with transaction(DB_FILE) as conn:
+        cursor = conn.executemany("""INSERT INTO news (asset, headline, headline_hash, published_at) VALUES (?, ?, ?, ?)
+                                     ON CONFLICT(asset, headline_hash) DO UPDATE SET
+                                        published_at=COALESCE(news.published_at, excluded.published_at)""", rows)
+    return cursor.rowcount
+
+
+def upsert_prices(asset: str, closes: List[Tuple[str, float]]) -> int:
+    """Store (date, close) pairs for `asset` in one transaction; an existing date gets the new close."""
+    if not closes:
+        return 0
+    init_db()
+    with transaction(DB_FILE) as conn:
+        cursor = conn.executemany("""INSERT INTO prices (asset, date, close) VALUES (?, ?, ?)
+                                     ON CONFLICT(asset, date) DO UPDATE SET close=excluded.close""",
+                                  [(asset, date, close) for date, close in closes])
+    return cursor.rowcount
+
+
+# -----------------------------
+# Fetch & Store News
+# -----------------------------
+def fetch_and_store_news(asset: str, api_key: str, query: Optional[str] = None, since: Optional[str] = None) -> int:
+    """
+    Fetch financial news for an asset using NewsAPI (example).
+    Store into SQLite (English headlines only, re-runs don't duplicate).
+    `query` defaults to the asset name; `since` (ISO date/time) limits to newer articles.
+    """
+    params = {"q": query or asset, "sortBy": "publishedAt"}
+    if since:
+        params["from"] = since
+    # Key in a header rather than the URL, so it never shows up in error messages
+    response = requests.get(f"{NEWSAPI_BASE_URL}/everything", params=params, headers={"X-Api-Key": api_key},
+                            timeout=HTTP_TIMEOUT)
+    response.raise_for_status()
+    resp = response.json()
+    if resp.get("status") == "error":
+        raise UpstreamError(f"NewsAPI error: {resp.get('message', resp.get('code'))}")
+    articles = resp.get("articles", [])
+
+    return upsert_news(asset, [(art.get("title"), art.get("publishedAt")) for art in articles[:20]])
 
 
 # -----------------------------
 # Fetch & Store Prices
 # -----------------------------
-def fetch_and_store_prices(asset: str, symbol: str, api_key: str):
+def fetch_and_store_prices(asset: str, symbol: str, api_key: str) -> int:
     """
     Fetch daily prices using AlphaVantage API.
     """
-    url = f"https://www.alphavantage.co/query?function=TIME_SERIES_DAILY&symbol={symbol}&apikey={api_key}"
-    resp = requests.get(url).json()
+    params = {"function": "TIME_SERIES_DAILY", "symbol": symbol, "apikey": api_key}
+    response = requests.get(f"{ALPHAVANTAGE_BASE_URL}/query", params=params, timeout=HTTP_TIMEOUT)
+    response.raise_for_status()
+    resp = response.json()
     time_series = resp.get("Time Series (Daily)", {})
+    if not time_series:
+        # Throttling and bad symbols / keys come back as HTTP 200 with a message instead of data
+        if resp.get("Error Message"):
+            raise UpstreamError(f"AlphaVantage error: {resp['Error Message']}")
+        message = resp.get("Note") or resp.get("Information")
+        if message:
+            raise UpstreamThrottled(f"AlphaVantage throttled: {message}")
+
+    closes = [(date, float(values["4. close"]))
+              for date, values in list(time_series.items())[:90]]  # store last 90 days
+    return upsert_prices(asset, closes)
 
-    conn = sqlite3.connect(DB_FILE)
-    c = conn.cursor()
 
-    for date, values in list(time_series.items())[:90]:  # store last 90 days
-        close_price = float(values["4. close"])
-        c.execute("INSERT INTO prices (asset, date, close) VALUES (?, ?, ?)",
-                (asset, date, close_price))
+# -----------------------------
+# Compaction
+# -----------------------------
+def _remove_duplicates(conn: sqlite3.Connection) -> Dict[str, int]:
+    """Keep the newest row per (asset, date) price and per (asset, headline_hash) headline."""
+    prices = conn.execute("DELETE FROM prices WHERE id NOT IN "
+                          "(SELECT MAX(id) FROM prices GROUP BY asset, date)").rowcount
+    news = conn.execute("DELETE FROM news WHERE id NOT IN "
+                        "(SELECT MAX(id) FROM news GROUP BY asset, headline_hash)").rowcount
+    return {"prices": prices, "news": news}
 
-    conn.commit()
-    conn.close()
+
+def compact_db(vacuum: bool = True) -> Dict[str, int]:
+    """Remove duplicate news/price rows left by earlier ingestion, then reclaim the space."""
+    with transaction(DB_FILE) as conn:
+        _create_base_tables(conn)
+        removed = _remove_duplicates(conn)
+    init_db()
+    if vacuum:
+        get_connection(DB_FILE).execute("VACUUM")
+    return removed
 
 
 # -----------------------------
 # Query Functions
 # -----------------------------
 def get_latest_news(asset: str, limit=5) -> List[str]:
-    conn = sqlite3.connect(DB_FILE)
-    c = conn.cursor()
-    c.execute("SELECT headline FROM news WHERE asset=? ORDER BY published_at DESC LIMIT ?", (asset, limit))
-    rows = c.fetchall()
-    conn.close()
-    return [r[0] for r in rows]
+    return get_latest_news_multi([asset], limit).get(asset, [])
+
+
+def get_latest_news_multi(assets: List[str], limit=5) -> Dict[str, List[str]]:
+    """{asset: latest `limit` headlines, newest first} for several assets in one query."""
+    return {asset: [headline for _, headline in rows] for asset, rows in get_latest_news_rows(assets, limit).items()}
+
+
+def get_latest_news_rows(assets: List[str], limit=5) -> Dict[str, List[Tuple[int, str]]]:
+    """
+    {asset: [(news id, headline), ...]} newest first, in one query.
+    Each asset is its own LIMITed branch of a UNION ALL, so every branch is a
+    short range scan of idx_news_asset_published.
+    """
+    assets = list(dict.fromkeys(assets))
+    if not assets:
+        return {}
+    init_db()
+    branch = ("SELECT * FROM (SELECT asset, id, headline, published_at FROM news WHERE asset=? "
+              "ORDER BY published_at DESC LIMIT ?)")
+    query = " UNION ALL ".join([branch] * len(assets))
+    params = [p for asset in assets for p in (asset, limit)]
+    rows = get_connection(DB_FILE).execute(query, params).fetchall()
+
+    news: Dict[str, List[Tuple[int, str]]] = {}
+    for asset, news_id, headline, _ in rows:
+        news.setdefault(asset, []).append((news_id, headline))
+    return news
+
+
+def get_latest_news_ids(assets: List[str]) -> Dict[str, int]:
+    """{asset: highest news id}; it only grows when a new headline is stored for the asset."""
+    if not assets:
+        return {}
+    init_db()
+    rows = get_connection(DB_FILE).execute(
+        f"SELECT asset, MAX(id) FROM news WHERE asset IN ({placeholders(len(assets))}) GROUP BY asset", assets).fetchall()
+    return {r[0]: r[1] for r in rows}
 
 
 def get_latest_prices(asset: str, limit=30) -> List[Dict]:
-    conn = sqlite3.connect(DB_FILE)
-    c = conn.cursor()
-    c.execute("SELECT date, close FROM prices WHERE asset=? ORDER BY date DESC LIMIT ?", (asset, limit))
-    rows = c.fetchall()
-    conn.close()
+    init_db()
+    rows = get_connection(DB_FILE).execute(
+        "SELECT date, close FROM prices WHERE asset=? ORDER BY date DESC LIMIT ?", (asset, limit)).fetchall()
     return [{"date": r[0], "close": r[1]} for r in rows]
 
 
@@ -114,6 +382,12 @@ def get_latest_prices(asset: str, limit=30) -> List[Dict]:
 # Example run
 # -----------------------------
 if __name__ == "__main__":
+    import sys
+
+    if sys.argv[1:] == ["compact"]:
+        print("Removed duplicates:", compact_db())
+        sys.exit(0)
+
     init_db()
     # Replace with valid API keys
     fetch_and_store_news("Cash", api_key=NEWSAPI_KEY)
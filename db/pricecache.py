@@ -0,0 +1,157 @@
+# pricecache.py
+# Local OHLC store for Yahoo tickers with incremental refresh.
+# Each ticker keeps a high-water mark (last stored bar); a stale ticker only
+# downloads the bars after that mark, everything else is served from disk.
+import sqlite3
+import datetime
+import os
+from typing import Dict, List, Optional
+
+import pandas as pd
+import yfinance as yf
+
+from db.connection import ensure_schema, get_connection, placeholders, transaction
+from db.newsdb import DB_FILE
+
+# Minutes before a ticker's cached bars are considered stale
+PRICE_CACHE_MAX_AGE_MINUTES = float(os.getenv("PRICE_CACHE_MAX_AGE_MINUTES", "60"))
+HISTORY_DAYS = 365
+
+
+# -----------------------------
+# DB Init
+# -----------------------------
+def _create_price_tables(conn: sqlite3.Connection):
+    conn.execute("""CREATE TABLE IF NOT EXISTS ohlc (
+                    ticker TEXT,
+                    date TEXT,
+                    open REAL,
+                    high REAL,
+                    low REAL,
+                    close REAL,
+                    volume INTEGER,
+                    PRIMARY KEY (ticker, date)
+                )""")
+    conn.execute("""CREATE TABLE IF NOT EXISTS price_sync (
+                    ticker TEXT PRIMARY KEY,
+                    last_date TEXT,
+                    fetched_at TEXT
+                )""")
+
+
+def init_price_cache():
+    ensure_schema(DB_FILE, "price_cache", _create_price_tables)
+
+
+# -----------------------------
+# Yahoo download
+# -----------------------------
+def _download(tickers: List[str], start: Optional[str] = None) -> Dict[str, pd.DataFrame]:
+    """One batched download; `start` (inclusive) or a full year of history."""
+    kwargs = {"start": start} if start else {"period": "1y"}
+    data = yf.download(tickers, group_by="ticker", auto_adjust=True, threads=True, progress=False, **kwargs)
+    if data is None or data.empty:
+        return {}
+
+    frames = {}
+    for t in tickers:
+        try:
+            frame = data[t] if isinstance(data.columns, pd.MultiIndex) else data
+        except KeyError:
+            continue
+        frame = frame.dropna(subset=["Close"])
+        if not frame.empty:
+            frames[t] = frame
+    return frames
+
+
+def _store(frames: Dict[str, pd.DataFrame], attempted: List[str]):
+    now = datetime.datetime.utcnow().isoformat()
+    with transaction(DB_FILE) as c:
+        for t, frame in frames.items():
+            dates = frame.index.strftime("%Y-%m-%d")
+            c.executemany("INSERT OR REPLACE INTO ohlc (ticker, date, open, high, low, close, volume) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                          [(t, d, _f(r.get("Open")), _f(r.get("High")), _f(r.get("Low")), _f(r.get("Close")),
+                            int(r["Volume"]) if pd.notna(r.get("Volume")) else None)
+                           for d, (_, r) in zip(dates, frame.iterrows())])
+        for t in attempted:
+            # Record the fetch even without new bars (weekends/holidays) so we don't re-download
+            last = frames[t].index.max().strftime("%Y-%m-%d") if t in frames else None
+            c.execute("""INSERT INTO price_sync (ticker, last_date, fetched_at) VALUES (?, ?, ?)
+                         ON CONFLICT(ticker) DO UPDATE SET
+                            last_date=COALESCE(MAX(excluded.last_date, COALESCE(price_sync.last_date, '')), price_sync.last_date),
+                            fetched_at=excluded.fetched_at""",
+                      (t, last, now))
+
+
+def _f(v) -> Optional[float]:
+    return float(v) if v is not None and pd.notna(v) else None
+
+
+# -----------------------------
+# Query Functions
+# -----------------------------
+def _sync_state(tickers: List[str]) -> Dict[str, tuple]:
+    rows = get_connection(DB_FILE).execute(
+        f"SELECT ticker, last_date, fetched_at FROM price_sync WHERE ticker IN ({placeholders(len(tickers))})", tickers
+    ).fetchall()
+    return {r[0]: (r[1], r[2]) for r in rows}
+
+
+def refresh_prices(tickers: List[str], max_age_minutes: Optional[float] = None):
+    """Download only the bars after each stale ticker's high-water mark."""
+    init_price_cache()
+    max_age = PRICE_CACHE_MAX_AGE_MINUTES if max_age_minutes is None else max_age_minutes
+    cutoff = (datetime.datetime.utcnow() - datetime.timedelta(minutes=max_age)).isoformat()
+
+    state = _sync_state(tickers)
+    stale = [t for t in tickers if t not in state or state[t][1] < cutoff]
+    fresh_start = [t for t in stale if not state.get(t, (None, None))[0]]
+    incremental = [t for t in stale if state.get(t, (None, None))[0]]
+
+    if fresh_start:
+        _store(_download(fresh_start), fresh_start)
+    if incremental:
+        # Re-fetch from the oldest mark (inclusive) so the last, possibly partial, bar is corrected
+        start = min(state[t][0] for t in incremental)
+        _store(_download(incremental, start=start), incremental)
+
+
+def get_close_histories(tickers: List[str], days: int = HISTORY_DAYS,
+                        max_age_minutes: Optional[float] = None) -> Dict[str, pd.Series]:
+    """Daily closes for the last `days` per ticker, refreshed incrementally when stale."""
+    tickers = list(dict.fromkeys(tickers))
+    if not tickers:
+        return {}
+    try:
+        refresh_prices(tickers, max_age_minutes)
+    except Exception as e:
+        print(f"Price refresh failed, serving cached bars: {e}")
+    init_price_cache()
+
+    since = (datetime.date.today() - datetime.timedelta(days=days)).isoformat()
+    rows = get_connection(DB_FILE).execute(
+        f"SELECT ticker, date, close FROM ohlc WHERE ticker IN ({placeholders(len(tickers))}) "
+        "AND date >= ? ORDER BY ticker, date", [*tickers, since]).fetchall()
+
+    grouped: Dict[str, list] = {}
+    for t, d, close in rows:
+        grouped.setdefault(t, []).append((d, close))
+    return {t: pd.Series([p[1] for p in points], index=pd.to_datetime([p[0] for p in points]), name=t)
+            for t, points in grouped.items()}
+
+
+def get_close_history(ticker: str, days: int = HISTORY_DAYS, max_age_minutes: Optional[float] = None) -> pd.Series:
+    return get_close_histories([ticker], days, max_age_minutes).get(ticker, pd.Series(dtype=float))
+
+
+# -----------------------------
+# Example run
+# -----------------------------
+if __name__ == "__main__":
+    import time
+
+    for attempt in range(2):
+        start = time.perf_counter()
+        closes = get_close_histories(["AAPL", "TSLA"])
+        print({t: len(s) for t, s in closes.items()}, f"{(time.perf_counter() - start) * 1000:.1f} ms")
@@ -0,0 +1,228 @@
+# ann.py
+# Selectable FAISS index types for the RAG store and a recall-vs-latency benchmark.
+#
+#   flat      exact L2 search (baseline)
+#   ivf_flat  inverted lists over k-means cells, full vectors   (tune: nprobe)
+#   ivf_pq    inverted lists + product-quantized codes          (tune: nprobe)
+#   hnsw      graph search, full vectors                        (tune: efSearch)
+#
+#   python -m vectorstores.ann --synthetic 100000 --dim 384
+
+import argparse
+import math
+import time
+from typing import Dict, List, Optional
+
+import faiss
+import numpy as np
+
+INDEX_TYPES = ("flat", "ivf_flat", "ivf_pq", "hnsw")
+TRAIN_POINTS_PER_CENTROID = 39  # faiss warns below this many training points per cell
+MAX_TRAIN_SAMPLE = 256 * 1024
+MIN_PQ_BITS = 4
+MIN_PQ_VECTORS = 2 ** MIN_PQ_BITS  # PQ trains 2**bits centroids per sub-quantizer; fewer vectors can't train it
+
+
+# -----------------------------
+# Construction
+# -----------------------------
+def default_nlist(n_vectors: int) -> int:
+    """~4*sqrt(N) cells, but never more than the data can train."""
+    nlist = int(4 * math.sqrt(max(n_vectors, 1)))
+    return max(1, min(nlist, n_vectors // TRAIN_POINTS_PER_CENTROID or 1))
+
+
+def create_index(kind: str, dim: int, n_vectors: int, nlist: Optional[int] = None, pq_m: Optional[int] = None,
+                 pq_bits: int = 8, hnsw_m: int = 32, ef_construction: int = 200) -> faiss.Index:
+    """
+    Create an (untrained) index that supports add_with_ids. ivf_pq falls back to
+    ivf_flat below MIN_PQ_VECTORS vectors, which is too few to train the quantizer.
+    """
+    if kind == "flat":
+        return faiss.IndexIDMap2(faiss.IndexFlatL2(dim))
+    if kind == "hnsw":
+        base = faiss.IndexHNSWFlat(dim, hnsw_m)
+        base.hnsw.efConstruction = ef_construction
+        return faiss.IndexIDMap2(base)
+
+    if kind == "ivf_pq" and n_vectors < MIN_PQ_VECTORS:
+        print(f"⚠️ ivf_pq needs at least {MIN_PQ_VECTORS} vectors to train (got {n_vectors}); using ivf_flat")
+        kind = "ivf_flat"
+
+    nlist = nlist or default_nlist(n_vectors)
+    quantizer = faiss.IndexFlatL2(dim)
+    if kind == "ivf_flat":
+        index = faiss.IndexIVFFlat(quantizer, dim, nlist)
+    elif kind == "ivf_pq":
+        pq_m = pq_m or _default_pq_m(dim)
+        # Each sub-quantizer trains 2**bits centroids; shrink codes for small corpora
+        trainable_bits = int(math.log2(max(n_vectors // TRAIN_POINTS_PER_CENTROID, 16)))
+        index = faiss.IndexIVFPQ(quantizer, dim, nlist, pq_m, max(MIN_PQ_BITS, min(pq_bits, trainable_bits)))
+    else:
+        raise ValueError(f"Unknown index type '{kind}'. Choose from {INDEX_TYPES}")
+    # Hashtable direct map: lets us reconstruct and remove vectors by id
+    index.set_direct_map_type(faiss.DirectMap.Hashtable)
+    return index
+
+
+def _default_pq_m(dim: int) -> int:
+    """Largest sub-quantizer count <= dim/4 that divides dim (≈4 dims per byte)."""
+    for m in range(max(1, dim // 4), 0, -1):
+        if dim % m == 0:
+            return m
+    return 1
+
+
+def train_index(index: faiss.Index, vectors: np.ndarray, sample_size: int = MAX_TRAIN_SAMPLE, seed: int = 0):
+    """Train on a random sample of the vectors (no-op for flat / HNSW)."""
+    if index.is_trained:
+        return
+    if len(vectors) > sample_size:
+        rng = np.random.default_rng(seed)
+        vectors = vectors[rng.choice(len(vectors), sample_size, replace=False)]
+    index.train(np.ascontiguousarray(vectors, dtype=np.float32))
+
+
+def index_kind(index: faiss.Index) -> str:
+    base = faiss.downcast_index(index.index) if isinstance(index, (faiss.IndexIDMap, faiss.IndexIDMap2)) else index
+    if isinstance(base, faiss.IndexHNSW):
+        return "hnsw"
+    if isinstance(base, faiss.IndexIVFPQ):
+        return "ivf_pq"
+    if isinstance(base, faiss.IndexIVF):
+        return "ivf_flat"
+    return "flat"
+
+
+def set_search_params(index: faiss.Index, nprobe: Optional[int] = None, ef_search: Optional[int] = None):
+    """Apply query-time knobs: nprobe for IVF, efSearch for HNSW."""
+    if nprobe:
+        ivf = faiss.try_extract_index_ivf(index)
+        if ivf is not None:
+            ivf.nprobe = nprobe
+    if ef_search:
+        base = faiss.downcast_index(index.index) if isinstance(index, (faiss.IndexIDMap, faiss.IndexIDMap2)) else index
+        if isinstance(base, faiss.IndexHNSW):
+            base.hnsw.efSearch = ef_search
+
+
+def remove_ids(index: faiss.Index, ids: np.ndarray) -> faiss.Index:
+    """
+    Remove vectors by id. HNSW graphs cannot delete nodes, so an HNSW index
+    is rebuilt from its surviving vectors instead. Returns the (possibly new) index.
+    """
+    ids = np.asarray(ids, dtype=np.int64)
+    if index_kind(index) != "hnsw":
+        index.remove_ids(ids)
+        return index
+
+    all_ids = faiss.vector_to_array(index.id_map)
+    keep = all_ids[~np.isin(all_ids, ids)]
+    base = faiss.downcast_index(index.index)
+    rebuilt = create_index("hnsw", index.d, len(keep), hnsw_m=base.hnsw.nb_neighbors(1),
+                           ef_construction=base.hnsw.efConstruction)
+    if len(keep):
+        rebuilt.add_with_ids(np.stack([index.reconstruct(int(i)) for i in keep]), keep)
+    return rebuilt
+
+
+def stored_vectors(index: faiss.Index):
+    """(ids, vectors) currently held by an index built by create_index (or a legacy flat one)."""
+    if hasattr(index, "id_map"):
+        ids = faiss.vector_to_array(index.id_map)
+    else:
+        ivf = faiss.try_extract_index_ivf(index)
+        if ivf is None:
+            return np.arange(index.ntotal, dtype=np.int64), index.reconstruct_n(0, index.ntotal)
+        invlists = ivf.invlists
+        ids = np.concatenate([faiss.rev_swig_ptr(invlists.get_ids(l), invlists.list_size(l)).copy()
+                              for l in range(ivf.nlist)] or [np.zeros(0, dtype=np.int64)])
+    vectors = np.stack([index.reconstruct(int(i)) for i in ids]) if len(ids) else np.zeros((0, index.d), dtype=np.float32)
+    return ids.astype(np.int64), vectors
+
+
+def convert_index(index: faiss.Index, kind: str, **create_kwargs) -> faiss.Index:
+    """
+    Re-index the stored vectors under another index type without re-embedding.
+    Vectors coming out of ivf_pq are quantized approximations.
+    """
+    ids, vectors = stored_vectors(index)
+    converted = create_index(kind, index.d, len(ids), **create_kwargs)
+    train_index(converted, vectors)
+    if len(ids):
+        converted.add_with_ids(vectors, ids)
+    return converted
+
+
+def index_memory_bytes(index: faiss.Index) -> int:
+    return int(faiss.serialize_index(index).nbytes)
+
+
+# -----------------------------
+# Benchmark
+# -----------------------------
+def benchmark(vectors: np.ndarray, queries: np.ndarray, kinds: List[str] = INDEX_TYPES, k: int = 10,
+              nprobes: List[int] = (1, 8, 32), ef_searches: List[int] = (16, 64, 256), **create_kwargs) -> List[Dict]:
+    """Recall@k against exact flat search, per-query latency and index size for each setting."""
+    vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+    queries = np.ascontiguousarray(queries, dtype=np.float32)
+    ids = np.arange(len(vectors), dtype=np.int64)
+
+    exact = faiss.IndexFlatL2(vectors.shape[1])
+    exact.add(vectors)
+    _, truth = exact.search(queries, k)
+
+    rows = []
+    for kind in kinds:
+        index = create_index(kind, vectors.shape[1], len(vectors), **create_kwargs)
+        start = time.perf_counter()
+        train_index(index, vectors)
+        index.add_with_ids(vectors, ids)
+        build_s = time.perf_counter() - start
+
+        if kind.startswith("ivf"):
+            settings = [{"nprobe": p} for p in nprobes]
+        elif kind == "hnsw":
+            settings = [{"ef_search": e} for e in ef_searches]
+        else:
+            settings = [{}]
+
+        for params in settings:
+            set_search_params(index, **params)
+            start = time.perf_counter()
+            _, found = index.search(queries, k)
+            latency_ms = (time.perf_counter() - start) * 1000 / len(queries)
+            recall = np.mean([len(set(f) & set(t)) / k for f, t in zip(found, truth)])
+            rows.append({"index": kind, **params, "recall@k": round(float(recall), 4),
+                         "ms_per_query": round(latency_ms, 4), "build_s": round(build_s, 2),
+                         "memory_mb": round(index_memory_bytes(index) / 2**20, 2)})
+    return rows
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Recall vs latency of FAISS index types against flat search.")
+    parser.add_argument("--index-dir", help="Benchmark on the vectors of an existing store (index.faiss)")
+    parser.add_argument("--synthetic", type=int, default=50000, help="Number of random vectors if no --index-dir")
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--kinds", nargs="+", default=list(INDEX_TYPES), choices=INDEX_TYPES)
+    args = parser.parse_args(argv)
+
+    rng = np.random.default_rng(0)
+    if args.index_dir:
+        _, vectors = stored_vectors(faiss.read_index(f"{args.index_dir}/index.faiss"))
+    else:
+        # Clustered data is closer to real embeddings than uniform noise
+        centers = rng.standard_normal((max(1, args.synthetic // 500), args.dim)).astype(np.float32)
+        vectors = centers[rng.integers(0, len(centers), args.synthetic)] + \
+            0.3 * rng.standard_normal((args.synthetic, args.dim)).astype(np.float32)
+    queries = vectors[rng.choice(len(vectors), min(args.queries, len(vectors)), replace=False)] + \
+        0.05 * rng.standard_normal((min(args.queries, len(vectors)), vectors.shape[1])).astype(np.float32)
+
+    for row in benchmark(vectors, queries, args.kinds, args.k):
+        print(row)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,173 @@
+# bm25.py
+# Local lexical retrieval for the RAG store: an inverted-index BM25 built
+# alongside the FAISS index (bm25.pkl), reciprocal-rank fusion with the dense
+# results, and optional lightweight reranking.
+# Dense vectors alone retrieve poorly for tickers and acronyms (SIP, ELSS, NAV,
+# 80C); exact term matching covers that gap.
+
+import math
+import os
+import pickle
+import re
+from collections import Counter, defaultdict
+from pathlib import Path
+from typing import Dict, Iterable, List, Sequence, Tuple
+
+import numpy as np
+
+# Keeps tokens like "s&p", "brk-b", "80c", "1.5"
+_TOKEN = re.compile(r"[a-z0-9]+(?:[.&-][a-z0-9]+)*")
+STOPWORDS = frozenset(
+    "a an and are as at be by can do does for from how i if in into is it its me my of on or "
+    "our should so that the their them then there these they this to was what when where which "
+    "who why will with you your".split()
+)
+
+
+def tokenize(text: str) -> List[str]:
+    return [t for t in _TOKEN.findall(text.lower()) if t not in STOPWORDS]
+
+
+# -----------------------------
+# BM25 inverted index
+# -----------------------------
+class BM25Index:
+    def __init__(self, k1: float = 1.5, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self.doc_ids: List[str] = []
+        self.doc_len = np.zeros(0, dtype=np.float32)
+        self.postings: Dict[str, Tuple[np.ndarray, np.ndarray]] = {}  # term -> (doc indices, term freqs)
+
+    @classmethod
+    def from_documents(cls, docs: Iterable[Tuple[str, str]], **kwargs) -> "BM25Index":
+        """Build from (doc_id, text) pairs."""
+        index = cls(**kwargs)
+        lists = defaultdict(lambda: ([], []))
+        lengths = []
+        for i, (doc_id, text) in enumerate(docs):
+            tokens = tokenize(text)
+            index.doc_ids.append(doc_id)
+            lengths.append(len(tokens))
+            for term, tf in Counter(tokens).items():
+                lists[term][0].append(i)
+                lists[term][1].append(tf)
+        index.doc_len = np.asarray(lengths, dtype=np.float32)
+        index.postings = {t: (np.asarray(d, dtype=np.int32), np.asarray(f, dtype=np.float32))
+                          for t, (d, f) in lists.items()}
+        return index
+
+    def idf(self, term: str) -> float:
+        df = len(self.postings[term][0]) if term in self.postings else 0
+        n = len(self.doc_ids)
+        return math.log(1 + (n - df + 0.5) / (df + 0.5))
+
+    def search(self, query: str, k: int = 10) -> List[Tuple[str, float]]:
+        if not self.doc_ids:
+            return []
+        scores = np.zeros(len(self.doc_ids), dtype=np.float32)
+        avgdl = float(self.doc_len.mean()) or 1.0
+        for term in set(tokenize(query)):
+            if term not in self.postings:
+                continue
+            docs, tf = self.postings[term]
+            norm = self.k1 * (1 - self.b + self.b * self.doc_len[docs] / avgdl)
+            scores[docs] += self.idf(term) * tf * (self.k1 + 1) / (tf + norm)
+
+        hits = np.flatnonzero(scores)
+        if len(hits) == 0:
+            return []
+        top = hits[np.argsort(-scores[hits])[:k]]
+        return [(self.doc_ids[i], float(scores[i])) for i in top]
+
+    def save(self, path: Path):
+        tmp = Path(f"{path}.tmp")
+        with open(tmp, "wb") as f:
+            pickle.dump(self, f)
+        os.replace(tmp, path)
+
+    @staticmethod
+    def load(path: Path) -> "BM25Index":
+        with open(path, "rb") as f:
+            return pickle.load(f)
+
+
+# -----------------------------
+# Fusion & reranking
+# -----------------------------
+def reciprocal_rank_fusion(ranked_lists: Sequence[Sequence[str]], k: int = 60) -> List[Tuple[str, float]]:
+    """Combine ranked id lists: score(d) = sum over lists of 1 / (k + rank)."""
+    scores: Dict[str, float] = defaultdict(float)
+    for ranked in ranked_lists:
+        for rank, doc_id in enumerate(ranked, start=1):
+            scores[doc_id] += 1.0 / (k + rank)
+    return sorted(scores.items(), key=lambda item: -item[1])
+
+
+class TermCoverageReranker:
+    """
+    Cheap local reranker: idf-weighted share of query terms a chunk contains,
+    blended with its fused retrieval score.
+    """
+
+    def __init__(self, bm25: BM25Index, weight: float = 0.5):
+        self.bm25 = bm25
+        self.weight = weight
+
+    def rerank(self, query: str, candidates: List[Tuple[str, str, float]]) -> List[Tuple[str, str, float]]:
+        """candidates: (doc_id, text, fused_score) -> same tuples, best first."""
+        terms = set(tokenize(query))
+        if not terms or not candidates:
+            return candidates
+        weights = {t: self.bm25.idf(t) for t in terms}
+        total = sum(weights.values()) or 1.0
+        top_fused = max(c[2] for c in candidates) or 1.0
+
+        def score(c):
+            present = set(tokenize(c[1]))
+            coverage = sum(w for t, w in weights.items() if t in present) / total
+            return (1 - self.weight) * c[2] / top_fused + self.weight * coverage
+
+        return sorted(candidates, key=score, reverse=True)
+
+
+class CrossEncoderReranker:
+    """Optional reranker using a local sentence-transformers cross-encoder."""
+
+    def __init__(self, model_name: str = "cross-encoder/ms-marco-MiniLM-L-6-v2"):
+        try:
+            from sentence_transformers import CrossEncoder
+        except ImportError as e:
+            raise ImportError("The cross-encoder reranker requires `pip install sentence-transformers`") from e
+        self.model = CrossEncoder(model_name)
+
+    def rerank(self, query: str, candidates: List[Tuple[str, str, float]]) -> List[Tuple[str, str, float]]:
+        if not candidates:
+            return candidates
+        scores = self.model.predict([(query, c[1]) for c in candidates])
+        return [c for _, c in sorted(zip(scores, candidates), key=lambda p: -p[0])]
+
+
+# -----------------------------
+# Context compression
+# -----------------------------
+_SENTENCE = re.compile(r"(?<=[.!?])\s+")
+
+
+def compress_chunk(text: str, query: str, max_chars: int) -> str:
+    """Keep the sentences that mention query terms (in original order) up to max_chars."""
+    if len(text) <= max_chars:
+        return text
+    terms = set(tokenize(query))
+    sentences = _SENTENCE.split(text)
+    ranked = sorted(range(len(sentences)), key=lambda i: -len(terms & set(tokenize(sentences[i]))))
+
+    keep, used = set(), 0
+    for i in ranked:
+        if used + len(sentences[i]) > max_chars and keep:
+            continue
+        keep.add(i)
+        used += len(sentences[i]) + 1
+        if used >= max_chars:
+            break
+    return " ".join(sentences[i] for i in sorted(keep))[:max_chars]
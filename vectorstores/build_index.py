@@ -0,0 +1,286 @@
+# build_index.py
+# Offline builder for vectorstores/finance_faiss with incremental ingestion.
+#
+#   python -m vectorstores.build_index --docs ./docs --embedder hashing
+#
+# Documents are chunked, every chunk is content-hashed, and only chunks whose
+# hash is not already in the index are embedded. New vectors are appended with
+# add_with_ids; chunks from deleted or edited sources are tombstoned in the
+# manifest and removed from the index. The output stays loadable by
+# FAISS.load_local / RetrieverService (index.faiss + index.pkl).
+
+import argparse
+import hashlib
+import os
+import pickle
+import sqlite3
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import faiss
+import numpy as np
+from langchain_community.docstore.in_memory import InMemoryDocstore
+from langchain_core.documents import Document
+from langchain_text_splitters import RecursiveCharacterTextSplitter
+
+from core.ratelimit import RateLimiter
+from vectorstores.ann import INDEX_TYPES, convert_index, create_index, index_kind, remove_ids, train_index
+from vectorstores.bm25 import BM25Index
+from vectorstores.embeddings import EMBEDDING_MODEL_IDS, get_embedding_backend
+
+DEFAULT_INDEX_DIR = Path(__file__).resolve().parent / "finance_faiss"
+SUPPORTED_EXTENSIONS = {".pdf", ".txt", ".md"}
+
+
+# -----------------------------
+# Loading & chunking
+# -----------------------------
+def load_document(path: Path) -> str:
+    if path.suffix.lower() == ".pdf":
+        try:
+            from pypdf import PdfReader
+        except ImportError as e:
+            raise ImportError("Reading PDFs requires `pip install pypdf`") from e
+        return "\n".join(page.extract_text() or "" for page in PdfReader(str(path)).pages)
+    return path.read_text(encoding="utf-8", errors="ignore")
+
+
+def chunk_hash(text: str) -> str:
+    return hashlib.sha256(" ".join(text.split()).encode("utf-8")).hexdigest()
+
+
+def chunk_sources(docs_dir: Path, chunk_size: int, chunk_overlap: int) -> Dict[str, List[Tuple[str, str]]]:
+    """{source: [(chunk_hash, chunk_text), ...]} for every supported file under docs_dir."""
+    splitter = RecursiveCharacterTextSplitter(chunk_size=chunk_size, chunk_overlap=chunk_overlap)
+    sources = {}
+    for path in sorted(docs_dir.rglob("*")):
+        if not path.is_file() or path.suffix.lower() not in SUPPORTED_EXTENSIONS:
+            continue
+        source = path.relative_to(docs_dir).as_posix()
+        seen = {}
+        for text in splitter.split_text(load_document(path)):
+            seen.setdefault(chunk_hash(text), text)  # identical chunks in one file are stored once
+        sources[source] = list(seen.items())
+    return sources
+
+
+# -----------------------------
+# Manifest (chunk hash -> vector id)
+# -----------------------------
+class Manifest:
+    def __init__(self, path: Path):
+        self.conn = sqlite3.connect(path)
+        self.conn.execute("""CREATE TABLE IF NOT EXISTS chunks (
+                                id INTEGER PRIMARY KEY,
+                                source TEXT,
+                                hash TEXT,
+                                tombstoned INTEGER DEFAULT 0,
+                                UNIQUE (source, hash)
+                            )""")
+        self.conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+        self.conn.commit()
+
+    def get_meta(self, key: str) -> Optional[str]:
+        row = self.conn.execute("SELECT value FROM meta WHERE key=?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def set_meta(self, key: str, value: str):
+        self.conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, value))
+
+    def live_chunks(self) -> Dict[Tuple[str, str], int]:
+        rows = self.conn.execute("SELECT source, hash, id FROM chunks WHERE tombstoned=0").fetchall()
+        return {(r[0], r[1]): r[2] for r in rows}
+
+    def next_id(self, floor: int = 0) -> int:
+        row = self.conn.execute("SELECT MAX(id) FROM chunks").fetchone()
+        return max(floor, (row[0] + 1) if row[0] is not None else 0)
+
+    def add(self, rows: List[Tuple[int, str, str]]):
+        self.conn.executemany("INSERT OR REPLACE INTO chunks (id, source, hash, tombstoned) VALUES (?, ?, ?, 0)", rows)
+
+    def tombstone(self, ids: List[int]):
+        self.conn.executemany("UPDATE chunks SET tombstoned=1 WHERE id=?", [(i,) for i in ids])
+
+    def commit(self):
+        self.conn.commit()
+
+
+# -----------------------------
+# Rate-aware batched embedding
+# -----------------------------
+def embed_in_batches(texts: List[str], embedder, batch_size: int = 64, concurrency: int = 4,
+                     requests_per_minute: float = 0, retries: int = 3) -> np.ndarray:
+    limiter = RateLimiter(requests_per_minute)
+    batches = [texts[i:i + batch_size] for i in range(0, len(texts), batch_size)]
+
+    def run(batch):
+        for attempt in range(retries + 1):
+            limiter.wait()
+            try:
+                return embedder.embed_documents(batch)
+            except Exception as e:
+                if attempt == retries:
+                    raise
+                delay = 2 ** attempt
+                print(f"⚠️ Embedding batch failed ({e}); retrying in {delay}s")
+                time.sleep(delay)
+
+    with ThreadPoolExecutor(max_workers=max(1, concurrency)) as pool:
+        results = list(pool.map(run, batches))
+    return np.asarray([v for batch in results for v in batch], dtype=np.float32)
+
+
+# -----------------------------
+# Index I/O
+# -----------------------------
+def load_store(index_dir: Path):
+    index_path, pkl_path = index_dir / "index.faiss", index_dir / "index.pkl"
+    if not index_path.exists():
+        return None, InMemoryDocstore({}), {}
+
+    index = faiss.read_index(str(index_path))
+    with open(pkl_path, "rb") as f:
+        docstore, index_to_docstore_id = pickle.load(f)
+
+    if not isinstance(index, (faiss.IndexIDMap, faiss.IndexIDMap2)) and not hasattr(index, "nlist"):
+        # Index written by langchain without ids: keep positions as ids so the mapping stays valid
+        vectors = index.reconstruct_n(0, index.ntotal)
+        legacy = create_index("flat", index.d, index.ntotal)
+        legacy.add_with_ids(vectors, np.arange(index.ntotal, dtype=np.int64))
+        index = legacy
+    return index, docstore, index_to_docstore_id
+
+
+def save_store(index_dir: Path, index: faiss.Index, docstore, index_to_docstore_id: Dict[int, str]):
+    """Write both files via temp files + rename so readers never see a half-written index."""
+    index_dir.mkdir(parents=True, exist_ok=True)
+    tmp_index, tmp_pkl = index_dir / "index.faiss.tmp", index_dir / "index.pkl.tmp"
+    faiss.write_index(index, str(tmp_index))
+    with open(tmp_pkl, "wb") as f:
+        pickle.dump((docstore, index_to_docstore_id), f)
+    os.replace(tmp_pkl, index_dir / "index.pkl")
+    os.replace(tmp_index, index_dir / "index.faiss")
+
+
+# -----------------------------
+# Incremental build
+# -----------------------------
+def build_index(docs_dir: Path, index_dir: Path = DEFAULT_INDEX_DIR, embedder_name: str = "google",
+                chunk_size: int = 1000, chunk_overlap: int = 150, batch_size: int = 64,
+                concurrency: int = 4, requests_per_minute: float = 0, rebuild: bool = False,
+                embedder=None, index_type: str = "flat", **index_kwargs) -> Dict[str, int]:
+    """
+    Incrementally sync index_dir with docs_dir. index_type is one of
+    vectorstores.ann.INDEX_TYPES; switching type re-indexes the stored vectors
+    (no re-embedding). index_kwargs go to ann.create_index (nlist, pq_m, hnsw_m, ...).
+    """
+    index_dir.mkdir(parents=True, exist_ok=True)
+    if rebuild:
+        for name in ("index.faiss", "index.pkl", "bm25.pkl", "manifest.db"):
+            (index_dir / name).unlink(missing_ok=True)
+
+    manifest = Manifest(index_dir / "manifest.db")
+    model_id = EMBEDDING_MODEL_IDS.get(embedder_name, embedder_name)
+    recorded = manifest.get_meta("embedding_model")
+    if recorded and recorded != model_id:
+        raise ValueError(f"Index was built with '{recorded}', not '{model_id}'; pass --rebuild to re-embed")
+    embedder = embedder or get_embedding_backend(embedder_name)
+
+    index, docstore, index_to_docstore_id = load_store(index_dir)
+    converted = False
+    if index is not None and index_kind(index) != index_type:
+        print(f"Converting index from {index_kind(index)} to {index_type}")
+        index = convert_index(index, index_type, **index_kwargs)
+        converted = True
+    sources = chunk_sources(docs_dir, chunk_size, chunk_overlap)
+    live = manifest.live_chunks()
+
+    # Tombstone chunks whose source was deleted or whose content changed
+    wanted = {(src, h) for src, chunks in sources.items() for h, _ in chunks}
+    stale_ids = [i for key, i in live.items() if key not in wanted]
+    if stale_ids and index is not None:
+        index = remove_ids(index, np.asarray(stale_ids, dtype=np.int64))
+        for i in stale_ids:
+            doc_id = index_to_docstore_id.pop(i, None)
+            if doc_id is not None:
+                docstore.delete([doc_id])
+    manifest.tombstone(stale_ids)
+
+    # Embed only chunks whose hash is not already in the index
+    new_chunks = [(src, h, text) for src, chunks in sources.items() for h, text in chunks if (src, h) not in live]
+    live_by_hash = {h: i for (src, h), i in live.items() if (src, h) in wanted}
+    reused, to_embed = [], []
+    for chunk in new_chunks:
+        (reused if chunk[1] in live_by_hash else to_embed).append(chunk)
+
+    # Each distinct text is embedded once, even if several new sources contain it
+    unique = {h: text for _, h, text in to_embed}
+    embedded = embed_in_batches(list(unique.values()), embedder, batch_size, concurrency,
+                                requests_per_minute) if unique else None
+    row_of = {h: i for i, h in enumerate(unique)}
+    rows = [embedded[row_of[h]] for _, h, _ in to_embed]
+    # Same text already indexed under another source: copy its stored vector
+    rows += [index.reconstruct(live_by_hash[h]) for _, h, _ in reused]
+    ordered = to_embed + reused
+    vectors = np.asarray(rows, dtype=np.float32)
+
+    if ordered:
+        if index is None:
+            # First build: train IVF variants on (a sample of) the initial vectors
+            index = create_index(index_type, vectors.shape[1], len(vectors), **index_kwargs)
+            train_index(index, vectors)
+        start = manifest.next_id(floor=max(index_to_docstore_id, default=-1) + 1)
+        ids = np.arange(start, start + len(ordered), dtype=np.int64)
+        index.add_with_ids(vectors, ids)
+
+        docs = {}
+        for vid, (src, h, text) in zip(ids.tolist(), ordered):
+            doc_id = f"{h[:16]}-{vid}"
+            docs[doc_id] = Document(page_content=text, metadata={"source": src, "chunk_hash": h}, id=doc_id)
+            index_to_docstore_id[vid] = doc_id
+        docstore.add(docs)
+        manifest.add([(vid, src, h) for vid, (src, h, _) in zip(ids.tolist(), ordered)])
+
+    manifest.set_meta("embedding_model", model_id)
+    if index is not None and (ordered or stale_ids or converted or not (index_dir / "bm25.pkl").exists()):
+        # Lexical index is rebuilt from the docstore; cheap next to embedding
+        bm25 = BM25Index.from_documents((i, docstore.search(i).page_content) for i in index_to_docstore_id.values())
+        bm25.save(index_dir / "bm25.pkl")
+        save_store(index_dir, index, docstore, index_to_docstore_id)
+    manifest.commit()
+
+    return {"sources": len(sources), "embedded": len(unique), "reused": len(ordered) - len(unique),
+            "tombstoned": len(stale_ids), "total": index.ntotal if index is not None else 0}
+
+
+# -----------------------------
+# CLI
+# -----------------------------
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Build or incrementally update the finance FAISS index.")
+    parser.add_argument("--docs", required=True, type=Path, help="Directory of .pdf/.txt/.md documents")
+    parser.add_argument("--index-dir", type=Path, default=DEFAULT_INDEX_DIR)
+    parser.add_argument("--embedder", default="google", help="google | huggingface | hashing (offline)")
+    parser.add_argument("--chunk-size", type=int, default=1000)
+    parser.add_argument("--chunk-overlap", type=int, default=150)
+    parser.add_argument("--batch-size", type=int, default=64)
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--rpm", type=float, default=0, help="Max embedding requests per minute (0 = unlimited)")
+    parser.add_argument("--rebuild", action="store_true", help="Discard the existing index and re-embed everything")
+    parser.add_argument("--index-type", default="flat", choices=INDEX_TYPES)
+    parser.add_argument("--nlist", type=int, help="IVF cells (default ~4*sqrt(N))")
+    parser.add_argument("--pq-m", type=int, help="IVF-PQ sub-quantizers (must divide the dimension)")
+    parser.add_argument("--hnsw-m", type=int, default=32, help="HNSW neighbours per node")
+    args = parser.parse_args(argv)
+
+    index_kwargs = {k: v for k, v in {"nlist": args.nlist, "pq_m": args.pq_m, "hnsw_m": args.hnsw_m}.items() if v}
+    stats = build_index(args.docs, args.index_dir, args.embedder, args.chunk_size, args.chunk_overlap,
+                        args.batch_size, args.concurrency, args.rpm, args.rebuild,
+                        index_type=args.index_type, **index_kwargs)
+    print(stats)
+
+
+if __name__ == "__main__":
+    main()
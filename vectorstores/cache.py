@@ -0,0 +1,179 @@
+# cache.py
+# Two-level cache for the Knowledge (RAG) path:
+#   1. query text -> embedding vector (float32 blobs in a sidecar SQLite file)
+#   2. normalized question + top-k doc ids -> final answer (in-memory LRU with TTL),
+#      with an optional semantic mode that reuses the answer of a cached query
+#      whose embedding is within a cosine threshold of the new one.
+
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+from db.connection import ensure_schema, get_connection, transaction
+
+RAG_CACHE_DB = os.getenv("RAG_CACHE_DB", str(Path(__file__).resolve().parent / "rag_cache.db"))
+EMBEDDING_MEMORY_ITEMS = 2048
+
+ANSWER_CACHE_TTL = float(os.getenv("RAG_ANSWER_CACHE_TTL", str(24 * 3600)))  # seconds
+ANSWER_CACHE_SIZE = int(os.getenv("RAG_ANSWER_CACHE_SIZE", "1000"))
+SEMANTIC_CACHE = os.getenv("RAG_SEMANTIC_CACHE", "0") == "1"
+SEMANTIC_THRESHOLD = float(os.getenv("RAG_SEMANTIC_THRESHOLD", "0.95"))
+
+
+def normalize_query(text: str) -> str:
+    text = text.lower()
+    text = re.sub(r"[^\w\s]", " ", text)
+    return " ".join(text.split())
+
+
+# -----------------------------
+# Level 1: query embeddings
+# -----------------------------
+class EmbeddingCache:
+    """query -> float32 vector, with an in-memory LRU in front of a SQLite store."""
+
+    def __init__(self, db_path: str = RAG_CACHE_DB, memory_items: int = EMBEDDING_MEMORY_ITEMS):
+        self.db_path = db_path
+        self.memory_items = memory_items
+        self._memory: "OrderedDict[str, np.ndarray]" = OrderedDict()
+        self._lock = threading.Lock()
+        ensure_schema(self.db_path, "query_embeddings", self._create_table)
+
+    @staticmethod
+    def _create_table(conn: sqlite3.Connection):
+        conn.execute("""CREATE TABLE IF NOT EXISTS query_embeddings (
+                            key TEXT PRIMARY KEY,
+                            model TEXT,
+                            dim INTEGER,
+                            vector BLOB
+                        )""")
+
+    @staticmethod
+    def _key(model: str, text: str) -> str:
+        return hashlib.sha256(f"{model}\x00{normalize_query(text)}".encode("utf-8")).hexdigest()
+
+    def _remember(self, key: str, vec: np.ndarray):
+        with self._lock:
+            self._memory[key] = vec
+            self._memory.move_to_end(key)
+            if len(self._memory) > self.memory_items:
+                self._memory.popitem(last=False)
+
+    def get(self, model: str, text: str) -> Optional[np.ndarray]:
+        key = self._key(model, text)
+        with self._lock:
+            vec = self._memory.get(key)
+            if vec is not None:
+                self._memory.move_to_end(key)
+                return vec
+
+        row = get_connection(self.db_path).execute("SELECT dim, vector FROM query_embeddings WHERE key=?", (key,)).fetchone()
+        if row is None:
+            return None
+        vec = np.frombuffer(row[1], dtype=np.float32, count=row[0])
+        self._remember(key, vec)
+        return vec
+
+    def put(self, model: str, text: str, vector: Sequence[float]):
+        key = self._key(model, text)
+        vec = np.asarray(vector, dtype=np.float32)
+        self._remember(key, vec)
+        with transaction(self.db_path) as conn:
+            conn.execute("INSERT OR REPLACE INTO query_embeddings (key, model, dim, vector) VALUES (?, ?, ?, ?)",
+                         (key, model, vec.shape[0], vec.tobytes()))
+
+
+class CachedQueryEmbeddings(Embeddings):
+    """Wraps an Embeddings client so repeated query texts skip the remote call."""
+
+    def __init__(self, base: Embeddings, cache: EmbeddingCache, model: str):
+        self.base = base
+        self.cache = cache
+        self.model = model
+
+    def embed_query(self, text: str) -> List[float]:
+        vec = self.cache.get(self.model, text)
+        if vec is None:
+            vec = self.base.embed_query(text)
+            self.cache.put(self.model, text, vec)
+        return [float(x) for x in vec]
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self.base.embed_documents(texts)
+
+
+# -----------------------------
+# Level 2: answers
+# -----------------------------
+class AnswerCache:
+    """
+    In-memory LRU of final answers keyed by normalized question + top-k doc ids.
+    Entries expire after `ttl` seconds. In semantic mode, a lookup by query
+    embedding returns the freshest answer whose cosine similarity >= threshold.
+    """
+
+    def __init__(self, ttl: float = ANSWER_CACHE_TTL, max_items: int = ANSWER_CACHE_SIZE,
+                 semantic: bool = SEMANTIC_CACHE, threshold: float = SEMANTIC_THRESHOLD):
+        self.ttl = ttl
+        self.max_items = max_items
+        self.semantic = semantic
+        self.threshold = threshold
+        self._items: "OrderedDict[str, Dict]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(question: str, doc_ids: Sequence[str]) -> str:
+        return normalize_query(question) + "\x00" + ",".join(sorted(str(d) for d in doc_ids))
+
+    def _expired(self, entry: Dict) -> bool:
+        return time.time() - entry["created"] > self.ttl
+
+    def get(self, question: str, doc_ids: Sequence[str]) -> Optional[Dict]:
+        k = self.key(question, doc_ids)
+        with self._lock:
+            entry = self._items.get(k)
+            if entry is None:
+                return None
+            if self._expired(entry):
+                del self._items[k]
+                return None
+            self._items.move_to_end(k)
+            return entry["value"]
+
+    def get_semantic(self, query_vector: Sequence[float]) -> Optional[Dict]:
+        if not self.semantic:
+            return None
+        q = np.asarray(query_vector, dtype=np.float32)
+        q = q / (np.linalg.norm(q) or 1.0)
+        with self._lock:
+            live = [(k, e) for k, e in self._items.items() if e.get("vector") is not None and not self._expired(e)]
+            if not live:
+                return None
+            matrix = np.stack([e["vector"] for _, e in live])
+            sims = matrix @ q
+            best = int(np.argmax(sims))
+            if sims[best] < self.threshold:
+                return None
+            self._items.move_to_end(live[best][0])
+            return live[best][1]["value"]
+
+    def put(self, question: str, doc_ids: Sequence[str], value: Dict, query_vector: Optional[Sequence[float]] = None):
+        vec = None
+        if query_vector is not None:
+            vec = np.asarray(query_vector, dtype=np.float32)
+            vec = vec / (np.linalg.norm(vec) or 1.0)
+        k = self.key(question, doc_ids)
+        with self._lock:
+            self._items[k] = {"value": value, "vector": vec, "created": time.time()}
+            self._items.move_to_end(k)
+            while len(self._items) > self.max_items:
+                self._items.popitem(last=False)
@@ -0,0 +1,75 @@
+# embeddings.py
+# Pluggable embedding backends for building / querying the RAG store.
+# "hashing" is fully local (no network, no model download) for offline builds and tests.
+
+import hashlib
+import os
+import re
+from typing import Callable, Dict, List
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+_TOKEN = re.compile(r"[a-z0-9]+(?:[.&-][a-z0-9]+)*")
+
+
+class HashingEmbeddings(Embeddings):
+    """
+    Deterministic bag-of-words embeddings: unigrams and bigrams are hashed
+    (signed) into `size` buckets and the vector is L2-normalized.
+    """
+
+    def __init__(self, size: int = 384):
+        self.size = size
+
+    def _bucket(self, token: str):
+        digest = hashlib.blake2b(token.encode("utf-8"), digest_size=8).digest()
+        value = int.from_bytes(digest, "little")
+        return value % self.size, 1.0 if (value >> 63) & 1 else -1.0
+
+    def _embed(self, text: str) -> List[float]:
+        tokens = _TOKEN.findall(text.lower())
+        vec = np.zeros(self.size, dtype=np.float32)
+        for gram in tokens + [f"{a} {b}" for a, b in zip(tokens, tokens[1:])]:
+            idx, sign = self._bucket(gram)
+            vec[idx] += sign
+        norm = np.linalg.norm(vec)
+        if norm > 0:
+            vec /= norm
+        return vec.tolist()
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return [self._embed(t) for t in texts]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self._embed(text)
+
+
+def _google() -> Embeddings:
+    from langchain_google_genai import GoogleGenerativeAIEmbeddings
+    return GoogleGenerativeAIEmbeddings(model="models/embedding-001", google_api_key=os.getenv("GOOGLE_API_KEY"))
+
+
+def _huggingface() -> Embeddings:
+    from langchain_huggingface import HuggingFaceEmbeddings
+    return HuggingFaceEmbeddings(model_name=os.getenv("HF_EMBED_MODEL", "sentence-transformers/all-MiniLM-L6-v2"))
+
+
+EMBEDDING_BACKENDS: Dict[str, Callable[[], Embeddings]] = {
+    "google": _google,
+    "huggingface": _huggingface,
+    "hashing": HashingEmbeddings,
+}
+
+# Stable identifiers recorded in the index manifest (a model switch needs a rebuild)
+EMBEDDING_MODEL_IDS = {
+    "google": "models/embedding-001",
+    "huggingface": os.getenv("HF_EMBED_MODEL", "sentence-transformers/all-MiniLM-L6-v2"),
+    "hashing": "hashing-384",
+}
+
+
+def get_embedding_backend(name: str) -> Embeddings:
+    if name not in EMBEDDING_BACKENDS:
+        raise ValueError(f"Unknown embedding backend '{name}'. Choose from {list(EMBEDDING_BACKENDS)}")
+    return EMBEDDING_BACKENDS[name]()
@@ -1,35 +1,82 @@
+import hashlib
+import json
 import os
+import pickle
+import re
+import threading
+import time
 from pathlib import Path
 import asyncio
+import numpy as np
 import glob
 from langchain_community.vectorstores import FAISS
 from langchain_google_genai import GoogleGenerativeAIEmbeddings
 from langchain.prompts import PromptTemplate
 from langchain_groq import ChatGroq
 from dotenv import load_dotenv
-from core.llm import get_llm
+from core.llm import DEFAULT_TIMEOUT, get_llm, stream_text
+from core.singleflight import get_group
+from vectorstores.cache import AnswerCache, CachedQueryEmbeddings, EmbeddingCache
+from vectorstores.embeddings import EMBEDDING_MODEL_IDS, get_embedding_backend
+from vectorstores.ann import set_search_params
+from vectorstores.bm25 import BM25Index, CrossEncoderReranker, TermCoverageReranker, compress_chunk, reciprocal_rank_fusion
 
 load_dotenv()
 
+_embeddings = None
+_embeddings_lock = threading.Lock()
+
+
 def get_embeddings():
+    """
+    Process-wide embeddings client (built once, shared by all queries).
+    Query embeddings are cached on disk, so repeated questions skip the remote call.
+    """
+    global _embeddings
     # Ensure a running event loop exists
     try:
         asyncio.get_running_loop()
     except RuntimeError:
         asyncio.set_event_loop(asyncio.new_event_loop())
 
-    return GoogleGenerativeAIEmbeddings(
-        model="models/embedding-001",  # or use EMBED_MODEL
-        google_api_key=GEMINI_API_KEY,
-        request_options={"api_endpoint": "generativelanguage.googleapis.com"}
-    )
+    if _embeddings is None:
+        with _embeddings_lock:
+            if _embeddings is None:
+                if RAG_EMBEDDER == "google":
+                    base = GoogleGenerativeAIEmbeddings(
+                        model="models/embedding-001",  # or use EMBED_MODEL
+                        google_api_key=GEMINI_API_KEY,
+                        request_options={"api_endpoint": "generativelanguage.googleapis.com"}
+                    )
+                else:
+                    base = get_embedding_backend(RAG_EMBEDDER)
+                _embeddings = CachedQueryEmbeddings(base, EmbeddingCache(),
+                                                    model=EMBEDDING_MODEL_IDS.get(RAG_EMBEDDER, RAG_EMBEDDER))
+    return _embeddings
 
 
-INDEX_DIR = Path("finance_faiss")
+INDEX_DIR = Path(__file__).resolve().parent / "finance_faiss"
 
 GEMINI_API_KEY = os.getenv("GOOGLE_API_KEY")  
+# Must match the backend the index was built with (see vectorstores/build_index.py)
+RAG_EMBEDDER = os.getenv("RAG_EMBEDDER", "google")
 EMBED_MODEL = "models/text-embedding-004"
 
+# Memory-map the index file instead of reading it into RAM (FAISS_MMAP=1)
+FAISS_MMAP = os.getenv("FAISS_MMAP", "0") == "1"
+# Query-time recall/latency knobs for IVF (nprobe) and HNSW (efSearch) indexes
+FAISS_NPROBE = int(os.getenv("FAISS_NPROBE", "16"))
+FAISS_EF_SEARCH = int(os.getenv("FAISS_EF_SEARCH", "64"))
+# Hybrid retrieval: dense + BM25 candidates fused with RRF, then reranked
+HYBRID_CANDIDATES = int(os.getenv("RAG_HYBRID_CANDIDATES", "20"))
+RAG_RERANKER = os.getenv("RAG_RERANKER", "coverage")  # none | coverage | cross-encoder
+RAG_TOP_K = int(os.getenv("RAG_TOP_K", "3"))
+RAG_CHUNK_CHARS = int(os.getenv("RAG_CHUNK_CHARS", "700"))
+# Seconds between checks of the index files' mtime
+RELOAD_CHECK_INTERVAL = float(os.getenv("FAISS_RELOAD_CHECK_INTERVAL", "30"))
+# How long a streaming request waits for an identical in-flight answer before streaming its own
+FOLLOWER_WAIT_SECONDS = float(os.getenv("RAG_FOLLOWER_WAIT_SECONDS", str(DEFAULT_TIMEOUT)))
+
 SYSTEM_PROMPT = """You are a helpful financial mentor for young investors.
             - Always provide a clear answer  == "_even if the context is incomplete or noisy.
             - If context text looks broken, use your own financial knowledge to answer.
@@ -47,55 +94,285 @@ USER_PROMPT_TMPL = PromptTemplate.from_template(
             Answer:""")
 
 
+# -----------------------------
+# Resident vector store
+# -----------------------------
+class RetrieverService:
+    """
+    Loads the FAISS store (and its BM25 index) once per process and keeps it resident.
+    Searches are read-only, so one instance is shared by all Streamlit
+    sessions. When the index files' mtime changes, a background thread loads
+    the new version and swaps it in; queries keep using the old one meanwhile.
+    """
+
+    def __init__(self, index_dir: Path = INDEX_DIR, index_name: str = "index",
+                 mmap: bool = FAISS_MMAP, check_interval: float = RELOAD_CHECK_INTERVAL):
+        self.index_dir = Path(index_dir)
+        self.index_name = index_name
+        self.mmap = mmap
+        self.check_interval = check_interval
+        self._vs = None
+        self._bm25 = None
+        self._reranker = None
+        self._mtime = None
+        self._last_check = 0.0
+        self._lock = threading.Lock()
+        self._reloading = False
+
+    def _files(self):
+        return [self.index_dir / f"{self.index_name}.faiss", self.index_dir / f"{self.index_name}.pkl"]
+
+    def _bm25_file(self):
+        return self.index_dir / "bm25.pkl"
+
+    def _current_mtime(self):
+        files = self._files() + ([self._bm25_file()] if self._bm25_file().exists() else [])
+        return max(f.stat().st_mtime for f in files)
+
+    def _load(self):
+        import faiss
+
+        mtime = self._current_mtime()
+        index_path = str(self._files()[0])
+        if self.mmap:
+            try:
+                index = faiss.read_index(index_path, faiss.IO_FLAG_MMAP)
+            except RuntimeError:
+                index = faiss.read_index(index_path)  # index type without mmap support
+        else:
+            index = faiss.read_index(index_path)
+
+        set_search_params(index, nprobe=FAISS_NPROBE, ef_search=FAISS_EF_SEARCH)
+
+        with open(self._files()[1], "rb") as f:
+            docstore, index_to_docstore_id = pickle.load(f)
+
+        vs = FAISS(get_embeddings(), index, docstore, index_to_docstore_id)
+
+        if self._bm25_file().exists():
+            bm25 = BM25Index.load(self._bm25_file())
+        else:
+            # Store built without bm25.pkl (e.g. by langchain): index the docstore in memory
+            ids = list(index_to_docstore_id.values())
+            bm25 = BM25Index.from_documents((i, docstore.search(i).page_content) for i in ids)
+        print(f"✅ FAISS index loaded from {self.index_dir} ({index.ntotal} vectors)")
+        return vs, bm25, mtime
+
+    def _reload_in_background(self):
+        try:
+            vs, bm25, mtime = self._load()
+            with self._lock:
+                self._vs, self._bm25, self._mtime = vs, bm25, mtime
+        except Exception as e:
+            print(f"⚠️ FAISS reload failed, keeping previous index: {e}")
+        finally:
+            self._reloading = False
+
+    def _maybe_reload(self):
+        now = time.monotonic()
+        if self._reloading or now - self._last_check < self.check_interval:
+            return
+        self._last_check = now
+        try:
+            changed = self._current_mtime() != self._mtime
+        except OSError:
+            return
+        if changed:
+            self._reloading = True
+            threading.Thread(target=self._reload_in_background, name="faiss-reload", daemon=True).start()
+
+    def get_store(self) -> FAISS:
+        if self._vs is None:
+            with self._lock:
+                if self._vs is None:
+                    self._vs, self._bm25, self._mtime = self._load()
+                    self._last_check = time.monotonic()
+        else:
+            self._maybe_reload()
+        return self._vs
+
+    def search(self, question: str, k: int = 4):
+        return self.get_store().similarity_search(question, k=k)
+
+    def search_by_vector(self, vector, k: int = 4):
+        return self.get_store().similarity_search_by_vector(vector, k=k)
+
+    def _get_reranker(self):
+        if self._reranker is None and RAG_RERANKER == "cross-encoder":
+            self._reranker = CrossEncoderReranker()
+        if RAG_RERANKER == "coverage" and self._bm25 is not None:
+            return TermCoverageReranker(self._bm25)
+        return self._reranker
+
+    def hybrid_search(self, question: str, vector, k: int = RAG_TOP_K, candidates: int = HYBRID_CANDIDATES):
+        """
+        Dense and BM25 candidates fused by reciprocal rank, optionally reranked.
+        Returns [(docstore_id, Document)] best first.
+        """
+        store = self.get_store()
+        bm25 = self._bm25
+
+        _, labels = store.index.search(np.asarray([vector], dtype=np.float32), candidates)
+        dense_ids = [store.index_to_docstore_id[int(i)] for i in labels[0] if i != -1]
+        lexical_ids = [doc_id for doc_id, _ in bm25.search(question, candidates)] if bm25 else []
+
+        fused = reciprocal_rank_fusion([dense_ids, lexical_ids])[:candidates]
+        docs = {doc_id: store.docstore.search(doc_id) for doc_id, _ in fused}
+        ranked = [(doc_id, docs[doc_id].page_content, score) for doc_id, score in fused
+                  if hasattr(docs[doc_id], "page_content")]
+
+        reranker = self._get_reranker()
+        if reranker is not None:
+            ranked = reranker.rerank(question, ranked)
+        return [(doc_id, docs[doc_id]) for doc_id, _, _ in ranked[:k]]
+
+
+_service = None
+_service_lock = threading.Lock()
+
+
+def get_retriever_service() -> RetrieverService:
+    global _service
+    if _service is None:
+        with _service_lock:
+            if _service is None:
+                _service = RetrieverService()
+    return _service
+
+
 
 def clean_text(text: str) -> str:
     text = text.replace("\n", " ")
     text = " ".join(text.split())
     return text
 
-def rag_query(question: str, k: int = 4):
-    # Load FAISS
-    embeddings = get_embeddings()
-    print("embeddings completed")
-    INDEX_DIR = Path(__file__).resolve().parent / "finance_faiss"
+_answer_cache = AnswerCache()
 
-    print("🔍 Looking in:", INDEX_DIR)
-    print("index.faiss exists?", (INDEX_DIR / "index.faiss").exists())
-    print("index.pkl exists?", (INDEX_DIR / "index.pkl").exists())
+# Questions that lean on earlier turns ("explain that more") are not answer-cached
+_FOLLOW_UP = re.compile(r"\b(it|its|that|this|those|these|they|them|above|more|again|previous)\b", re.IGNORECASE)
 
-    vs = FAISS.load_local(
-        folder_path=str(INDEX_DIR),
-        embeddings=embeddings,
-        index_name="index",
-        allow_dangerous_deserialization=True
-    )
 
-    print("✅ FAISS index loaded!")
-    retriever = vs.as_retriever(search_kwargs={"k": k})
-    docs = retriever.invoke(question)
+def _prepare_rag_query(question: str, k: int, history: str):
+    """
+    Retrieval half of a RAG query. Returns (cached_result, None) on an answer-cache
+    hit, otherwise (None, request) with what the LLM call and cache write need.
+    """
+    query_vector = get_embeddings().embed_query(question)
+    cacheable = not _FOLLOW_UP.search(question)
+
+    if cacheable:
+        hit = _answer_cache.get_semantic(query_vector)
+        if hit:
+            return hit, None
+
+    hits = get_retriever_service().hybrid_search(question, query_vector, k=k)
+    doc_ids = [doc_id for doc_id, _ in hits]
+    docs = [d for _, d in hits]
+    if cacheable:
+        hit = _answer_cache.get(question, doc_ids)
+        if hit:
+            return hit, None
 
     # Format context
     context = "\n\n".join([
-        f"[Source: {d.metadata.get('source', 'PDF')}] {clean_text(d.page_content)}"
+        f"[Source: {d.metadata.get('source', 'PDF')}] {compress_chunk(clean_text(d.page_content), question, RAG_CHUNK_CHARS)}"
         for d in docs
     ])
 
     # Build prompt
-    prompt = USER_PROMPT_TMPL.format(question=question, context=context)
-    llm = get_llm()
+    prompt_question = f"Conversation so far:\n{history}\n\nNow the user asks: {question}" if history else question
+    prompt = USER_PROMPT_TMPL.format(question=prompt_question, context=context)
+    messages = [
+        {"role": "system", "content": SYSTEM_PROMPT},
+        {"role": "user", "content": prompt}
+    ]
+    # Identical prompts from concurrent sessions share one LLM call (see core.singleflight)
+    flight_key = hashlib.sha256(json.dumps(messages, sort_keys=True).encode("utf-8")).hexdigest()
+    return None, {"messages": messages, "context": context, "cacheable": cacheable,
+                  "doc_ids": doc_ids, "query_vector": query_vector, "flight_key": flight_key}
+
+
+def _store_answer(question: str, request, answer_text: str):
+    result = {"answer": answer_text, "context_used": request["context"][:1000]}
+    if request["cacheable"]:
+        _answer_cache.put(question, request["doc_ids"], result, query_vector=request["query_vector"])
+    return result
+
+
+def _generate_answer(messages) -> str:
+    resp = get_llm(site="rag").invoke(messages)
+    answer_text = resp.content if hasattr(resp, "content") else str(resp)
+    if not answer_text.strip():
+        raise ValueError("Empty Groq response")
+    return answer_text
+
+
+def rag_query(question: str, k: int = RAG_TOP_K, history: str = ""):
+    """
+    Answer a knowledge question from the FAISS store (hybrid dense + BM25 retrieval).
+    Retrieval uses only `question`; `history` (prior turns) is added to the prompt.
+    Self-contained questions are served from the answer cache when possible.
+    """
+    cached, request = _prepare_rag_query(question, k, history)
+    if cached:
+        return cached
 
     try:
-        resp = llm.invoke([
-            {"role": "system", "content": SYSTEM_PROMPT},
-            {"role": "user", "content": prompt}
-        ])
-        answer_text = resp.content if hasattr(resp, "content") else str(resp)
+        answer_text = get_group("rag").do(request["flight_key"], _generate_answer, request["messages"])
+    except Exception as e:
+        print(f"⚠️ Groq failed, fallback triggered: {e}")
+        return {"answer": f"⚠️ Groq failed, fallback triggered: {e}", "context_used": request["context"][:1000]}
+
+    return _store_answer(question, request, answer_text)
+
+
+def rag_query_stream(question: str, k: int = RAG_TOP_K, history: str = ""):
+    """
+    Streaming rag_query: yields the answer's text chunks as the LLM produces them
+    (a cached answer is yielded whole). The full answer is cached once the stream ends.
+    If the same prompt is already being answered for another session, this waits
+    (up to FOLLOWER_WAIT_SECONDS) for that answer and yields it whole instead of
+    starting a second LLM call; if it doesn't arrive in time, it streams its own.
+    """
+    cached, request = _prepare_rag_query(question, k, history)
+    if cached:
+        yield cached["answer"]
+        return
+
+    flight, leader = get_group("rag").join(request["flight_key"])
+    if not leader:
+        try:
+            yield flight.wait(timeout=FOLLOWER_WAIT_SECONDS)
+            return
+        except TimeoutError:
+            # The leader's stream stalled or its reader never finished it; don't block on it
+            print(f"⚠️ Shared answer not ready after {FOLLOWER_WAIT_SECONDS:g}s, streaming a separate one")
+            flight = None
+        except Exception as e:
+            print(f"⚠️ Groq failed, fallback triggered: {e}")
+            yield f"⚠️ Groq failed, fallback triggered: {e}"
+            return
+
+    parts = []
+    try:
+        for chunk in stream_text(request["messages"], site="rag"):
+            parts.append(chunk)
+            yield chunk
+        answer_text = "".join(parts)
         if not answer_text.strip():
             raise ValueError("Empty Groq response")
     except Exception as e:
+        if flight:
+            flight.fail(e)
         print(f"⚠️ Groq failed, fallback triggered: {e}")
-        answer_text = (
-            f"⚠️ Groq failed, fallback triggered: {e}"
-        )
-    
-    return {"answer": answer_text, "context_used": context[:1000]}
\ No newline at end of file
+        yield f"\n\n⚠️ Groq failed, fallback triggered: {e}"
+        return
+    except BaseException:
+        # The reader stopped mid-stream; release anyone waiting on this answer
+        if flight:
+            flight.fail(RuntimeError("Answer stream was abandoned"))
+        raise
+
+    if flight:
+        flight.finish(answer_text)
+    _store_answer(question, request, answer_text)